@@ -0,0 +1,130 @@
+from PIL import Image, ImageDraw, ImageFilter
+import hashlib
+import json
+import os
+import random
+
+# Every image is built from this seed, so the same Pillow version always writes the same bytes
+corpus_seed = 20250101
+
+# name: (kind, count, size, file extension) for each set of the corpus
+corpus_sets = {
+    "photos": ("photo", 8, (2000, 1500), "jpg"),
+    "graphics": ("graphic", 8, (1200, 900), "png"),
+    "alpha": ("alpha", 8, (800, 800), "png"),
+    "large": ("photo", 1, (6000, 4000), "tiff"),
+    "small": ("photo", 100, (320, 240), "jpg"),
+}
+
+# Smaller corpus for quick runs (same kinds, fewer and smaller images)
+quick_sets = {
+    "photos": ("photo", 3, (1000, 750), "jpg"),
+    "graphics": ("graphic", 3, (600, 450), "png"),
+    "alpha": ("alpha", 3, (400, 400), "png"),
+    "large": ("photo", 1, (2400, 1600), "tiff"),
+    "small": ("photo", 20, (320, 240), "jpg"),
+}
+
+corpus_index = "corpus.json"
+
+# Function to build photo-like content: smooth gradients, soft shapes and sensor-like noise
+def photo_image(rng, size):
+    width, height = size
+    horizontal = Image.linear_gradient("L").resize(size)
+    vertical = Image.linear_gradient("L").rotate(90).resize(size)
+    image = Image.merge("RGB", (horizontal, vertical, Image.new("L", size, rng.randrange(256))))
+
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(width), rng.randrange(height)
+        radius = rng.randrange(width // 20, width // 4)
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=tuple(rng.randrange(256) for _ in range(3)))
+    image = image.filter(ImageFilter.GaussianBlur(max(1, width // 200)))
+
+    # Noise from the seeded generator, not Image.effect_noise, which isn't reproducible
+    noise = Image.frombytes("L", size, rng.randbytes(width * height))
+    return Image.blend(image, Image.merge("RGB", (noise, noise, noise)), 0.12)
+
+# Function to build flat graphics: few colors, hard edges, text-like strokes
+def graphic_image(rng, size):
+    width, height = size
+    palette = [tuple(rng.randrange(256) for _ in range(3)) for _ in range(6)]
+    image = Image.new("RGB", size, palette[0])
+    draw = ImageDraw.Draw(image)
+
+    for _ in range(30):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1, y1 = x0 + rng.randrange(20, width // 3), y0 + rng.randrange(20, height // 3)
+        shape = rng.choice((draw.rectangle, draw.ellipse))
+        shape((x0, y0, x1, y1), fill=rng.choice(palette), outline=rng.choice(palette), width=3)
+    for _ in range(40):
+        x, y = rng.randrange(width), rng.randrange(height)
+        draw.line((x, y, x + rng.randrange(-200, 200), y + rng.randrange(-200, 200)), fill=rng.choice(palette), width=2)
+    return image
+
+# Function to build an RGBA image: graphics over a transparent, partially faded background
+def alpha_image(rng, size):
+    image = graphic_image(rng, size).convert("RGBA")
+    alpha = Image.new("L", size, 0)
+    draw = ImageDraw.Draw(alpha)
+    for _ in range(10):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        radius = rng.randrange(size[0] // 10, size[0] // 3)
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=rng.randrange(64, 256))
+    image.putalpha(alpha)
+    return image
+
+image_builders = {
+    "photo": photo_image,
+    "graphic": graphic_image,
+    "alpha": alpha_image,
+}
+
+# Function to hash the files of a corpus, so results are only compared on the same corpus
+def corpus_digest(corpus_dir, files):
+    digest = hashlib.sha256()
+    for relative_path in sorted(files):
+        digest.update(relative_path.encode())
+        with open(os.path.join(corpus_dir, relative_path), "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+# Function to write the corpus (or reuse it if it is already there), returns its index
+def generate_corpus(corpus_dir, quick=False):
+    """
+    Write every set as corpus_dir/<set>/<set>_<n>.<ext> and an index (corpus.json) with the
+    file list of each set and a digest of their bytes. An existing corpus with the same
+    layout is reused as is.
+    """
+    sets = quick_sets if quick else corpus_sets
+    index_path = os.path.join(corpus_dir, corpus_index)
+
+    try:
+        with open(index_path, encoding="utf-8") as file:
+            index = json.load(file)
+        if index.get("quick") == quick and index.get("seed") == corpus_seed:
+            return index
+    except (OSError, ValueError):
+        pass
+
+    files = {}
+    for set_index, (name, (kind, count, size, extension)) in enumerate(sets.items()):
+        os.makedirs(os.path.join(corpus_dir, name), exist_ok=True)
+        files[name] = []
+        for number in range(count):
+            rng = random.Random(corpus_seed * 1000 + set_index * 100 + number)
+            relative_path = f"{name}/{name}_{number}.{extension}"
+            image = image_builders[kind](rng, size)
+            options = {"quality": 90} if extension == "jpg" else {}
+            image.save(os.path.join(corpus_dir, relative_path), **options)
+            files[name].append(relative_path)
+
+    index = {
+        "seed": corpus_seed,
+        "quick": quick,
+        "files": files,
+        "digest": corpus_digest(corpus_dir, [path for paths in files.values() for path in paths]),
+    }
+    with open(index_path, "w", encoding="utf-8") as file:
+        json.dump(index, file, indent=1)
+    return index
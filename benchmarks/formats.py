@@ -0,0 +1,112 @@
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+from PIL import Image, ImageChops, ImageStat
+from imagetoolkit.formats import lossy_formats, encoder_params, can_save
+from .corpus import generate_corpus
+from .operations import benchmark_inputs
+
+# Compares the lossy output formats with JPEG on the benchmark corpus. Each format is encoded at the
+# lowest quality whose PSNR reaches the PSNR of the JPEG reference, so the bytes are compared at
+# (roughly) the same visual quality. The encode time is the median of --repeat encodes at that quality.
+
+default_corpus_dir = os.path.join(os.path.dirname(__file__), ".corpus")
+compared_sets = ("photos", "graphics", "alpha")
+
+def encode(image, format, quality, effort):
+    buffer = BytesIO()
+    image.save(buffer, format=format, optimize=True, **encoder_params(format, quality, effort))
+    return buffer.getvalue()
+
+# Function to compute the PSNR (dB) of an encode against the source pixels
+def psnr(source, data):
+    with Image.open(BytesIO(data)) as decoded:
+        decoded = decoded.convert("RGB")
+    squares = ImageStat.Stat(ImageChops.difference(source, decoded)).sum2
+    mse = sum(squares) / (source.width * source.height * 3)
+    return 100.0 if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+# Function to find the lowest quality of a format that reaches a PSNR, returns (quality, data)
+def match_quality(image, format, target_psnr, effort):
+    low, high = 1, 100
+    found = (100, encode(image, format, 100, effort))
+    while low <= high:
+        quality = (low + high) // 2
+        data = encode(image, format, quality, effort)
+        if psnr(image, data) >= target_psnr:
+            found, high = (quality, data), quality - 1
+        else:
+            low = quality + 1
+    return found
+
+# Function to time the encode of an image, median of repeat runs in seconds
+def encode_time(image, format, quality, effort, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        encode(image, format, quality, effort)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes and encode time of WebP/AVIF against JPEG at the same PSNR, on the benchmark corpus.")
+    parser.add_argument("--corpus", default=default_corpus_dir, help="Directory of the generated corpus (created on first run and reused).")
+    parser.add_argument("--quick", action="store_true", help="Use a smaller corpus for a fast check.")
+    parser.add_argument("--jpeg-quality", type=int, default=85, help="Quality of the JPEG reference (default: 85).")
+    parser.add_argument("--effort", type=int, help="WebP/AVIF encoder effort 0-6 (default: encoder default).")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed encodes per image and format, the median is kept (default: 3).")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    formats = [format for format in lossy_formats if format != "JPEG" and can_save(format)]
+    skipped = [format for format in lossy_formats if format != "JPEG" and format not in formats]
+
+    corpus_dir = Path(args.corpus)
+    index = generate_corpus(corpus_dir, quick=args.quick)
+    images, _ = benchmark_inputs(corpus_dir, index, compared_sets)
+
+    totals = {format: {"bytes": 0, "seconds": 0.0, "psnr": []} for format in ["JPEG"] + formats}
+    for image_name in images:
+        with Image.open(corpus_dir / image_name) as img:
+            image = img.convert("RGB")  # JPEG has no alpha, every format is compared on the same pixels
+
+        reference = encode(image, "JPEG", args.jpeg_quality, None)
+        target_psnr = psnr(image, reference)
+        totals["JPEG"]["bytes"] += len(reference)
+        totals["JPEG"]["seconds"] += encode_time(image, "JPEG", args.jpeg_quality, None, args.repeat)
+        totals["JPEG"]["psnr"].append(target_psnr)
+
+        for format in formats:
+            quality, data = match_quality(image, format, target_psnr, args.effort)
+            totals[format]["bytes"] += len(data)
+            totals[format]["seconds"] += encode_time(image, format, quality, args.effort, args.repeat)
+            totals[format]["psnr"].append(psnr(image, data))
+
+    jpeg = totals["JPEG"]
+    results = {"images": len(images), "jpeg_quality": args.jpeg_quality, "effort": args.effort, "formats": {}}
+    for format, total in totals.items():
+        results["formats"][format] = {
+            "bytes": total["bytes"],
+            "bytes_saved": round(1 - total["bytes"] / jpeg["bytes"], 4),
+            "encode_seconds": round(total["seconds"], 4),
+            "encode_time_ratio": round(total["seconds"] / jpeg["seconds"], 3),
+            "mean_psnr": round(statistics.mean(total["psnr"]), 2),
+        }
+        entry = results["formats"][format]
+        print(f"{format:5} {entry['bytes'] / 1024:10.1f} KB  saved {entry['bytes_saved']:+7.1%}  encode {entry['encode_seconds']:8.3f} s (x{entry['encode_time_ratio']:.2f})  PSNR {entry['mean_psnr']:.2f} dB")
+    for format in skipped:
+        print(f"{format:5} skipped, this Pillow build can't write it")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=1, sort_keys=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+from PIL import Image
+from pathlib import Path
+from imagetoolkit.compress import compress_image, encode_image, search_quality, search_scale, search_png, encode_to_size
+from imagetoolkit.rescale import resize_image, resize_fixed, rescale_percent, thumbnail_image, pyramid_image
+from imagetoolkit.extension import convert_image
+from imagetoolkit.color import filter_image, apply_filter, apply_filters
+from imagetoolkit.addtext import add_text_to_single_image, draw_text, get_available_fonts
+from imagetoolkit.variables import available_filters
+
+# Each benchmark is (corpus sets, kind, function):
+#   "file"   -> function(input_dir, output_dir, image), the per-image worker the commands run (decode + work + encode)
+#   "memory" -> function(image), the in-memory transform alone, on an already decoded copy
+benchmarks = {}
+
+def font():
+    return get_available_fonts()[0]
+
+# compress.py
+benchmarks["compress.compress_image"] = (("photos", "graphics", "large"), "file",
+    lambda input_dir, output_dir, image: compress_image(input_dir, output_dir, True, True, 256, None, None, None, image))
+benchmarks["compress.compress_image.predicted"] = (("photos", "graphics", "large"), "file",
+    lambda input_dir, output_dir, image: compress_image(input_dir, output_dir, True, True, 256, str(Path(output_dir) / "model"), None, None, image))
+benchmarks["compress.encode_image"] = (("photos",), "memory",
+    lambda image: encode_image(image, "jpeg", 85))
+benchmarks["compress.search_quality"] = (("photos",), "memory",
+    lambda image: search_quality(image, "jpeg", 200 * 1024, 10))
+benchmarks["compress.search_scale"] = (("graphics",), "memory",
+    lambda image: search_scale(image, "png", 100 * 1024, None))
+benchmarks["compress.search_png"] = (("graphics", "alpha"), "memory",
+    lambda image: search_png(image, 8 * 1024, 16))
+benchmarks["compress.encode_to_size"] = (("photos",), "memory",
+    lambda image: encode_to_size(image, "jpeg", 256, True, True))
+benchmarks["compress.encode_image.webp"] = (("photos", "alpha"), "memory",
+    lambda image: encode_image(image, "webp", 80))
+benchmarks["compress.compress_image.webp"] = (("photos", "graphics"), "file",
+    lambda input_dir, output_dir, image: compress_image(input_dir, output_dir, True, True, 256, None, "WEBP", None, image))
+
+# rescale.py
+benchmarks["rescale.resize_image.fixed"] = (("photos", "large"), "file",
+    lambda input_dir, output_dir, image: resize_image(input_dir, output_dir, "fixed", (800, 600), Image.Resampling.LANCZOS, None, image))
+benchmarks["rescale.resize_image.percent"] = (("photos", "small"), "file",
+    lambda input_dir, output_dir, image: resize_image(input_dir, output_dir, "percent", 50, None, None, image))
+benchmarks["rescale.resize_image.strips"] = (("large",), "file",
+    lambda input_dir, output_dir, image: resize_image(input_dir, output_dir, "percent", 25, None, 8 * 1024 ** 2, image))
+benchmarks["rescale.resize_fixed"] = (("photos",), "memory",
+    lambda image: resize_fixed(image, 800, 600, Image.Resampling.BICUBIC))
+benchmarks["rescale.rescale_percent"] = (("photos",), "memory",
+    lambda image: rescale_percent(image, 50))
+benchmarks["rescale.thumbnail_image"] = (("photos", "alpha", "small"), "file",
+    lambda input_dir, output_dir, image: thumbnail_image(input_dir, output_dir, "no", 128, image))
+benchmarks["rescale.pyramid_image"] = (("photos",), "file",
+    lambda input_dir, output_dir, image: pyramid_image(input_dir, output_dir, "yes", [16, 24, 32, 48, 64, 128, 256], image))
+
+# extension.py
+benchmarks["extension.convert_image.jpeg"] = (("graphics", "alpha"), "file",
+    lambda input_dir, output_dir, image: convert_image(input_dir, output_dir, "JPEG", False, "", None, {}, (1, image)))
+benchmarks["extension.convert_image.png"] = (("photos", "small"), "file",
+    lambda input_dir, output_dir, image: convert_image(input_dir, output_dir, "PNG", False, "", None, {}, (1, image)))
+
+# color.py: the worker, every filter on its own, a fused chain and the NumPy engine
+benchmarks["color.filter_image"] = (("photos", "small"), "file",
+    lambda input_dir, output_dir, image: filter_image(input_dir, output_dir, ["SEPIA"], None, "pillow", False, image))
+benchmarks["color.filter_image.numpy"] = (("photos", "small"), "file",
+    lambda input_dir, output_dir, image: filter_image(input_dir, output_dir, ["SEPIA"], None, "numpy", False, image))
+for name in available_filters:
+    benchmarks[f"color.apply_filter.{name}"] = (("photos",), "memory",
+        lambda image, name=name: apply_filter(image, name))
+benchmarks["color.apply_filters.chain"] = (("photos",), "memory",
+    lambda image: apply_filters(image, ["BRIGHTNESS_INC", "CONTRAST_INC", "SHARPEN", "SMOOTH"]))
+benchmarks["color.apply_filters.colour_chain.numpy"] = (("photos", "small"), "memory",
+    lambda image: apply_filters(image, ["SEPIA", "SATURATION_DEC", "POSTERIZE"], "numpy"))
+benchmarks["color.apply_filters.colour_chain"] = (("photos", "small"), "memory",
+    lambda image: apply_filters(image, ["SEPIA", "SATURATION_DEC", "POSTERIZE"]))
+
+# addtext.py
+benchmarks["addtext.add_text_to_single_image"] = (("photos", "small"), "file",
+    lambda input_dir, output_dir, image: add_text_to_single_image(input_dir, output_dir, "Benchmark", "Bottom Right", font(), 5.0, "white", image))
+benchmarks["addtext.draw_text"] = (("photos", "small"), "memory",
+    lambda image: draw_text(image, "Benchmark", "Bottom Right", font(), 5.0, "white"))
+
+# Function to get the images of a benchmark with their total number of pixels
+def benchmark_inputs(corpus_dir, index, sets):
+    images = [path for name in sets for path in index["files"][name]]
+    pixels = 0
+    for image in images:
+        with Image.open(Path(corpus_dir) / image) as img:
+            pixels += img.width * img.height
+    return images, pixels
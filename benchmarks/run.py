@@ -0,0 +1,158 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from fnmatch import fnmatch
+from pathlib import Path
+import PIL
+from PIL import Image
+from .corpus import generate_corpus
+from .operations import benchmarks, benchmark_inputs
+
+default_corpus_dir = os.path.join(os.path.dirname(__file__), ".corpus")
+default_baseline = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Function to time one pass of a benchmark over its images, returns the seconds spent in the operation
+def time_pass(kind, function, corpus_dir, output_dir, images, decoded):
+    elapsed = 0.0
+    # The workers report every image, which is not what is being measured
+    with contextlib.redirect_stdout(io.StringIO()):
+        for position, image in enumerate(images):
+            if kind == "file":
+                start = time.perf_counter()
+                function(corpus_dir, output_dir, image)
+                elapsed += time.perf_counter() - start
+            else:
+                copy = decoded[position].copy()  # Some transforms draw in place
+                start = time.perf_counter()
+                function(copy)
+                elapsed += time.perf_counter() - start
+    return elapsed
+
+# Function to run one benchmark, returns its result entry
+def run_benchmark(name, corpus_dir, index, output_dir, repeat, warmup):
+    sets, kind, function = benchmarks[name]
+    images, pixels = benchmark_inputs(corpus_dir, index, sets)
+
+    decoded = []
+    if kind == "memory":
+        for image in images:
+            with Image.open(corpus_dir / image) as img:
+                img.load()
+                decoded.append(img)
+
+    for _ in range(warmup):
+        time_pass(kind, function, corpus_dir, output_dir, images, decoded)
+    times = [time_pass(kind, function, corpus_dir, output_dir, images, decoded) for _ in range(repeat)]
+
+    median = statistics.median(times)
+    return {
+        "images": len(images),
+        "megapixels": round(pixels / 1e6, 3),
+        "seconds_min": round(min(times), 6),
+        "seconds_median": round(median, 6),
+        "images_per_second": round(len(images) / median, 3) if median else None,
+        "megapixels_per_second": round(pixels / 1e6 / median, 3) if median else None,
+    }
+
+# Function to compare results with a baseline, returns the list of regressions
+def compare(results, baseline, threshold):
+    """A benchmark regresses when its median time grew by more than threshold (0.15 = 15%)."""
+    regressions = []
+    for name, entry in results["benchmarks"].items():
+        previous = baseline.get("benchmarks", {}).get(name)
+        if not previous or not previous.get("seconds_median"):
+            continue
+        change = entry["seconds_median"] / previous["seconds_median"] - 1
+        entry["change"] = round(change, 4)
+        if change > threshold:
+            regressions.append((name, change))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="ImageToolkit benchmarks - throughput of every operation on a deterministic synthetic corpus.",
+        epilog="Example usage: python -m benchmarks.run --output results.json --baseline benchmarks/baseline.json --threshold 0.15"
+    )
+    parser.add_argument("--corpus", default=default_corpus_dir, help="Directory of the generated corpus (created on first run and reused).")
+    parser.add_argument("--quick", action="store_true", help="Use a smaller corpus for a fast check.")
+    parser.add_argument("--only", action="append", metavar="GLOB", help="Only run benchmarks matching this glob, e.g. 'color.*'. Can be repeated.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed passes per benchmark, the median is kept (default: 5).")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed passes before measuring (default: 1).")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", default=default_baseline, help="Baseline JSON to compare with (default: benchmarks/baseline.json).")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Fail when a median time grows by more than this fraction (default: 0.15).")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline instead of comparing.")
+    parser.add_argument("--list", action="store_true", help="List the benchmarks and exit.")
+    args = parser.parse_args()
+
+    names = [name for name in benchmarks if not args.only or any(fnmatch(name, pattern) for pattern in args.only)]
+    if args.list:
+        print("\n".join(names))
+        return 0
+    if not names:
+        print("No benchmark matches --only.")
+        return 1
+
+    corpus_dir = Path(args.corpus)
+    index = generate_corpus(corpus_dir, quick=args.quick)
+    output_dir = Path(tempfile.mkdtemp(prefix="imagetoolkit-bench-"))
+
+    results = {
+        "pillow": PIL.__version__,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "corpus_digest": index["digest"],
+        "quick": args.quick,
+        "repeat": args.repeat,
+        "benchmarks": {},
+    }
+
+    try:
+        for name in names:
+            entry = run_benchmark(name, corpus_dir, index, output_dir, args.repeat, args.warmup)
+            results["benchmarks"][name] = entry
+            print(f"{name:45} {entry['seconds_median']:9.4f} s  {entry['images_per_second']:9.2f} img/s  {entry['megapixels_per_second']:9.2f} MP/s", flush=True)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    status = 0
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=1, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+
+        # Times are only comparable on the same corpus, a different Pillow is what is usually being checked
+        if baseline.get("corpus_digest") != results["corpus_digest"]:
+            print("The baseline was measured on a different corpus, regenerate it with --save-baseline.")
+            status = 1
+        else:
+            if baseline.get("pillow") != results["pillow"]:
+                print(f"Comparing Pillow {results['pillow']} against a baseline measured with Pillow {baseline.get('pillow')}.")
+            regressions = compare(results, baseline, args.threshold)
+            for name, change in regressions:
+                print(f"REGRESSION {name}: {change:+.1%} (threshold {args.threshold:.0%})")
+            if regressions:
+                status = 1
+            else:
+                print(f"No regression over {args.threshold:.0%} against {args.baseline}.")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=1, sort_keys=True)
+
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
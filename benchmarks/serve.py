@@ -0,0 +1,114 @@
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from .corpus import generate_corpus
+from .startup import src_dir
+from imagetoolkit.profiler import percentile
+
+# Load test of the serve command: a server is started in its own process, then --clients threads send
+# corpus images over kept-alive connections for --duration seconds. The run is made twice: with the
+# result cache off (every request is processed) and on (the same images come back, mostly cache hits).
+
+default_corpus_dir = os.path.join(os.path.dirname(__file__), ".corpus")
+default_request = "/resize?mode=scale&percentage=50"
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+# Function to start a server and wait until it answers, returns (process, port)
+def start_server(jobs, pool, cache_size):
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [src_dir, os.environ.get("PYTHONPATH")])))
+    command = [sys.executable, "-m", "imagetoolkit.imagetoolkit", "serve", "--port", str(port), "--jobs", str(jobs), "--pool", pool, "--cache-size", cache_size]
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(200):
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/health")
+            if connection.getresponse().status == 200:
+                return server, port
+        except OSError:
+            time.sleep(0.05)
+    server.terminate()
+    raise RuntimeError("The server did not start")
+
+# Function to send requests from one client until the deadline, appending (latency, status) to results
+def client_loop(port, request, bodies, deadline, results):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    number = 0
+    while time.perf_counter() < deadline:
+        body = bodies[number % len(bodies)]
+        number += 1
+        start = time.perf_counter()
+        connection.request("POST", request, body=body, headers={"Content-Type": "application/octet-stream"})
+        response = connection.getresponse()
+        response.read()
+        results.append((time.perf_counter() - start, response.status))
+    connection.close()
+
+# Function to load the server with clients threads for duration seconds, returns the stats of the run
+def load_test(port, request, bodies, clients, duration):
+    results = []
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=client_loop, args=(port, request, bodies[number:] + bodies[:number], deadline, results)) for number in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        "requests": len(results),
+        "errors": sum(1 for _, status in results if status != 200),
+        "requests_per_second": round(len(results) / elapsed, 1),
+        "median_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Requests per second and p99 latency of the serve command on the benchmark corpus.")
+    parser.add_argument("--corpus", default=default_corpus_dir, help="Directory of the generated corpus (created on first run and reused).")
+    parser.add_argument("--quick", action="store_true", help="Use a smaller corpus for a fast check.")
+    parser.add_argument("--set", default="small", help="Corpus set whose images are sent (default: small).")
+    parser.add_argument("--request", default=default_request, help=f"Path and query string of the requests (default: {default_request}).")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent clients, one kept-alive connection each (default: 8).")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds each run lasts (default: 10).")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Server workers (default: one per CPU core).")
+    parser.add_argument("--pool", choices=["process", "thread"], default="process", help="Server worker pool (default: process).")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    corpus_dir = Path(args.corpus)
+    images = generate_corpus(corpus_dir, quick=args.quick)["files"][args.set]
+    bodies = [(corpus_dir / image).read_bytes() for image in images]
+
+    results = {"request": args.request, "clients": args.clients, "jobs": args.jobs, "pool": args.pool, "images": len(bodies)}
+    for name, cache_size in (("uncached", "0"), ("cached", "256MB")):
+        server, port = start_server(args.jobs, args.pool, cache_size)
+        try:
+            results[name] = load_test(port, args.request, bodies, args.clients, args.duration)
+        finally:
+            server.terminate()
+            server.wait()
+        run = results[name]
+        print(f"{name:9} {run['requests']:6} requests  {run['requests_per_second']:8.1f} req/s  median {run['median_ms']:7.2f} ms  p99 {run['p99_ms']:7.2f} ms  errors {run['errors']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=1)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Modules the argument-driven path must not load: the interactive stack and the operations
+# (each command imports only its own operation module when it runs)
+forbidden_modules = (
+    "questionary", "prompt_toolkit",
+    "imagetoolkit.compress", "imagetoolkit.rescale", "imagetoolkit.extension",
+    "imagetoolkit.color", "imagetoolkit.addtext", "imagetoolkit.pipeline",
+)
+
+# What `imagetoolkit <command> ...` imports before dispatching the command
+startup_code = "import imagetoolkit.imagetoolkit, imagetoolkit.cli"
+reference_code = "import PIL.Image"
+
+src_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# Function to run python -c code in a fresh interpreter, returns (seconds, stdout)
+def run_python(code):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [src_dir, os.environ.get("PYTHONPATH")])))
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", code], env=env, check=True, capture_output=True, text=True).stdout
+    return time.perf_counter() - start, output
+
+# Function to list the forbidden modules (or packages) the startup path loads
+def loaded_forbidden_modules():
+    _, output = run_python(f"{startup_code}\nimport sys, json\nprint(json.dumps(sorted(sys.modules)))")
+    modules = json.loads(output)
+    return [prefix for prefix in forbidden_modules if any(name == prefix or name.startswith(prefix + ".") for name in modules)]
+
+# Function to time the startup path against importing Pillow alone, in milliseconds
+def startup_overhead_ms(repeat):
+    startup = statistics.median(run_python(startup_code)[0] for _ in range(repeat))
+    reference = statistics.median(run_python(reference_code)[0] for _ in range(repeat))
+    return round(startup * 1000, 1), round(reference * 1000, 1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time benchmark of the imagetoolkit CLI batch path.")
+    parser.add_argument("--repeat", type=int, default=15, help="Fresh interpreters started per measurement, the median is kept (default: 15).")
+    parser.add_argument("--max-overhead-ms", type=float, default=30.0, help="Fail when the CLI startup takes more than this over importing Pillow alone (default: 30).")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    forbidden = loaded_forbidden_modules()
+    startup_ms, reference_ms = startup_overhead_ms(args.repeat)
+    overhead_ms = round(startup_ms - reference_ms, 1)
+
+    print(f"CLI startup {startup_ms} ms, Pillow alone {reference_ms} ms, overhead {overhead_ms} ms (limit {args.max_overhead_ms} ms)")
+    status = 0
+    if forbidden:
+        print(f"FAIL the CLI path imports: {', '.join(forbidden)}")
+        status = 1
+    if overhead_ms > args.max_overhead_ms:
+        print("FAIL the CLI startup overhead is over the limit")
+        status = 1
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({"startup_ms": startup_ms, "pillow_ms": reference_ms, "overhead_ms": overhead_ms, "forbidden_modules": forbidden}, file, indent=1)
+
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
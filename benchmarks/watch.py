@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from imagetoolkit.pipeline import build_steps
+from imagetoolkit.watch import watch
+from imagetoolkit.profiler import percentile
+from .corpus import generate_corpus
+from .startup import src_dir
+
+# End-to-end latency of the watch command: corpus images are dropped one by one into a watched
+# directory and each latency runs from the file landing (its mtime) to its output being written.
+# The reference starts `imagetoolkit pipeline` in a fresh process per dropped file, as a cron job
+# or a hook would, and times that process (the time until a poller would notice the file is not counted).
+
+default_corpus_dir = os.path.join(os.path.dirname(__file__), ".corpus")
+default_steps = ["resize:mode=scale,percentage=50", "add-text:text=imagetoolkit,color=white,position=Bottom Right"]
+
+# Function to drop the images into the watched directory, waiting interval seconds between two files
+def drop_files(corpus_dir, images, input_dir, interval):
+    for number, image in enumerate(images):
+        shutil.copyfile(Path(corpus_dir) / image, Path(input_dir) / f"{number:04d}{Path(image).suffix}")
+        time.sleep(interval)
+
+# Function to measure the latencies of the watch command, in seconds
+def watch_latencies(corpus_dir, images, steps, jobs, interval, backend):
+    latencies = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_dir, output_dir = Path(work_dir) / "in", Path(work_dir) / "out"
+        input_dir.mkdir()
+        output_dir.mkdir()
+        stop = threading.Event()
+        done = threading.Event()
+
+        def on_result(image, result, latency):
+            latencies.append(latency)
+            if len(latencies) == len(images):
+                done.set()
+
+        watcher = threading.Thread(target=watch, args=(input_dir, output_dir, build_steps(steps), {"step": steps}),
+                                   kwargs={"jobs": jobs, "backend": backend, "stop": stop, "on_result": on_result})
+        watcher.start()
+        time.sleep(2.0)  # Let the pool start and warm up, as a long-running watcher would be
+        drop_files(corpus_dir, images, input_dir, interval)
+        done.wait(timeout=60 + 10 * len(images))
+        stop.set()
+        watcher.join()
+    return latencies
+
+# Function to measure the time a fresh `imagetoolkit pipeline` process takes per dropped file, in seconds
+def process_latencies(corpus_dir, images, steps):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [src_dir, os.environ.get("PYTHONPATH")])))
+    command = [sys.executable, "-m", "imagetoolkit.imagetoolkit", "pipeline"] + [argument for step in steps for argument in ("--step", step)]
+    latencies = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        output_dir = Path(work_dir) / "out"
+        for number, image in enumerate(images):
+            input_dir = Path(work_dir) / f"in{number}"
+            input_dir.mkdir()
+            shutil.copyfile(Path(corpus_dir) / image, input_dir / Path(image).name)
+            start = time.perf_counter()
+            subprocess.run(command + ["--input", str(input_dir), "--output", str(output_dir)], env=env, check=True, capture_output=True)
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+def describe(latencies):
+    latencies = sorted(latencies)
+    return {
+        "images": len(latencies),
+        "median_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency from a file landing to its output with the watch command, against one process per file.")
+    parser.add_argument("--corpus", default=default_corpus_dir, help="Directory of the generated corpus (created on first run and reused).")
+    parser.add_argument("--quick", action="store_true", help="Use a smaller corpus for a fast check.")
+    parser.add_argument("--set", default="photos", help="Corpus set whose images are dropped (default: photos).")
+    parser.add_argument("--step", action="append", help="Pipeline step, repeat for each (default: a 50%% resize and a text).")
+    parser.add_argument("--jobs", type=int, default=2, help="Watch workers (default: 2).")
+    parser.add_argument("--interval", type=float, default=0.5, help="Seconds between two dropped files (default: 0.5).")
+    parser.add_argument("--backend", choices=["auto", "inotify", "poll"], default="auto", help="Watch backend (default: auto).")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    steps = args.step or default_steps
+    corpus_dir = Path(args.corpus)
+    images = generate_corpus(corpus_dir, quick=args.quick)["files"][args.set]
+
+    results = {
+        "steps": steps,
+        "watch": describe(watch_latencies(corpus_dir, images, steps, args.jobs, args.interval, args.backend)),
+        "process_per_file": describe(process_latencies(corpus_dir, images, steps)),
+    }
+    for name in ("watch", "process_per_file"):
+        entry = results[name]
+        print(f"{name:16} {entry['images']:3} images  median {entry['median_ms']:7.1f} ms  p95 {entry['p95_ms']:7.1f} ms  max {entry['max_ms']:7.1f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=1)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,16 @@
 from .utils import display_msg
 from .variables import fonts_dir, msg_allowed
+from .executor import run_batch
+from .fileio import open_image, load_image, save_image
+from .profiler import stage
+from functools import partial, lru_cache
 from pathlib import Path
 import os
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+import math
+
+# Font sizes are rounded to steps of 2%, so images whose widths differ by less reuse the same text layer
+font_size_bucket = 1.02
 
 # Function to get available fonts in the fonts directory
 def get_available_fonts():
@@ -12,49 +20,93 @@ def get_available_fonts():
             fonts.append(file)
     return fonts
 
-def add_text_to_image(input_path, selected_output_path, images, text_to_add, position_choice, font_choice, font_size_ratio, color_choice):
+def add_text_to_image(input_path, selected_output_path, images, text_to_add, position_choice, font_choice, font_size_ratio, color_choice, jobs=1):
     input_path = Path(input_path)  # Convert to Path object
     selected_output_path = Path(selected_output_path)  # Convert to Path object
 
-    for image in images:
-        try:
-            image_path = input_path / image  # Correct way to join paths
-            with Image.open(image_path) as img:
-                img_width, img_height = img.size
-
-                font_size = int((font_size_ratio / 100) * img_width)
-                font_path = os.path.join(fonts_dir, font_choice)
-                font = ImageFont.truetype(font_path, font_size)
-
-                draw = ImageDraw.Draw(img)
-
-                # Medir el tamaño real del texto
-                text_bbox = draw.textbbox((0, 0), text_to_add, font=font)
-                text_width = text_bbox[2] - text_bbox[0]
-                text_height = text_bbox[3] - text_bbox[1]
-
-                # Ajustar posición según el texto
-                if position_choice == "Top Left":
-                    position = (10, 10)  # Margen pequeño
-                elif position_choice == "Top Right":
-                    position = (img_width - text_width - 10, 10)
-                elif position_choice == "Center":
-                    position = ((img_width - text_width) // 2, (img_height - text_height) // 2)
-                elif position_choice == "Bottom Left":
-                    position = (10, img_height - text_height - 10)
-                elif position_choice == "Bottom Right":
-                    position = (img_width - text_width - 10, img_height - text_height - 10)
-                else:
-                    position = (10, 10)  # fallback
-
-                # Dibujar el texto en la posición ajustada
-                draw.text(position, text_to_add, font=font, fill=color_choice)
-
-                # Guardar la imagen modificada
-                os.makedirs(selected_output_path, exist_ok=True)
-                img.save(os.path.join(selected_output_path, image))
-
-                display_msg(f"Text added to image {image} and saved to {selected_output_path}", msg_allowed["SUCCESS"], False)
-
-        except Exception as e:
-            display_msg(f"Error adding text to image {image}: {e}", msg_allowed["ERROR"], False)
+    worker = partial(add_text_to_single_image, input_path, selected_output_path, text_to_add, position_choice, font_choice, font_size_ratio, color_choice)
+    return run_batch(worker, images, jobs, input_dir=input_path, output_dir=selected_output_path)
+
+# Function to add text to a single image, returns the output path if one was written
+def add_text_to_single_image(input_path, selected_output_path, text_to_add, position_choice, font_choice, font_size_ratio, color_choice, image):
+    image_path = input_path / image  # Correct way to join paths
+    with open_image(image_path) as img:
+        load_image(img)
+        with stage("transform"):
+            draw_text(img, text_to_add, position_choice, font_choice, font_size_ratio, color_choice)
+
+        # Guardar la imagen modificada
+        save_image(img, os.path.join(selected_output_path, image))
+
+    display_msg(f"Text added to image {image} and saved to {selected_output_path}", msg_allowed["SUCCESS"], False)
+    return os.path.join(selected_output_path, image)
+
+# Function to load a font once per (file, pixel size)
+@lru_cache(maxsize=32)
+def load_font(font_path, font_size):
+    return ImageFont.truetype(font_path, font_size)
+
+# Function to round a font size to its bucket, so nearly identical image widths share one text layer
+def bucket_font_size(font_size):
+    if font_size <= 1:
+        return 1
+    return round(font_size_bucket ** round(math.log(font_size, font_size_bucket)))
+
+# Function to rasterize a text once per (text, font, size, color)
+@lru_cache(maxsize=64)
+def render_text_layer(text_to_add, font_path, font_size, color_choice):
+    """
+    Return (layer, mask, bbox): an RGBA layer with the text in its color and the glyph
+    coverage as alpha, that coverage as an L mask, and the text bbox relative to the
+    point where draw.text would have drawn it.
+    """
+    font = load_font(font_path, font_size)
+    text_bbox = font.getbbox(text_to_add)
+    size = (max(1, text_bbox[2] - text_bbox[0]), max(1, text_bbox[3] - text_bbox[1]))
+
+    mask = Image.new("L", size, 0)
+    ImageDraw.Draw(mask).text((-text_bbox[0], -text_bbox[1]), text_to_add, font=font, fill=255)
+
+    layer = Image.new("RGBA", size, color_choice)
+    layer.putalpha(mask)
+    return layer, mask, text_bbox
+
+# Function to draw the text on an image already in memory (in place), returns the image
+def draw_text(img, text_to_add, position_choice, font_choice, font_size_ratio, color_choice):
+    img_width, img_height = img.size
+
+    font_size = bucket_font_size(int((font_size_ratio / 100) * img_width))
+    font_path = os.path.join(fonts_dir, font_choice)
+    layer, mask, text_bbox = render_text_layer(text_to_add, font_path, font_size, color_choice)
+
+    # Medir el tamaño real del texto
+    text_width = text_bbox[2] - text_bbox[0]
+    text_height = text_bbox[3] - text_bbox[1]
+
+    # Ajustar posición según el texto
+    if position_choice == "Top Left":
+        position = (10, 10)  # Margen pequeño
+    elif position_choice == "Top Right":
+        position = (img_width - text_width - 10, 10)
+    elif position_choice == "Center":
+        position = ((img_width - text_width) // 2, (img_height - text_height) // 2)
+    elif position_choice == "Bottom Left":
+        position = (10, img_height - text_height - 10)
+    elif position_choice == "Bottom Right":
+        position = (img_width - text_width - 10, img_height - text_height - 10)
+    else:
+        position = (10, 10)  # fallback
+
+    # Pegar la capa de texto ya renderizada, en el mismo sitio donde draw.text la dibujaría
+    left, top = position[0] + text_bbox[0], position[1] + text_bbox[1]
+
+    if img.mode == "RGBA":
+        # alpha_composite needs a non-negative destination, crop the part of the layer that falls outside
+        img.alpha_composite(layer, (max(0, left), max(0, top)), (max(0, -left), max(0, -top)))
+    elif img.mode in ("RGB", "L"):
+        img.paste(ImageColor.getcolor(color_choice, img.mode), (left, top), mask)
+    else:
+        # Palette and other modes keep drawing with the ink of their own mode
+        ImageDraw.Draw(img).text(position, text_to_add, font=load_font(font_path, font_size), fill=color_choice)
+
+    return img
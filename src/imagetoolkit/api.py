@@ -0,0 +1,122 @@
+from io import BytesIO
+from PIL import Image
+from .compress import reduce_image
+from .rescale import resize_by_mode, square_thumbnail, pyramid_sizes, pyramid_levels
+from .color import apply_filters as filter_image_pixels, parse_filters
+from .addtext import draw_text, get_available_fonts
+from .formats import prepare_for, encoder_params
+from .pipeline import build_steps, process_image
+
+# In-memory API: the operations of the toolkit on a PIL image, the bytes of an image file or a binary
+# buffer, with no file read or written and nothing printed. Transforms return a PIL image, encoders
+# return the bytes of the encoded file. The commands run the same code on the files they read.
+#
+#   from imagetoolkit import api
+#   small = api.resize(data, percentage=50)
+#   jpeg = api.reduce(small, 256, format="JPEG")
+#
+# A PIL image given to a transform is never modified, the result is a new image. It is decoded whole
+# (loaded) first: the reduced-scale JPEG decode of resizes (draft) only applies to the images the API
+# opens itself, from bytes or a buffer, as draft would change the size of the caller's image.
+
+# Function to open what the API accepts: a PIL image, the bytes of an image file or a binary buffer
+def open_source(source):
+    if isinstance(source, Image.Image):
+        source.load()  # Its pixels as they are, draft() no longer applies to it
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return Image.open(BytesIO(source))
+    if hasattr(source, "read"):
+        return Image.open(source)
+    raise TypeError(f"Expected a PIL image, bytes or a binary buffer, got {type(source).__name__}")
+
+# Function to get the lowercase format name of an image ("jpeg", "png"...), default for images made in memory
+def format_of(image, default="png"):
+    return (image.format or default).lower()
+
+# Function to encode an image, returns the bytes of the file
+def encode(image, format, **params):
+    """params are passed to Pillow's save(), e.g. quality=85 or optimize=True."""
+    buffer = BytesIO()
+    image.save(buffer, format=format.upper(), **params)
+    return buffer.getvalue()
+
+# Function to resize to exact dimensions (width, height) or by a percentage, returns the resized image
+def resize(source, dimensions=None, percentage=None, resample=Image.Resampling.LANCZOS):
+    if (dimensions is None) == (percentage is None):
+        raise ValueError("Give either dimensions or percentage")
+    image = open_source(source)
+    if dimensions is not None:
+        return resize_by_mode(image, "fixed", tuple(dimensions), resample)
+    return resize_by_mode(image, "percent", percentage)
+
+# Function to make a size x size thumbnail as the thumbnails command does, returns the thumbnail
+def thumbnail(source, size):
+    """Images already no larger than size on one side are returned as they are (a copy for a PIL image)."""
+    image = open_source(source)
+    if image.width > size and image.height > size:
+        return square_thumbnail(image, size)
+    return image.copy()
+
+# Function to make thumbnails of several sizes keeping the aspect ratio, returns {size: thumbnail}
+def thumbnail_pyramid(source, sizes):
+    """Sizes over the longest side of the source are left out."""
+    image = open_source(source)
+    sizes = pyramid_sizes(image, sorted(set(sizes), reverse=True))
+    return dict(zip(sizes, pyramid_levels(image, sizes)))
+
+# Function to apply filters in order (names or a comma-separated string), returns the filtered image
+def apply_filters(source, filters, engine="pillow", fuse=False):
+    """fuse merges pairs of 3x3 kernels into one pass: faster, but not exact (see color.apply_kernel_chain)."""
+    return filter_image_pixels(open_source(source), parse_filters(filters), engine, fuse)
+
+# Function to draw a text at one of the positions of the add-text command, returns the new image
+def add_text(source, text, color, position="Bottom Right", font=None, size=5.0):
+    """font is a file of the fonts directory (default: the first one), size the font size in % of the width."""
+    image = open_source(source)
+    if image is source:
+        image = image.copy()  # draw_text works in place
+    if font is None:
+        fonts = get_available_fonts()
+        if not fonts:
+            raise ValueError("No fonts available")
+        font = fonts[0]
+    return draw_text(image, text, position, font, size, color)
+
+# Function to encode an image in another format, returns the bytes of the file
+def convert(source, format, quality=None, effort=None):
+    """quality (0-100) and effort (0-6) apply to JPEG, WebP and AVIF."""
+    return encode(prepare_for(open_source(source), format), format, **encoder_params(format, quality, effort))
+
+# Function to encode an image under max_size KB as the reduce command does, returns the bytes of the file
+def reduce(source, max_size, format=None, resize=False, force_quality=False, effort=None):
+    """
+    max_size is in KB (256 or "256KB"). format defaults to the format of the source. The bytes of a
+    source already under max_size in its own format are returned unchanged, without re-encoding.
+    """
+    if isinstance(max_size, str) and max_size.upper().endswith("KB"):
+        max_size = max_size[:-2]
+    max_size = int(max_size)
+    image = open_source(source)
+    extension = format_of(image, "jpeg")
+    format = format.upper() if format else None
+    converting = format is not None and format.lower() != extension
+
+    file_bytes = None
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        file_bytes = len(source)
+        if file_bytes < max_size * 1024 and not converting:
+            return bytes(source)
+
+    image.load()
+    data, _, _ = reduce_image(image, extension, max_size, resize, force_quality, format if converting else None, file_bytes, effort)
+    return data
+
+# Function to run pipeline steps ("resize:mode=scale,percentage=50" or (name, params) pairs), returns (bytes, extension)
+def transform(source, steps):
+    """The in-memory form of the pipeline command (and what the serve command runs)."""
+    image = open_source(source)
+    extension = format_of(image)
+    if image is source:
+        image = image.copy()  # Steps such as add-text work in place
+    return process_image(image, build_steps(steps), extension)
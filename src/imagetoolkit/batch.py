@@ -0,0 +1,183 @@
+from pathlib import Path
+import csv
+import json
+import os
+import sys
+import time
+from .executor import run_batch
+from .fileio import open_image, write_bytes, format_for
+from .formats import output_formats
+from .outputs import sync_dirs
+from .pipeline import build_steps, validate_step, process_image
+
+# Manifest-driven batch: each job of the manifest names its own input, output and steps, and the
+# whole manifest runs in one process through one worker pool instead of one command per image.
+#
+#   JSONL, one job per line (blank lines and lines starting with # are skipped):
+#     {"id": "a1", "input": "photos/a.jpg", "output": "out/a.webp", "steps": ["resize:mode=scale,percentage=50"]}
+#     {"input": "photos/b.png", "output": "out/", "steps": [{"op": "add-text", "text": "b", "color": "white", "position": "Center"}]}
+#
+#   CSV, with a header row: id (optional), input, output, steps (specs separated by ";")
+#
+# Relative paths are relative to the directory of the manifest. An output ending with "/" or naming an
+# existing directory gets the input's file name with the extension of the result; an output file whose
+# extension names another format than the steps produce gets a convert step added, and an output file
+# without a known image extension is an invalid entry. Every job leaves one JSON line in the result
+# log, written as soon as the job is done.
+
+# Function to read the entries of a manifest lazily, yields (line number, entry or the error of the line)
+def read_manifest(manifest_path):
+    """manifest_path is a .jsonl or .csv file, or "-" for JSONL on the standard input."""
+    if manifest_path == "-":
+        yield from read_jsonl(sys.stdin)
+        return
+    with open(manifest_path, newline="", encoding="utf-8") as file:
+        if Path(manifest_path).suffix.lower() == ".csv":
+            yield from read_csv(file)
+        else:
+            yield from read_jsonl(file)
+
+def read_jsonl(file):
+    for number, line in enumerate(file, start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError as e:
+            yield number, ValueError(f"Invalid JSON: {e}")
+            continue
+        yield number, entry if isinstance(entry, dict) else ValueError("A job must be a JSON object")
+
+def read_csv(file):
+    reader = csv.DictReader(file)
+    for number, row in enumerate(reader, start=2):  # Line 1 is the header
+        yield number, {key.strip(): (value or "").strip() for key, value in row.items() if key}
+
+# Function to turn the steps of an entry (a string, or a list of specs and {"op": ...} objects) into specs
+def step_specs(steps):
+    if isinstance(steps, str):
+        return [spec.strip() for spec in steps.split(";") if spec.strip()]
+    if not isinstance(steps, list):
+        raise ValueError("steps must be a list or a string of specs separated by ';'")
+
+    specs = []
+    for step in steps:
+        if isinstance(step, str):
+            specs.append(step)
+        elif isinstance(step, dict) and "op" in step:
+            params = {}
+            for key, value in step.items():
+                if key == "op":
+                    continue
+                if isinstance(value, (list, tuple)):
+                    value = "x".join(map(str, value)) if key == "dimensions" else "+".join(map(str, value))  # 800x600, SEPIA+SHARPEN
+                params[key] = str(value)
+            specs.append((str(step["op"]), params))
+        else:
+            raise ValueError("Each step must be a spec string or an object with an 'op' key")
+    return specs
+
+# Function to check an entry and turn it into a job for run_job
+def prepare_job(number, entry, base_dir, default_steps=()):
+    """Raise ValueError with the reason when the entry can't be run."""
+    if not entry.get("input") or not entry.get("output"):
+        raise ValueError("A job needs an input and an output")
+    input_path = base_dir / os.path.expanduser(str(entry["input"]))
+    output = str(entry["output"])
+    output_path = base_dir / os.path.expanduser(output)
+    to_directory = output.endswith(("/", os.sep)) or output_path.is_dir()
+
+    specs = step_specs(entry["steps"]) if entry.get("steps") else list(default_steps)
+    # Object steps have string parameters, so they go through validate_step as specs do
+    steps = build_steps([validate_step(*spec) if isinstance(spec, tuple) else spec for spec in specs]) if specs else []
+
+    target = None if to_directory else format_for(output_path)
+    if not to_directory and target is None:
+        extension = f"'{output_path.suffix}'" if output_path.suffix else "none"
+        raise ValueError(f"Unknown output extension ({extension}): name a file of one of {', '.join(output_formats)}, or a directory ending with /")
+
+    # The output extension asks for a format the steps don't produce: convert before the final encode
+    converts = [params["format"] for name, params in steps if name == "convert"]
+    if target is not None and target != (converts[-1] if converts else format_for(input_path)):
+        if target not in output_formats:
+            raise ValueError(f"Can't write {output_path.suffix} files, use one of: {', '.join(output_formats)}")
+        steps.insert(len(steps) - 1 if steps and steps[-1][0] == "reduce" else len(steps), validate_step("convert", {"format": target}))
+    if not steps:
+        raise ValueError("The job has no steps (give them in the manifest or with --step)")
+
+    return {
+        "line": number,
+        "id": str(entry.get("id") or number),
+        "input": str(input_path),
+        "output": str(output_path),
+        "to_directory": to_directory,
+        "steps": steps,
+    }
+
+# Function to make the log record of a job
+def job_record(job, status, seconds=0.0, output=None, size=None, error=None):
+    record = {"id": job["id"], "line": job["line"], "input": job.get("input"), "output": output or job.get("output"),
+              "status": status, "seconds": round(seconds, 4), "bytes": size}
+    if error is not None:
+        record["error"] = error
+    return record
+
+# Function to run the steps of one job, returns its log record (errors included, never raised)
+def run_job(job):
+    start = time.perf_counter()
+    try:
+        extension = os.path.splitext(job["input"])[1][1:].lower()
+        with open_image(job["input"]) as img:
+            data, extension = process_image(img, job["steps"], extension)
+
+        output_path = Path(job["output"])
+        if job["to_directory"]:
+            output_path = output_path / Path(job["input"]).with_suffix(f".{extension}").name
+        write_bytes(output_path, data)
+    except Exception as e:
+        return job_record(job, "error", time.perf_counter() - start, error=str(e) or type(e).__name__)
+    return job_record(job, "ok", time.perf_counter() - start, str(output_path), len(data))
+
+# Function to get the jobs of a manifest, logging the entries that can't run instead of yielding them
+def iter_jobs(manifest_path, default_steps, on_invalid):
+    base_dir = Path.cwd() if manifest_path == "-" else Path(manifest_path).resolve().parent
+    for number, entry in read_manifest(manifest_path):
+        if isinstance(entry, Exception):
+            on_invalid(job_record({"id": str(number), "line": number}, "invalid", error=str(entry)))
+            continue
+        try:
+            yield prepare_job(number, entry, base_dir, default_steps)
+        except (ValueError, TypeError) as e:
+            job = {"id": str(entry.get("id") or number), "line": number, "input": entry.get("input"), "output": entry.get("output")}
+            on_invalid(job_record(job, "invalid", error=str(e)))
+
+# Function to run every job of a manifest, streaming one JSON line per job to log_file
+def run_manifest(manifest_path, log_file, jobs=1, default_steps=(), on_record=None):
+    """Returns the stats of the run: ok, failed, invalid, bytes and seconds."""
+    stats = {"ok": 0, "failed": 0, "invalid": 0, "bytes": 0, "seconds": 0.0}
+    start = time.perf_counter()
+
+    def log(record):
+        log_file.write(json.dumps(record) + "\n")
+        log_file.flush()  # A reader following the log sees each job as soon as it is done
+        if record["status"] == "ok":
+            stats["ok"] += 1
+            stats["bytes"] += record["bytes"]
+        else:
+            stats["failed" if record["status"] == "error" else "invalid"] += 1
+        if on_record is not None:
+            on_record(record)
+
+    # No input_dir: jobs have their own paths, so staging and the result cache stay out of the way
+    records = run_batch(run_job, iter_jobs(manifest_path, default_steps, log), jobs, ordered=False, on_result=log)
+    sync_dirs([record["output"] for record in records if record and record["status"] == "ok"])
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+# Function to describe a batch run in one line
+def summary_line(stats):
+    line = f"Batch: {stats['ok']} jobs done, {stats['failed']} failed"
+    if stats["invalid"]:
+        line += f", {stats['invalid']} invalid entries skipped"
+    return line + f" in {stats['seconds']:.1f} s, {stats['bytes'] / 1024 ** 2:.1f} MB written"
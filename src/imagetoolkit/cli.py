@@ -1,14 +1,110 @@
 import warnings
 import argparse
 import sys, os
+import signal
+import threading
 from PIL import Image
-from .compress import compress
-from .rescale import process_images_resize
-from .extension import new_format
-from .color import apply_filter_to_images
-from .addtext import add_text_to_image, get_available_fonts
+from .manifest import load_manifest, save_manifest, operation_from_args, pending_images, record_results
 from .utils import display_msg
-from .variables import msg_allowed, available_filters, valid_extensions
+from .executor import jobs_argument
+from .tiled import memory_limit_argument
+from .formats import output_formats, lossy_formats, max_effort, can_save
+from . import profiler, staging
+from .variables import msg_allowed, available_filters
+from .discovery import iter_images
+from itertools import chain
+
+# Operation modules are imported by the command that needs them, so each run only loads its own
+
+# argparse type for --filter, one filter or a comma-separated list
+def filter_list_argument(value):
+    from .color import parse_filters
+    try:
+        return parse_filters(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+# Function to run the HTTP server until Ctrl+C or SIGTERM
+def serve_command(args):
+    from .serve import new_state, create_server, summary_line
+
+    state = new_state(args.jobs, args.pool, args.cache_size, args.max_body)
+    try:
+        server = create_server(args.host, args.port, state)
+    except OSError as e:
+        display_msg(f"Could not listen on {args.host}:{args.port}: {e}", msg_allowed["ERROR"], True)
+        state["pool"].shutdown()
+        sys.exit(1)
+
+    # SIGTERM stops the server as Ctrl+C does; shutdown() must come from another thread than serve_forever()
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    display_msg(f"Serving on http://{args.host}:{server.server_address[1]} with {args.jobs} {args.pool} worker(s). Press Ctrl+C to stop.", msg_allowed["INFO"], True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        state["pool"].shutdown()
+    display_msg(summary_line(state), msg_allowed["INFO"], True)
+
+# Function to run the watch command until Ctrl+C or SIGTERM
+def watch_command(args):
+    from .pipeline import build_steps
+    from .watch import watch, summary_line
+
+    if os.path.samefile(args.input, args.output):
+        display_msg("The output directory must not be the watched directory.", msg_allowed["ERROR"], True)
+        sys.exit(1)
+    try:
+        steps = build_steps(args.step)
+    except ValueError as e:
+        display_msg(str(e), msg_allowed["ERROR"], True)
+        sys.exit(1)
+
+    # Both signals end the session gracefully: the images being processed are finished first
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+    try:
+        stats = watch(args.input, args.output, steps, operation_from_args(args), jobs=args.jobs, recursive=args.recursive, include=args.include, exclude=args.exclude,
+                      settle=args.settle, poll_interval=args.poll_interval, backend=args.backend, new_only=args.new_only, stop=stop)
+    except OSError as e:
+        display_msg(str(e), msg_allowed["ERROR"], True)
+        sys.exit(1)
+    display_msg(summary_line(stats), msg_allowed["INFO"], True)
+
+# Function to run the jobs of a manifest, each with its own input, output and steps
+def batch_command(args):
+    from .batch import run_manifest, summary_line
+    from .pipeline import build_steps
+
+    if args.manifest != "-" and not os.path.isfile(args.manifest):
+        display_msg("The manifest file does not exist.", msg_allowed["ERROR"], True)
+        sys.exit(1)
+    default_steps = args.step or []
+    try:
+        if default_steps:
+            build_steps(default_steps)  # Checked once here rather than on every job
+    except ValueError as e:
+        display_msg(str(e), msg_allowed["ERROR"], True)
+        sys.exit(1)
+
+    if args.fsync:
+        from . import outputs
+        outputs.enable(fsync=True)
+
+    def report(record):
+        if record["status"] == "ok":
+            display_msg(f"Job {record['id']}: saved to {record['output']} ({round(record['bytes'] / 1024, 2)} KB)", msg_allowed["SUCCESS"], False)
+        else:
+            display_msg(f"Job {record['id']} (line {record['line']}): {record['error']}", msg_allowed["ERROR"], False)
+
+    log_path = args.log or ("batch.results.jsonl" if args.manifest == "-" else os.path.splitext(args.manifest)[0] + ".results.jsonl")
+    with open(log_path, "w", encoding="utf-8") as log_file:
+        stats = run_manifest(args.manifest, log_file, jobs=args.jobs, default_steps=default_steps, on_record=report)
+    display_msg(f"{summary_line(stats)}. Results logged to {log_path}", msg_allowed["INFO"], True)
 
 def cli():
     warnings.simplefilter('ignore', Image.DecompressionBombWarning)
@@ -24,6 +120,24 @@ def cli():
     def add_common_arguments(subparser):
         subparser.add_argument("--input", required=True, help="Input directory containing images.")
         subparser.add_argument("--output", required=True, help="Output directory to save processed images.")
+        subparser.add_argument("--recursive", action="store_true", help="Also process images in subdirectories, mirroring them in the output directory.")
+        subparser.add_argument("--include", action="append", metavar="GLOB", help="Only process images matching this glob (relative path or file name). Can be repeated.")
+        subparser.add_argument("--exclude", action="append", metavar="GLOB", help="Skip images and directories matching this glob. Can be repeated.")
+        subparser.add_argument("--incremental", action="store_true", help="Skip images already processed with the same options whose outputs exist (tracked in a manifest in the output directory).")
+        subparser.add_argument("--hash", action="store_true", help="With --incremental, also compare content hashes so touched but unchanged images are skipped.")
+        subparser.add_argument("--dedup", choices=["content", "pixels", "perceptual"], help="Process duplicate inputs once and give the copies the same outputs: identical files (content), identical pixels (pixels) or look-alike images within --dedup-distance (perceptual).")
+        subparser.add_argument("--dedup-distance", type=int, default=4, metavar="BITS", help="With --dedup perceptual, largest difference between two 64-bit image hashes still counted as duplicates (default: 4).")
+        subparser.add_argument("--dedup-link", choices=["hardlink", "copy"], default="hardlink", help="How duplicates get their outputs: hard links to the outputs of the processed image, or copies (default: hardlink).")
+        subparser.add_argument("--cache", metavar="DIR", help="Keep the results in this content-addressed cache: an image already processed with the same options (same file content, any name or folder) is copied from it instead of processed again.")
+        subparser.add_argument("--cache-size", type=memory_limit_argument, default="1GB", metavar="SIZE", help="With --cache, size the cache is kept under by evicting the least recently used results (e.g. 512MB, 10GB, default: 1GB).")
+        subparser.add_argument("--jobs", type=jobs_argument, default=1, metavar="N", help="Number of images processed in parallel: a number or 'auto' for one per CPU core (default: 1).")
+        subparser.add_argument("--prefetch", type=int, default=4, metavar="N", help="With --jobs 1, read up to N images ahead in background threads while the current one is processed (0 turns it off, default: 4).")
+        subparser.add_argument("--write-queue", type=int, default=8, metavar="N", help="With --jobs 1, write up to N finished images behind in a background thread (0 turns it off, default: 8).")
+        subparser.add_argument("--fsync", action="store_true", help="Flush every output to disk before it replaces the previous file, and the output directories once per batch, so even a power loss leaves whole files (slower).")
+        subparser.add_argument("--profile", metavar="REPORT", help="Time the decode, transform, encode and write stages of every image and save a report (.json or .csv).")
+        subparser.add_argument("--profile-memory", action="store_true", help="With --profile, also record the peak memory of the process after each image.")
+        subparser.add_argument("--profile-top", type=int, default=10, metavar="N", help="With --profile, number of slowest images listed in a JSON report (default: 10).")
+        subparser.add_argument("--memory-limit", type=memory_limit_argument, metavar="SIZE", help="Process images whose decoded size is over this limit (e.g. 512MB, 2GB) in strips of rows instead of decoding them whole (resize, convert and filter).")
 
     # Command: REDUCE
     reduce_parser = subparsers.add_parser("reduce", help="Reduce image file size.")
@@ -31,6 +145,10 @@ def cli():
     reduce_parser.add_argument("--max-size", choices=["256KB", "512KB", "1024KB", "1500KB", "2048KB"], required=True, help="Maximum size: 256KB, 512KB, 1024KB, 1500KB or 2048KB.")
     reduce_parser.add_argument("--resize", action="store_true", help="Allow resizing images to meet size limit.")
     reduce_parser.add_argument("--quality", action="store_true", help="Force quality reduction if necessary.")
+    reduce_parser.add_argument("--model-dir", metavar="DIR", help="Directory of the quality model that predicts where to start the size search, refined after every run (default: $XDG_CACHE_HOME/imagetoolkit or ~/.cache/imagetoolkit).")
+    reduce_parser.add_argument("--no-predict", action="store_true", help="Search the quality by plain bisection, without the quality model.")
+    reduce_parser.add_argument("--format", choices=lossy_formats, help="Write the reduced images in this format (AVIF needs Pillow with AVIF support). Default: the format of each source.")
+    reduce_parser.add_argument("--effort", type=int, choices=range(max_effort + 1), metavar=f"0-{max_effort}", help=f"WebP/AVIF encoder effort, 0 is the fastest and {max_effort} the smallest (default: encoder default).")
 
     # Command: RESIZE
     resize_parser = subparsers.add_parser("resize", help="Resize or scale images.")
@@ -42,14 +160,19 @@ def cli():
     # Command: CONVERT
     convert_parser = subparsers.add_parser("convert", help="Convert image format.")
     add_common_arguments(convert_parser)
-    convert_parser.add_argument("--format", choices=["JPEG", "PNG", "BMP"], required=True, help="Target format.")
+    convert_parser.add_argument("--format", choices=output_formats, required=True, help="Target format (AVIF needs Pillow with AVIF support).")
+    convert_parser.add_argument("--quality", type=int, choices=range(1, 101), metavar="1-100", help="JPEG/WebP/AVIF quality (default: encoder default).")
+    convert_parser.add_argument("--effort", type=int, choices=range(max_effort + 1), metavar=f"0-{max_effort}", help=f"WebP/AVIF encoder effort, 0 is the fastest and {max_effort} the smallest (default: encoder default).")
     convert_parser.add_argument("--rename", action="store_true", help="Rename files during conversion.")
     convert_parser.add_argument("--basename", help="Base name for renamed files (required if --rename is used).")
 
     # Command: FILTER
     filter_parser = subparsers.add_parser("filter", help="Apply filters (grayscale, sepia, etc).")
     add_common_arguments(filter_parser)
-    filter_parser.add_argument("--filter", type=str.upper, choices=available_filters, required=True, help=f"Filter to apply: {', '.join(available_filters)}.")
+    filter_parser.add_argument("--filter", type=filter_list_argument, required=True, help=f"Filter to apply, or a comma-separated list applied in order (e.g. BRIGHTNESS_INC,CONTRAST_INC,SHARPEN): {', '.join(available_filters)}.")
+    filter_parser.add_argument("--engine", choices=["pillow", "numpy"], default="pillow", help="Run SEPIA, INVERT, GRAYSCALE, POSTERIZE, SOLARIZE and SATURATION_* as NumPy array operations (falls back to Pillow without NumPy, same output). Default: pillow.")
+    filter_parser.add_argument("--fuse-kernels", dest="fuse", action="store_true", help="Merge pairs of 3x3 kernels (SHARPEN, SMOOTH, DETAIL, EDGE_ENHANCE...) into one 5x5 pass. Faster, but the result can differ a lot from the filters one by one, most on noisy images and the 2px border.")
+    filter_parser.add_argument("--batch", type=int, default=1, metavar="N", help="With --engine numpy, filter groups of N images, stacking those of the same size and mode in one array (default: 1).")
 
     # Command: ADD-TEXT
     text_parser = subparsers.add_parser("add-text", help="Add custom text to images.")
@@ -60,54 +183,195 @@ def cli():
     text_parser.add_argument("--color", choices=["black", "white", "red", "blue", "green"], required=True, help="Text color.")
     text_parser.add_argument("--position", choices=["Top Left", "Top Right", "Center", "Bottom Left", "Bottom Right"], required=True, help="Text position.")
 
+    # Command: THUMBNAILS
+    thumbnails_parser = subparsers.add_parser("thumbnails", help="Create thumbnails or favicons.")
+    add_common_arguments(thumbnails_parser)
+    size_group = thumbnails_parser.add_mutually_exclusive_group(required=True)
+    size_group.add_argument("--size", type=int, help="Square thumbnail size in px.")
+    size_group.add_argument("--sizes", nargs="+", type=int, metavar="SIZE", help="Thumbnail pyramid sizes in px (e.g. 16 24 32 48 64 128), decoded once per image with the aspect ratio kept.")
+    thumbnails_parser.add_argument("--favicon", action="store_true", help="Save as .ico (with --sizes, one .ico containing every size).")
+
+    # Command: PIPELINE
+    pipeline_parser = subparsers.add_parser("pipeline", help="Chain several operations with one decode and one encode per image.")
+    add_common_arguments(pipeline_parser)
+    pipeline_parser.add_argument("--step", action="append", required=True, metavar="NAME:KEY=VALUE,...", help="Step to apply, in order (repeat for each step): resize, filter, add-text, convert or reduce. E.g. --step resize:mode=scale,percentage=50 --step filter:filter=SEPIA --step reduce:max-size=512KB")
+
+    # Command: WATCH
+    watch_parser = subparsers.add_parser("watch", help="Watch a directory and run pipeline steps on every image that lands in it.")
+    watch_parser.add_argument("--input", required=True, help="Directory to watch.")
+    watch_parser.add_argument("--output", required=True, help="Output directory to save processed images (must not be the watched directory).")
+    watch_parser.add_argument("--step", action="append", required=True, metavar="NAME:KEY=VALUE,...", help="Step to apply, in order, as for the pipeline command.")
+    watch_parser.add_argument("--recursive", action="store_true", help="Also watch the subdirectories, mirroring them in the output directory.")
+    watch_parser.add_argument("--include", action="append", metavar="GLOB", help="Only process images matching this glob (relative path or file name). Can be repeated.")
+    watch_parser.add_argument("--exclude", action="append", metavar="GLOB", help="Skip images and directories matching this glob. Can be repeated.")
+    watch_parser.add_argument("--jobs", type=jobs_argument, default=1, metavar="N", help="Number of warm worker processes: a number or 'auto' for one per CPU core (default: 1).")
+    watch_parser.add_argument("--settle", type=float, default=0.5, metavar="SECONDS", help="A file not known to be closed is processed once its size and mtime haven't changed for this long (default: 0.5).")
+    watch_parser.add_argument("--backend", choices=["auto", "inotify", "poll"], default="auto", help="How new files are noticed: inotify (Linux) or polling the directory. Default: inotify where available.")
+    watch_parser.add_argument("--poll-interval", type=float, default=1.0, metavar="SECONDS", help="With polling, seconds between two scans of the directory (default: 1.0).")
+    watch_parser.add_argument("--new-only", action="store_true", help="Ignore the images already in the directory, only process those that land after the start.")
+
+    # Command: BATCH
+    batch_parser = subparsers.add_parser("batch", help="Run the jobs of a manifest, each with its own input, output and pipeline steps, through one worker pool.")
+    batch_parser.add_argument("--manifest", required=True, metavar="FILE", help="Jobs to run: a .jsonl file (one JSON object per line with input, output and steps) or a .csv file (columns id, input, output, steps separated by ';'), '-' for JSONL on the standard input. Relative paths are relative to the manifest.")
+    batch_parser.add_argument("--log", metavar="FILE", help="Result log, one JSON line per job with its status, time and output size, written as jobs finish (default: MANIFEST.results.jsonl next to the manifest).")
+    batch_parser.add_argument("--step", action="append", metavar="NAME:KEY=VALUE,...", help="Steps for the jobs that don't list any, as for the pipeline command (repeat for each step).")
+    batch_parser.add_argument("--jobs", type=jobs_argument, default=1, metavar="N", help="Number of jobs run in parallel: a number or 'auto' for one per CPU core (default: 1).")
+    batch_parser.add_argument("--fsync", action="store_true", help="Flush every output to disk before it replaces the previous file, as for the other commands.")
+
+    # Command: SERVE
+    serve_parser = subparsers.add_parser("serve", help="Run the pipeline steps over HTTP on images sent in request bodies.")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1, local only).")
+    serve_parser.add_argument("--port", type=int, default=8080, help="Port to listen on (default: 8080).")
+    serve_parser.add_argument("--jobs", type=jobs_argument, default="auto", metavar="N", help="Number of workers processing images: a number or 'auto' for one per CPU core (default: auto).")
+    serve_parser.add_argument("--pool", choices=["process", "thread"], default="process", help="Run the image work in worker processes or in threads of the server process (default: process).")
+    serve_parser.add_argument("--cache-size", type=memory_limit_argument, default="64MB", metavar="SIZE", help="Memory kept for recent results, served again without processing (0 turns it off, default: 64MB).")
+    serve_parser.add_argument("--max-body", type=memory_limit_argument, default="64MB", metavar="SIZE", help="Largest image accepted in a request (default: 64MB).")
+
     # Parse arguments
     args = parser.parse_args()
 
+    if args.command == "serve":
+        serve_command(args)
+        return
+
+    if args.command == "batch":
+        batch_command(args)
+        return
+
     if not os.path.exists(args.input):
         display_msg("The input directory does not exist.", msg_allowed["ERROR"], True)
         sys.exit(1)
 
+    if getattr(args, "format", None) and not can_save(args.format):
+        display_msg(f"This Pillow build can't write {args.format} images.", msg_allowed["ERROR"], True)
+        sys.exit(1)
+
     os.makedirs(args.output, exist_ok=True)
 
-    files = os.listdir(args.input)
-    images = [f for f in files if os.path.isfile(os.path.join(args.input, f)) and os.path.splitext(f)[1].lower() in valid_extensions]
+    if args.command == "watch":
+        watch_command(args)
+        return
 
-    if not images:
+    if args.profile:
+        profiler.enable(track_memory=args.profile_memory)
+
+    # Serial runs overlap reading, processing and writing; parallel runs already overlap them across processes
+    # With --memory-limit, the inputs read ahead stay under the limit too
+    staging.enable(prefetch=max(0, args.prefetch), write_queue=max(0, args.write_queue), max_prefetch_bytes=args.memory_limit)
+
+    # Outputs are always replaced atomically, --fsync also makes them durable
+    if args.fsync:
+        from . import outputs
+        outputs.enable(fsync=True)
+
+    if args.cache:
+        from . import result_cache
+        result_cache.enable(args.cache, args.cache_size)
+
+    # Images are discovered lazily and reach the operation as soon as they are found
+    images = iter_images(args.input, args.recursive, args.include, args.exclude, skip_dirs=[args.output])
+    first_image = next(images, None)
+
+    if first_image is None:
         display_msg("No valid images found in the input directory.", msg_allowed["ERROR"], True)
         sys.exit(1)
 
+    images = chain([first_image], images)
+
+    # Incremental mode: only images whose fingerprint or operation changed reach the operation
+    incremental = args.incremental
+    if incremental and args.command == "convert" and args.rename:
+        display_msg("--incremental is ignored with --rename: the new names depend on the position of every image in the batch.", msg_allowed["WARNING"], False)
+        incremental = False
+
+    if incremental:
+        manifest = load_manifest(args.output)
+        operation = operation_from_args(args)
+        plan = {"skipped": 0, "processed": []}
+        images = pending_images(manifest, args.input, images, operation, args.hash, plan)
+
+    # Dedup: only the first image of each group of duplicates reaches the operation
+    dedup_plan = None
+    if args.dedup and args.command == "convert" and args.rename:
+        display_msg("--dedup is ignored with --rename: every image gets its own index in the new names.", msg_allowed["WARNING"], False)
+    elif args.dedup:
+        from .dedup import new_plan, dedup_images
+        dedup_plan = new_plan(args.input, args.dedup, args.dedup_distance, args.dedup_link)
+        images = dedup_images(images, dedup_plan)
+
+    results = []
+
     if args.command == "reduce":
-        compress(args.input, args.output, images, args.resize, args.quality, args.max_size)
+        from .compress import compress
+        results = compress(args.input, args.output, images, args.resize, args.quality, args.max_size, jobs=args.jobs, predict=not args.no_predict, model_dir=args.model_dir, output_format=args.format, effort=args.effort)
 
     elif args.command == "resize":
+        from .rescale import process_images_resize
         if args.mode == "fixed":
             if not args.dimensions:
                 display_msg("You must specify dimensions with --dimensions.", msg_allowed["ERROR"], True)
                 sys.exit(1)
-            process_images_resize(args.input, args.output, images, args.mode, tuple(args.dimensions), None)
+            results = process_images_resize(args.input, args.output, images, args.mode, tuple(args.dimensions), None, jobs=args.jobs, memory_limit=args.memory_limit)
 
         elif args.mode == "scale":
             if not args.percentage:
                 display_msg("You must specify a scaling percentage with --percentage.", msg_allowed["ERROR"], True)
                 sys.exit(1)
-            process_images_resize(args.input, args.output, images, args.mode, args.percentage, None)
+            results = process_images_resize(args.input, args.output, images, "percent", args.percentage, None, jobs=args.jobs, memory_limit=args.memory_limit)
 
     elif args.command == "convert":
+        from .extension import new_format
         if args.rename and not args.basename:
             display_msg("You must specify --basename if using --rename.", msg_allowed["ERROR"], True)
             sys.exit(1)
-        new_format(args.input, args.output, images, args.format, args.rename, args.basename)
+        results = new_format(args.input, args.output, images, args.format, args.rename, args.basename or "none", jobs=args.jobs, memory_limit=args.memory_limit, quality=args.quality, effort=args.effort)
 
     elif args.command == "filter":
-        apply_filter_to_images(args.input, args.output, images, args.filter.upper())
+        from .color import apply_filter_to_images
+        results = apply_filter_to_images(args.input, args.output, images, args.filter, jobs=args.jobs, memory_limit=args.memory_limit, engine=args.engine, batch_size=max(1, args.batch), fuse=args.fuse)
 
     elif args.command == "add-text":
+        from .addtext import add_text_to_image, get_available_fonts
         fonts = get_available_fonts()
         font_choice = args.font if args.font else (fonts[0] if fonts else None)
         if not font_choice:
             display_msg("No fonts available.", msg_allowed["ERROR"], True)
             sys.exit(1)
-        add_text_to_image(args.input, args.output, images, args.text, args.position, font_choice, args.size, args.color)
+        results = add_text_to_image(args.input, args.output, images, args.text, args.position, font_choice, args.size, args.color, jobs=args.jobs)
+
+    elif args.command == "pipeline":
+        from .pipeline import run_pipeline, build_steps
+        try:
+            steps = build_steps(args.step)
+        except ValueError as e:
+            display_msg(str(e), msg_allowed["ERROR"], True)
+            sys.exit(1)
+        results = run_pipeline(args.input, args.output, images, steps, jobs=args.jobs)
+
+    elif args.command == "thumbnails":
+        from .rescale import thumbnails, thumbnail_pyramid
+        want_favicon = "yes" if args.favicon else "no"
+        if args.sizes:
+            results = thumbnail_pyramid(args.input, args.output, images, want_favicon, args.sizes, jobs=args.jobs)
+        else:
+            results = thumbnails(args.input, args.output, images, want_favicon, f"{args.size}px", jobs=args.jobs)
 
     else:
         parser.print_help()
+
+    if args.cache:
+        display_msg(result_cache.summary_line(result_cache.evict()), msg_allowed["INFO"], True)
+
+    if dedup_plan is not None:
+        from .dedup import fan_out, summary_line
+        results = fan_out(dedup_plan, results)
+        display_msg(summary_line(dedup_plan["stats"]), msg_allowed["INFO"], True)
+
+    if incremental:
+        record_results(manifest, plan, results, operation)
+        save_manifest(args.output, manifest)
+        display_msg(f"Incremental run: {plan['skipped']} images skipped (up to date), {len(plan['processed'])} processed.", msg_allowed["INFO"], True)
+
+    if args.profile:
+        profiler.write_report(args.profile, profiler.records, args.profile_top)
+        display_msg(f"{profiler.summary_line(profiler.records)}. Report saved to {args.profile}", msg_allowed["INFO"], True)
@@ -1,11 +1,114 @@
 from PIL import Image, ImageEnhance, ImageOps, ImageFilter
 import os
 from pathlib import Path
-from .utils import display_msg
-from .variables import msg_allowed
+from .utils import display_msg, ensure_parent_dir
+from .variables import msg_allowed, available_filters
+from .executor import run_batch
+from .tiled import use_strips, tiled_map
+from .fileio import open_image, load_image, save_image, format_for
+from .profiler import stage
+from functools import partial
 
-# Function to apply a filter to images
-def apply_filter_to_images(input_path, selected_output_path, images, filter_choice):
+# Function to apply a filter (or a comma-separated list of filters, in order) to images
+def apply_filter_to_images(input_path, selected_output_path, images, filter_choice, jobs=1, memory_limit=None, engine="pillow", batch_size=1, fuse=False):
+    """
+    engine "numpy" runs the colour filters as array operations, batch_size > 1 then stacks images of the same size.
+    fuse merges pairs of 3x3 kernels into one 5x5 pass, faster but not exact (see apply_kernel_chain).
+    """
+    input_path = Path(input_path)  # Convert to Path object
+    selected_output_path = Path(selected_output_path)  # Convert to Path object
+    filter_names = parse_filters(filter_choice)
+
+    if engine == "numpy":
+        from . import numpy_engine
+        if not numpy_engine.is_available():
+            display_msg("NumPy is not installed, the filters run on the Pillow engine.", msg_allowed["WARNING"], False)
+            engine = "pillow"
+
+    if engine == "numpy" and batch_size > 1:
+        # Each task is a group of images, the results are given back one per image
+        groups = []
+        worker = partial(filter_image_group, input_path, selected_output_path, filter_names, memory_limit, fuse)
+        results = run_batch(worker, group_images(images, batch_size, groups), jobs, input_dir=input_path, output_dir=selected_output_path)
+        return [result for group, group_results in zip(groups, results) for result in (group_results or [None] * len(group))]
+
+    worker = partial(filter_image, input_path, selected_output_path, filter_names, memory_limit, engine, fuse)
+    return run_batch(worker, images, jobs, input_dir=input_path, output_dir=selected_output_path)
+
+# Function to yield the images in lists of size images, remembering each list in groups
+def group_images(images, size, groups):
+    group = []
+    for image in images:
+        group.append(image)
+        if len(group) == size:
+            groups.append(group)
+            yield group
+            group = []
+    if group:
+        groups.append(group)
+        yield group
+
+# Function to apply the filters to a group of images, stacking those of the same size and mode in one array
+def filter_image_group(input_path, selected_output_path, filter_names, memory_limit, fuse, group):
+    """Returns the output path of each image of the group, None for the ones that failed."""
+    from . import numpy_engine
+    results = [None] * len(group)
+    stacks = {}
+
+    for position, image in enumerate(group):
+        try:
+            img = open_image(input_path / image)
+            if numpy_engine.can_run(filter_names, img.mode) and not use_strips(img, image, memory_limit):
+                stacks.setdefault((img.size, img.mode), []).append((position, image, load_image(img)))
+                continue
+            img.close()
+            results[position] = filter_image(input_path, selected_output_path, filter_names, memory_limit, "numpy", fuse, image)
+        except Exception as e:
+            display_msg(f"Error processing image {image}: {e}", msg_allowed["ERROR"], False)
+
+    for entries in stacks.values():
+        with stage("transform"):
+            filtered_images = numpy_engine.filter_images([img for _, _, img in entries], filter_names)
+        for (position, image, img), filtered_img in zip(entries, filtered_images):
+            img.close()
+            try:
+                output_image_path = os.path.join(selected_output_path, image)
+                save_image(filtered_img, output_image_path)
+                display_msg(f"Filter {', '.join(filter_names)} applied to {image} and saved to {selected_output_path}", msg_allowed["SUCCESS"], False)
+                results[position] = output_image_path
+            except Exception as e:
+                display_msg(f"Error processing image {image}: {e}", msg_allowed["ERROR"], False)
+
+    return results
+
+# Function to apply the filters to a single image, returns the output path
+def filter_image(input_path, selected_output_path, filter_names, memory_limit, engine, fuse, image):
+    image_path = input_path / image  # Correct way to join paths
+    with open_image(image_path) as img:
+        # Images over the memory limit are filtered in strips when every filter only looks at nearby rows
+        margin = strip_margin(filter_names)
+        if margin is not None and use_strips(img, image, memory_limit):
+            output_image_path = os.path.join(selected_output_path, image)
+            ensure_parent_dir(output_image_path)
+            with stage("transform"):
+                tiled_map(image_path, output_image_path, format_for(image), margin, partial(apply_filters, filter_choices=filter_names, engine=engine, fuse=fuse), memory_limit)
+            display_msg(f"Filter {', '.join(filter_names)} applied to {image} in strips and saved to {selected_output_path}", msg_allowed["SUCCESS"], False)
+            return output_image_path
+
+        # Apply the selected filters, fused into as few passes as possible
+        load_image(img)
+        with stage("transform"):
+            filtered_img = apply_filters(img, filter_names, engine, fuse)
+
+        # Save the processed image
+        output_image_path = os.path.join(selected_output_path, image)
+        save_image(filtered_img, output_image_path)
+
+        display_msg(f"Filter {', '.join(filter_names)} applied to {image} and saved to {selected_output_path}", msg_allowed["SUCCESS"], False)
+        return output_image_path
+
+# Function to apply a filter to an image already in memory, returns the filtered image
+def apply_filter(img, filter_choice):
     filters = {
         "SEPIA": apply_sepia,
         "INVERT": invert_colors,
@@ -33,23 +136,7 @@ def apply_filter_to_images(input_path, selected_output_path, images, filter_choi
         "CROP_CENTER": crop_center
     }
 
-    input_path = Path(input_path)  # Convert to Path object
-    selected_output_path = Path(selected_output_path)  # Convert to Path object
-
-    for image in images:
-        try:
-            image_path = input_path / image  # Correct way to join paths
-            with Image.open(image_path) as img:
-                # Apply the selected filter
-                filtered_img = filters[filter_choice](img)
-
-                # Save the processed image
-                output_image_path = os.path.join(selected_output_path, image)
-                filtered_img.save(output_image_path)
-
-                display_msg(f"Filter {filter_choice} applied to {image} and saved to {selected_output_path}", msg_allowed["SUCCESS"], False)
-        except Exception as e:
-            display_msg(f"Error processing image {image}: {e}", msg_allowed["ERROR"], False)
+    return filters[filter_choice](img)
 
 
 # Specific functions for each filter
@@ -116,3 +203,206 @@ def crop_center(image):
     right = (width + new_width) // 2
     bottom = (height + new_height) // 2
     return image.crop((left, top, right, bottom))
+
+
+# Filter graph: runs a list of filters with as few full-frame passes as possible.
+#
+# - Consecutive per-pixel filters (INVERT, POSTERIZE, SOLARIZE, BRIGHTNESS_*,
+#   CONTRAST_*) on L or RGB images are compiled into one lookup table applied
+#   with a single Image.point call. Each table is measured by running the real
+#   filter on a 0-255 ramp, so a chain without CONTRAST is bit-exact.
+#   CONTRAST needs the mean grey level of the image at that point of the chain,
+#   which is estimated from the channel histograms of the input: for RGB images
+#   after other point filters this can shift the mean by one level, so pixels
+#   may differ by 1 from applying the filters one after another.
+# - Consecutive 3x3 kernels (SHARPEN, SMOOTH, DETAIL, EDGE_ENHANCE) are fused in
+#   pairs into one 5x5 kernel, the largest size Pillow's kernel filter accepts.
+#   BLUR is already 5x5 and runs on its own. A fused kernel skips the rounding and
+#   clipping of the intermediate image, so interior pixels may differ by a few
+#   levels (more where the first filter would have clipped, e.g. SHARPEN on hard
+#   edges), and the outer 2px frame, which Pillow leaves unfiltered, differs too.
+# - Any other filter (or any image mode other than L and RGB) runs through
+#   apply_filter exactly as it does on its own.
+
+# Per-pixel filters and the function measured on a ramp to build their table
+point_filters = {
+    "INVERT": lambda img: ImageOps.invert(img),
+    "POSTERIZE": lambda img: ImageOps.posterize(img, 4),
+    "SOLARIZE": lambda img: ImageOps.solarize(img, threshold=128),
+    "BRIGHTNESS_INC": lambda img: ImageEnhance.Brightness(img).enhance(1.5),
+    "BRIGHTNESS_DEC": lambda img: ImageEnhance.Brightness(img).enhance(0.7),
+}
+
+# Contrast blends with the mean grey level of the image, so its table depends on that mean
+contrast_factors = {
+    "CONTRAST_INC": 1.5,
+    "CONTRAST_DEC": 0.7,
+}
+
+# Convolution filters that can be fused
+kernel_filters = {
+    "BLUR": ImageFilter.BLUR,
+    "SHARPEN": ImageFilter.SHARPEN,
+    "SMOOTH": ImageFilter.SMOOTH,
+    "DETAIL": ImageFilter.DETAIL,
+    "EDGE_ENHANCE": ImageFilter.EDGE_ENHANCE,
+}
+
+# Largest kernel Pillow can apply in one pass
+max_kernel_size = 5
+
+# Filters that only change each row from itself (the kernels also read a few rows around it)
+row_filters = ("SEPIA", "GRAYSCALE", "SATURATION_INC", "SATURATION_DEC", "FLIP_HORIZONTAL") + tuple(point_filters)
+edge_filters = {"CONTOUR": ImageFilter.CONTOUR, "EMBOSS": ImageFilter.EMBOSS}
+
+# Function to split a filter list ("SEPIA,BLUR" or ["SEPIA", "BLUR"]) into validated names
+def parse_filters(filter_choices):
+    if isinstance(filter_choices, str):
+        filter_choices = filter_choices.split(",")
+
+    names = [name.strip().upper() for name in filter_choices if name.strip()]
+    if not names:
+        raise ValueError("No filter given")
+
+    for name in names:
+        if name not in available_filters:
+            raise ValueError(f"Unknown filter '{name}'. Use one of: {', '.join(available_filters)}")
+
+    return names
+
+# Function to build an identity ramp (0..255 in every band) for a mode
+def ramp(mode):
+    band = Image.frombytes("L", (256, 1), bytes(range(256)))
+    return band if mode == "L" else Image.merge(mode, [band] * len(mode))
+
+# Function to measure the per-band lookup table of a per-pixel operation
+def measure_table(operation, mode):
+    return [list(band.tobytes()) for band in operation(ramp(mode)).split()]
+
+# Function to build the table of a contrast change around a given mean grey level
+def contrast_table(mode, factor, mean):
+    degenerate = Image.new("L", (256, 1), mean).convert(mode)
+    return measure_table(lambda img: Image.blend(degenerate, img, factor), mode)
+
+# Function to chain two per-band tables (first, then second)
+def chain_tables(first, second):
+    return [[after[value] for value in before] for before, after in zip(first, second)]
+
+# Function to estimate the mean grey level (as Pillow's Contrast computes it) after the current tables
+def estimate_mean(histogram, tables):
+    means = []
+    for index, table in enumerate(tables):
+        counts = histogram[index * 256:(index + 1) * 256]
+        total = sum(counts) or 1
+        means.append(sum(count * table[value] for value, count in enumerate(counts)) / total)
+
+    mean = means[0] if len(means) == 1 else (19595 * means[0] + 38470 * means[1] + 7471 * means[2]) / 65536
+    return int(mean + 0.5)
+
+# Function to run a run of per-pixel filters as one Image.point pass
+def apply_point_chain(image, names):
+    # INVERT always works on RGB, per-pixel filters act the same on R=G=B so converting first is equivalent
+    if image.mode == "L" and "INVERT" in names:
+        image = image.convert("RGB")
+
+    tables = measure_table(lambda img: img, image.mode)
+    histogram = image.histogram() if any(name in contrast_factors for name in names) else None
+
+    for name in names:
+        if name in contrast_factors:
+            table = contrast_table(image.mode, contrast_factors[name], estimate_mean(histogram, tables))
+        else:
+            table = measure_table(point_filters[name], image.mode)
+        tables = chain_tables(tables, table)
+
+    return image.point([value for table in tables for value in table])
+
+# Function to fuse two kernels into the single kernel that applies both
+def fuse_kernels(first, second):
+    (size_a, _), scale_a, offset_a, kernel_a = first
+    (size_b, _), scale_b, offset_b, kernel_b = second
+    size = size_a + size_b - 1
+
+    kernel = [0] * (size * size)
+    for ay in range(size_a):
+        for ax in range(size_a):
+            for by in range(size_b):
+                for bx in range(size_b):
+                    kernel[(ay + by) * size + ax + bx] += kernel_a[ay * size_a + ax] * kernel_b[by * size_b + bx]
+
+    offset = offset_b + offset_a * sum(kernel_b) / scale_b
+    return (size, size), scale_a * scale_b, offset, tuple(kernel)
+
+# Function to run a run of convolution filters, with as few kernel passes as possible if fuse is set
+def apply_kernel_chain(image, names, fuse=False):
+    """
+    Without fuse every kernel is its own pass, exactly as applying the filters one by one. A fused
+    pass skips the rounding and the clipping to 0-255 between the kernels, and treats the 2px border
+    differently: on smooth images it stays within 1 level, but where the intermediate image would
+    have been clipped (noise, hard edges) it can be off by most of the 0-255 range.
+    """
+    if not fuse:
+        for name in names:
+            image = image.filter(kernel_filters[name])
+        return image
+
+    pending = None
+    for name in names:
+        filterargs = kernel_filters[name].filterargs
+        if pending is not None and pending[0][0] + filterargs[0][0] - 1 <= max_kernel_size:
+            pending = fuse_kernels(pending, filterargs)
+            continue
+        if pending is not None:
+            image = image.filter(ImageFilter.Kernel(pending[0], pending[3], pending[1], pending[2]))
+        pending = filterargs
+
+    return image.filter(ImageFilter.Kernel(pending[0], pending[3], pending[1], pending[2]))
+
+# Function to tell how a filter can run on an image of the given mode
+def filter_kind(name, mode):
+    """Return 'point', 'kernel' or 'single' (run on its own through apply_filter)."""
+    if mode not in ("L", "RGB"):
+        return "single"
+    if name in point_filters or name in contrast_factors:
+        return "point"
+    if name in kernel_filters:
+        return "kernel"
+    return "single"
+
+# Function to get the rows of context a filter list needs around a strip, None if it needs the whole image
+def strip_margin(filter_names):
+    margin = 0
+    for name in filter_names:
+        if name in kernel_filters or name in edge_filters:
+            margin += (kernel_filters.get(name) or edge_filters[name]).filterargs[0][0] // 2
+        elif name not in row_filters:
+            return None  # CONTRAST and EQUALIZE use the histogram, the geometry filters move rows
+    return margin
+
+# Function to apply a list of filters to an image in memory, fusing passes where possible
+def apply_filters(image, filter_choices, engine="pillow", fuse=False):
+    names = parse_filters(filter_choices)
+
+    if engine == "numpy":
+        from . import numpy_engine  # Imported on demand, loading NumPy takes longer than most filters
+        if numpy_engine.can_run(names, image.mode):
+            return numpy_engine.filter_images([image], names)[0]
+
+    start = 0
+    while start < len(names):
+        # Group the longest run of the same kind, using the mode the image has at this point
+        kind = filter_kind(names[start], image.mode)
+        end = start + 1
+        while kind != "single" and end < len(names) and filter_kind(names[end], image.mode) == kind:
+            end += 1
+
+        if kind == "point":
+            image = apply_point_chain(image, names[start:end])
+        elif kind == "kernel":
+            image = apply_kernel_chain(image, names[start:end], fuse)
+        else:
+            image = apply_filter(image, names[start])
+
+        start = end
+
+    return image
@@ -1,73 +1,381 @@
 from .variables import msg_allowed
 from .rescale import rescale_percent
 from .utils import display_msg
-from PIL import Image
+from .executor import run_batch
+from .fileio import open_image, load_image, write_bytes
+from .profiler import stage
+from .formats import encoder_params, prepare_for
+from . import quality_model
+from PIL import Image, ImageChops
+from functools import partial, lru_cache
+from io import BytesIO
+import math
 import os
 from pathlib import Path
 
-def compress(input_path, selected_output_path, images, can_resize, want_force, max_size):
+# Highest quality tried when searching, Pillow advises against JPEG quality above 95
+max_encode_quality = 95
+
+# Smallest scale (in percent) tried when resizing to reach the size limit
+min_scale_percent = 5
+
+# PNG has no quality: its searches run on the number of palette colors instead (PNG8, alpha kept).
+# Palettes go down to png_min_colors (png_min_colors_forced with --quality) and resizing uses png_resize_colors.
+max_palette_colors = 256
+png_min_colors = 64
+png_min_colors_forced = 16
+png_resize_colors = 64
+
+# Formats whose size follows the quality setting, where the quality model can predict a start
+predicted_formats = ("jpeg", "webp", "avif")
+
+# Predicted encodes aim a little under the limit, and a fitting encode this close to it is kept
+prediction_margin = 0.97
+good_enough_fill = 0.90
+
+# Full encodes guided by the model before falling back to bisection
+predicted_encodes = 2
+
+# Starting guess of how the encoded size follows the scale (size ~ scale ** scale_exponent)
+scale_exponent = 1.5
+
+def compress(input_path, selected_output_path, images, can_resize, want_force, max_size, jobs=1, predict=True, model_dir=None, output_format=None, effort=None):
   input_path = Path(input_path)  # Convert to Path object
   selected_output_path = Path(selected_output_path)  # Convert to Path object
   max_size = int(max_size[:-2])
+  model_dir = (model_dir or quality_model.default_model_dir()) if predict else None
+
+  worker = partial(compress_image, input_path, selected_output_path, can_resize, want_force, max_size, model_dir, output_format, effort)
+  results = run_batch(worker, images, jobs, input_dir=input_path, output_dir=selected_output_path)
+
+  # Fold what every worker learned into the stored model and report how well it predicted
+  if model_dir:
+    quality_model.save_delta()  # What this process learned, in a serial batch (workers save theirs on exit)
+    display_msg(quality_model.stats_line(quality_model.merge_deltas(model_dir)), msg_allowed["INFO"], False)
+  return results
+
+# Function to encode an image into an in-memory buffer, returns the encoded bytes
+def encode_image(image, extension, quality, effort=None):
+  """For PNG, quality is the number of palette colors (None keeps every color), see encode_png."""
+  if extension == "png":
+    return encode_png(image, quality)
+  buffer = BytesIO()
+  image.save(buffer, format=extension, optimize=True, **encoder_params(extension, quality, effort))
+  return buffer.getvalue()
+
+# Function to reduce an image to an adaptive palette of at most colors colors (alpha kept)
+def quantize_image(image, colors):
+  has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+  if image.mode not in ("RGB", "RGBA"):
+    image = image.convert("RGBA" if has_alpha else "RGB")
+  # Median cut gives the better palettes but only handles RGB, fast octree also quantizes alpha
+  method = Image.Quantize.FASTOCTREE if image.mode == "RGBA" else Image.Quantize.MEDIANCUT
+  return image.quantize(colors=colors, method=method)
+
+# Function to encode a PNG at the highest zlib compression, on a palette of colors colors if given
+def encode_png(image, colors=None):
+  if colors is not None:
+    image = quantize_image(image, colors)
+  buffer = BytesIO()
+  image.save(buffer, format="png", optimize=True)
+  return buffer.getvalue()
 
-  base_dir = Path(__file__).resolve().parent.parent  # Go up two directories
+# Function to list lossless variants of an image that may encode smaller, in the order to try them
+def lossless_variants(image):
+  variants = [image]
+  # An alpha channel that is opaque everywhere stores nothing
+  if image.mode == "RGBA" and image.getchannel("A").getextrema() == (255, 255):
+    image = image.convert("RGB")
+    variants.append(image)
+  # At most 256 colors fit in a palette exactly
+  if image.mode in ("RGB", "RGBA") and image.getcolors(max_palette_colors) is not None:
+    palette = quantize_image(image, max_palette_colors)
+    if ImageChops.difference(palette.convert(image.mode), image).getbbox() is None:
+      variants.append(palette)
+  return variants
 
-  for image in images:
-    resize_size_percent = 75
-    user_is_info = False
-    # Full output path for the file
-    output_path_copy = base_dir / selected_output_path / image
+# Function to reduce a PNG below max_bytes without resizing it
+def search_png(image, max_bytes, min_colors):
+  """
+  Return (image, data, colors, attempts). Lossless variants are tried first (colors is None
+  when one fits), then the palette size is bisected between min_colors and 256. The returned
+  image is the lossless variant the palettes were built from, for a scale search that may follow.
+  """
+  variants = lossless_variants(image)
+  attempts, smallest_data = 0, None
+  for variant in variants:
+    data = encode_png(variant)
+    attempts += 1
+    if len(data) <= max_bytes:
+      return variant, data, None, attempts
+    smallest_data = data if smallest_data is None or len(data) < len(smallest_data) else smallest_data
 
-    # Ensure the output directory exists
-    output_path_copy.parent.mkdir(parents=True, exist_ok=True)
+  # Palettes are built from the last full-color variant, with fewer colors than the image already has
+  full_color = [variant for variant in variants if variant.mode != "P"]
+  if full_color:
+    source = full_color[-1]
+  else:
+    # A palette image has no full-color variant, its palettes are built from its RGB(A) pixels
+    source = image.convert("RGBA" if "transparency" in image.info else "RGB")
+  image_colors = source.getcolors(max_palette_colors)
+  max_colors = len(image_colors) - 1 if image_colors else max_palette_colors
+  if max_colors < min_colors:
+    return source, smallest_data, None, attempts
 
-    image_path = input_path / image  # Correct way to join paths
-    image_open = Image.open(image_path)
+  data, colors, more_attempts = search_quality(source, "png", max_bytes, min_colors, max_colors)
+  return source, data, colors, attempts + more_attempts
 
-    extension = os.path.splitext(image)[1][1:]
-    extension = "jpeg" if extension == "jpg" else extension
+# Function to bisect on quality for the best encoding that fits in max_bytes
+def search_quality(image, extension, max_bytes, min_quality, max_quality=max_encode_quality, effort=None):
+  """
+  Return (data, quality, attempts) for the highest quality in [min_quality, max_quality]
+  whose encoding fits in max_bytes. If none fits, data is the encoding at min_quality.
+  """
+  low, high = min_quality, max_quality
+  best_data, best_quality, attempts = None, None, 0
+  smallest_data = None
 
-    width, height = image_open.size
+  while low <= high:
+    quality = (low + high) // 2
+    data = encode_image(image, extension, quality, effort)
+    attempts += 1
 
-    quality = 100
-    min_quality_resize = 40
-    min_quality_no_resize = 20 if not can_resize else 5
-    min_quality = (min_quality_resize - 15) if not want_force else min_quality_no_resize
+    if len(data) <= max_bytes:
+      best_data, best_quality = data, quality
+      low = quality + 1
+    else:
+      smallest_data = data
+      high = quality - 1
 
-    if (width >= Image.MAX_IMAGE_PIXELS or height >= Image.MAX_IMAGE_PIXELS) and can_resize:
-      image_open = rescale_percent(image_open, 90)
-      image_open.save(output_path_copy, format=extension, quality=quality, optimize=True)
+  if best_data is None:
+    return smallest_data, min_quality, attempts
 
-    image_size = os.path.getsize(image_path) / 1024  # Size in KB
+  return best_data, best_quality, attempts
 
-    if image_size < max_size:
-      display_msg("Image " + str(image) + " already had a size below the specified KB limit. (Actual size: " + str(round(image_size, 2)) + " KB)", msg_allowed["INFO"], False)
-      user_is_info = True
+# Function to bisect on scale (percent) for the largest image that fits in max_bytes at a fixed quality
+def search_scale(image, extension, max_bytes, quality, min_scale=min_scale_percent, max_scale=99, effort=None):
+  """
+  Return (data, scale, attempts) for the largest scale in [min_scale, max_scale]
+  whose encoding fits in max_bytes. If none fits, data is the encoding at min_scale.
+  """
+  low, high = min_scale, max_scale
+  best_data, best_scale, attempts = None, None, 0
+  smallest_data = None
 
-    # If the size is greater than the maximum allowed, adjust the quality
-    while image_size > max_size and quality >= min_quality:
-        # Reduce the image quality by 5% per iteration
-        if can_resize and quality <= min_quality_resize:
-          if (resize_size_percent == 75):
-            image_open = rescale_percent(image_open, resize_size_percent)
-            resize_size_percent = 50
-          elif (resize_size_percent == 50):
-            image_open = rescale_percent(image_open, resize_size_percent)
-            resize_size_percent = 35
-          elif (resize_size_percent == 35):
-            resize_size_percent = 10
-            image_open = rescale_percent(image_open, resize_size_percent)
+  while low <= high:
+    scale = (low + high) // 2
+    data = encode_image(rescale_percent(image, scale), extension, quality, effort)
+    attempts += 1
 
-        quality -= 5
+    if len(data) <= max_bytes:
+      best_data, best_scale = data, scale
+      low = scale + 1
+    else:
+      smallest_data = data
+      high = scale - 1
 
-        # Save the image with the new quality
-        image_open.save(output_path_copy, format=extension, quality=quality, optimize=True)
+  if best_data is None:
+    return smallest_data, min_scale, attempts
 
-        # Check the file size again
-        image_size = os.path.getsize(output_path_copy) / (1024)  # Size in KB
+  return best_data, best_scale, attempts
 
-    if not user_is_info:
-      if image_size > max_size:
-        display_msg("Image " + str(image) + " could not reach the specified maximum size, it has been reduced to a weight of " + str(round(image_size, 2)) + " KB.", msg_allowed["WARNING"], False)
+# Function to measure the bytes an encoder spends on headers at a quality (subtracted from sample sizes)
+@lru_cache(maxsize=256)
+def header_bytes(mode, extension, quality, effort=None):
+  return len(encode_image(Image.new(mode, (8, 8)), extension, quality, effort))
+
+# Function to estimate the bits per pixel of a full encode at a quality from a few small crops
+def sample_bpp(crops, extension, quality, effort=None):
+  header = header_bytes(crops[0].mode, extension, quality, effort)
+  payload = sum(max(1, len(encode_image(crop, extension, quality, effort)) - header) for crop in crops)
+  return payload * 8 / sum(crop.width * crop.height for crop in crops)
+
+# Function to find the quality for max_bytes with the help of the quality model
+def search_predicted_quality(image, extension, max_bytes, min_quality, file_bytes, max_quality=max_encode_quality, effort=None):
+  """
+  Same result contract as search_quality, plus the log error of the first prediction:
+  returns (data, quality, attempts, first_error).
+
+  Qualities are chosen on cheap crop encodes corrected by the model; each full encode then
+  corrects this image's offset and teaches the model. After predicted_encodes full encodes
+  without a fitting one, the remaining quality range is bisected as before.
+  """
+  crops = quality_model.sample_crops(image)
+  pixels = image.width * image.height
+  predictions = {}
+
+  def predict(quality):
+    # (features, sample estimate in bytes, model prediction in bytes), computed once per quality
+    if quality not in predictions:
+      bpp = sample_bpp(crops, extension, quality, effort)
+      values = quality_model.features(pixels, file_bytes, bpp)
+      estimate = bpp * pixels / 8 + header_bytes(image.mode, extension, quality, effort)
+      predictions[quality] = (values, estimate, estimate * math.exp(quality_model.correction(extension, values)))
+    return predictions[quality]
+
+  def best_quality(low, high, offset):
+    # Highest quality in [low, high] predicted to fit, low if none is
+    found = low
+    while low <= high:
+      quality = (low + high) // 2
+      if predict(quality)[2] * math.exp(offset) <= max_bytes * prediction_margin:
+        found, low = quality, quality + 1
       else:
-        display_msg("Image " + str(image) + " now has a file size of " + str(round(image_size, 2)) + " KB.", msg_allowed["SUCCESS"], False)
+        high = quality - 1
+    return found
+
+  low, high = min_quality, max_quality
+  best_data, best_quality_found, smallest_data = None, None, None
+  attempts, offset, first_error = 0, 0.0, None
+
+  while attempts < predicted_encodes and low <= high:
+    quality = best_quality(low, high, offset)
+    data = encode_image(image, extension, quality, effort)
+    attempts += 1
+
+    values, estimate, predicted = predict(quality)
+    error = math.log(len(data) / (predicted * math.exp(offset)))
+    first_error = error if first_error is None else first_error
+    offset += error
+    quality_model.learn(extension, values, math.log(len(data) / estimate))
+
+    if len(data) <= max_bytes:
+      best_data, best_quality_found = data, quality
+      low = quality + 1
+      if len(data) >= max_bytes * good_enough_fill:
+        break
+    else:
+      smallest_data = data
+      high = quality - 1
+
+  if best_data is not None:
+    return best_data, best_quality_found, attempts, first_error
+
+  if low <= high:
+    data, quality, more_attempts = search_quality(image, extension, max_bytes, low, high, effort)
+    return data, quality, attempts + more_attempts, first_error
+  return smallest_data, min_quality, attempts, first_error
+
+# Function to find the scale for max_bytes from the size of an encode, bisecting only if two guesses miss
+def search_predicted_scale(image, extension, max_bytes, quality, full_bytes, max_scale=99, effort=None):
+  """
+  Same contract as search_scale. The encoded size is taken to follow scale ** exponent: the
+  exponent starts at scale_exponent (less than 2, downscaling packs more detail in each pixel)
+  and is refitted from the last two encodes after each miss.
+  """
+  attempts, high, exponent = 0, max_scale, scale_exponent
+  best_data, best_scale, smallest_data = None, None, None
+
+  last_scale, last_size = 100, full_bytes
+  while attempts < predicted_encodes:
+    scale = int(last_scale * (max_bytes * prediction_margin / last_size) ** (1 / exponent))
+    scale = max(min_scale_percent, min(high, scale))
+    data = encode_image(rescale_percent(image, scale), extension, quality, effort)
+    attempts += 1
+
+    if len(data) <= max_bytes:
+      best_data, best_scale = data, scale
+      break
+    if scale < last_scale and len(data) < last_size:
+      exponent = math.log(last_size / len(data)) / math.log(last_scale / scale)
+    smallest_data, high = data, scale - 1
+    last_scale, last_size = scale, len(data)
+    if high < min_scale_percent:
+      break
+
+  if best_data is not None:
+    return best_data, best_scale, attempts
+  if high >= min_scale_percent:
+    data, scale, more_attempts = search_scale(image, extension, max_bytes, quality, max_scale=high, effort=effort)
+    return data, scale, attempts + more_attempts
+  return smallest_data, min_scale_percent, attempts
+
+# Function to encode an image in memory below max_size (in KB), returns (data, attempts)
+def encode_to_size(image_open, extension, max_size, can_resize, want_force, file_bytes=None, effort=None):
+  width, height = image_open.size
+
+  min_quality_resize = 40
+  min_quality_no_resize = 20 if not can_resize else 5
+  min_quality = (min_quality_resize - 15) if not want_force else min_quality_no_resize
+
+  if (width >= Image.MAX_IMAGE_PIXELS or height >= Image.MAX_IMAGE_PIXELS) and can_resize:
+    image_open = rescale_percent(image_open, 90)
+
+  max_bytes = max_size * 1024
+
+  # With the quality model (see compress), start from predicted settings instead of bisecting blind
+  predict = quality_model.is_active() and extension in predicted_formats and file_bytes is not None
+
+  # Search on quality first, the image keeps its dimensions if any quality fits
+  if extension == "png":
+    min_quality = png_min_colors_forced if want_force else png_min_colors
+    min_quality_resize = png_resize_colors
+    image_open, data, quality, attempts = search_png(image_open, max_bytes, min_quality)
+  elif predict:
+    data, quality, attempts, first_error = search_predicted_quality(image_open, extension, max_bytes, min_quality, file_bytes, effort=effort)
+  else:
+    data, quality, attempts = search_quality(image_open, extension, max_bytes, min_quality, effort=effort)
+
+  # Then search on scale at a fixed quality when resizing is allowed
+  if len(data) > max_bytes and can_resize:
+    resize_quality = max(min_quality, min_quality_resize)
+    if predict:
+      full_bytes = len(data) if quality == resize_quality else len(encode_image(image_open, extension, resize_quality, effort))
+      data, scale, scale_attempts = search_predicted_scale(image_open, extension, max_bytes, resize_quality, full_bytes, effort=effort)
+      scale_attempts += quality != resize_quality
+    else:
+      data, scale, scale_attempts = search_scale(image_open, extension, max_bytes, resize_quality, effort=effort)
+    attempts += scale_attempts
+
+  if predict:
+    quality_model.record_outcome(attempts, first_error)
+
+  return data, attempts
+
+# Function to encode an image already in memory under max_size KB, returns (bytes, extension, encode attempts)
+def reduce_image(image_open, extension, max_size, can_resize, want_force, output_format=None, file_bytes=None, effort=None):
+  """extension is the format of the source ("jpeg", "png"...), output_format (e.g. "WEBP") converts to another one."""
+  if output_format is not None:
+    extension = output_format.lower()
+    with stage("transform"):
+      image_open = prepare_for(image_open, output_format)
+
+  # The search is made of encodes, any rescale in between is counted with them
+  with stage("encode"):
+    data, attempts = encode_to_size(image_open, extension, max_size, can_resize, want_force, file_bytes=file_bytes, effort=effort)
+  return data, extension, attempts
+
+# Function to reduce a single image below max_size (in KB), returns the output path if one was written
+def compress_image(input_path, output_dir, can_resize, want_force, max_size, model_dir, output_format, effort, image):
+  """output_format (e.g. "WEBP") re-encodes in another format, None keeps the format of the source."""
+  extension = os.path.splitext(image)[1][1:].lower()
+  extension = "jpeg" if extension == "jpg" else extension
+  converting = output_format is not None and output_format.lower() != extension
+
+  # Full output path for the file
+  output_path_copy = output_dir / (Path(image).with_suffix(f".{output_format.lower()}") if converting else image)
+
+  image_path = input_path / image  # Correct way to join paths
+  image_size = os.path.getsize(image_path) / 1024  # Size in KB
+
+  if image_size < max_size and not converting:
+    display_msg("Image " + str(image) + " already had a size below the specified KB limit. (Actual size: " + str(round(image_size, 2)) + " KB)", msg_allowed["INFO"], False)
+    return None
+
+  image_open = load_image(open_image(image_path))
+
+  if model_dir:
+    quality_model.use(model_dir)  # Loaded once per process
+
+  data, extension, attempts = reduce_image(image_open, extension, max_size, can_resize, want_force, output_format if converting else None, int(image_size * 1024), effort)
+
+  # Write the winning bytes once
+  write_bytes(output_path_copy, data)
+  image_size = len(data) / 1024  # Size in KB
+
+  if image_size > max_size:
+    display_msg("Image " + str(image) + " could not reach the specified maximum size, it has been reduced to a weight of " + str(round(image_size, 2)) + " KB after " + str(attempts) + " encode attempts.", msg_allowed["WARNING"], False)
+  else:
+    display_msg("Image " + str(image) + " now has a file size of " + str(round(image_size, 2)) + " KB after " + str(attempts) + " encode attempts.", msg_allowed["SUCCESS"], False)
+
+  return str(output_path_copy)
@@ -0,0 +1,161 @@
+import hashlib
+import os
+import shutil
+import time
+from PIL import Image
+from .manifest import content_hash
+from .utils import ensure_parent_dir, display_msg
+from .variables import msg_allowed
+
+# Duplicate inputs are processed once: the first image of each group goes through the operation and
+# the others get its outputs, hard-linked or copied under their own names. Images are still streamed:
+# a duplicate is recognized against the images seen before it, so the batch starts right away.
+
+dedup_modes = ("content", "pixels", "perceptual")
+link_modes = ("hardlink", "copy")
+
+# Side of the grey thumbnail the perceptual hash is computed on (one bit per pair of neighbours)
+hash_size = 8
+
+# Function to hash the decoded pixels of an image (same pixels in another file or format)
+def pixel_hash(path):
+    with Image.open(path) as img:
+        digest = hashlib.sha256(f"{img.mode} {img.width}x{img.height}".encode())
+        digest.update(img.tobytes())
+    return digest.hexdigest()
+
+# Function to compute the difference hash (dHash) of an image, a 64-bit int
+def perceptual_hash(path):
+    with Image.open(path) as img:
+        # JPEGs are decoded at a fraction of their size, large enough that the hash barely depends on it
+        img.draft("L", (hash_size * 32, hash_size * 32))
+        pixels = list(img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BOX).getdata())
+    bits = 0
+    for row in range(hash_size):
+        for column in range(hash_size):
+            left, right = pixels[row * (hash_size + 1) + column], pixels[row * (hash_size + 1) + column + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+# Function to start a dedup plan, filled by dedup_images and used by fan_out
+def new_plan(input_dir, mode, distance=4, link="hardlink"):
+    return {"input_dir": input_dir, "mode": mode, "distance": distance, "link": link, "entries": [], "seen": {}, "perceptual": [], "started": time.perf_counter()}
+
+# Function to find the image an input duplicates, None if it is the first of its kind
+def find_duplicate(plan, path):
+    if plan["mode"] == "perceptual":
+        key = perceptual_hash(path)
+        for other, image in plan["perceptual"]:
+            if bin(key ^ other).count("1") <= plan["distance"]:
+                return image, key
+        return None, key
+
+    key = pixel_hash(path) if plan["mode"] == "pixels" else content_hash(path)
+    return plan["seen"].get(key), key
+
+# Function to yield the images that aren't duplicates of an image already yielded
+def dedup_images(images, plan):
+    """plan["entries"] lists (image, original) in input order, original None for the images yielded."""
+    for image in images:
+        try:
+            original, key = find_duplicate(plan, os.path.join(plan["input_dir"], image))
+        except Exception as e:
+            # Unreadable here means unreadable for the operation too, which reports it
+            display_msg(f"Could not hash {image} for deduplication: {e}", msg_allowed["WARNING"], False)
+            original, key = None, None
+
+        plan["entries"].append((image, original))
+        if original is not None:
+            continue
+
+        if key is not None:
+            if plan["mode"] == "perceptual":
+                plan["perceptual"].append((key, image))
+            else:
+                plan["seen"][key] = image
+        yield image
+
+# Function to get the output path of a duplicate from the output path of its original
+def duplicate_output(output, original, duplicate):
+    """
+    out/dir/photo_128px.jpeg for dir/photo.jpg becomes out/other/copy_128px.jpeg for other/copy.png:
+    the output keeps the format of the processed image, so only its name changes.
+    """
+    output = os.path.normpath(output)
+    original_stem, original_extension = os.path.splitext(os.path.normpath(original))
+    duplicate_stem, duplicate_extension = os.path.splitext(os.path.normpath(duplicate))
+
+    position = output.rfind(original_stem)
+    if position < 0 or (position > 0 and output[position - 1] != os.sep):
+        return None
+    tail = output[position + len(original_stem):]
+    extensions = Image.registered_extensions()
+    if tail == original_extension and extensions.get(tail.lower()) == extensions.get(duplicate_extension.lower()):
+        tail = duplicate_extension  # Same format (e.g. .jpg and .jpeg), keep the name of the duplicate
+    return output[:position] + duplicate_stem + tail
+
+# Function to hard-link (or copy) an output to the path of a duplicate
+def link_output(source, target, link):
+    ensure_parent_dir(target)
+    if os.path.lexists(target):
+        os.remove(target)
+    if link == "hardlink":
+        try:
+            os.link(source, target)
+            return
+        except OSError:
+            pass  # Another filesystem or no hard links there, copy instead
+    shutil.copyfile(source, target)
+
+# Function to give every duplicate the outputs of its original, returns the results of all inputs in order
+def fan_out(plan, results):
+    """results are those of the images dedup_images yielded, in order. Duplicates of a failed image get None."""
+    elapsed = time.perf_counter() - plan["started"]
+    unique_results = iter(results)
+    by_image = {}
+    all_results = []
+    stats = {"inputs": 0, "duplicates": 0, "linked": 0, "bytes_skipped": 0, "groups": set()}
+
+    for image, original in plan["entries"]:
+        stats["inputs"] += 1
+        if original is None:
+            by_image[image] = next(unique_results, None)
+            all_results.append(by_image[image])
+            continue
+
+        stats["duplicates"] += 1
+        stats["groups"].add(original)
+        stats["bytes_skipped"] += os.path.getsize(os.path.join(plan["input_dir"], image))
+
+        result = by_image.get(original)
+        if result is None:
+            all_results.append(None)
+            continue
+
+        outputs = []
+        for output in (result if isinstance(result, list) else [result]):
+            target = duplicate_output(output, original, image)
+            try:
+                if target is None:
+                    raise ValueError(f"no output name for {image} from {output}")
+                link_output(output, target, plan["link"])
+                outputs.append(target)
+                stats["linked"] += 1
+            except (OSError, ValueError) as e:
+                display_msg(f"Could not give {image} the output of its duplicate {original}: {e}", msg_allowed["ERROR"], False)
+                outputs = None
+                break
+        all_results.append(outputs if outputs is None or isinstance(result, list) else outputs[0])
+
+    # Time saved: the duplicates would have cost about as much as the images actually processed
+    processed = stats["inputs"] - stats["duplicates"]
+    stats["seconds_saved"] = elapsed / processed * stats["duplicates"] if processed else 0.0
+    stats["groups"] = len(stats["groups"])
+    plan["stats"] = stats
+    return all_results
+
+# Function to describe the work dedup saved, in one line
+def summary_line(stats):
+    share = stats["duplicates"] / stats["inputs"] if stats["inputs"] else 0
+    return (f"Deduplication: {stats['duplicates']} of {stats['inputs']} inputs ({share:.0%}) were duplicates of {stats['groups']} images and were not processed, "
+            f"{stats['linked']} outputs linked or copied, about {stats['seconds_saved']:.1f}s and {stats['bytes_skipped'] / 1024 ** 2:.1f} MB of input saved")
@@ -0,0 +1,43 @@
+from fnmatch import fnmatch
+import os
+from .variables import valid_extensions
+
+# Function to tell if a relative path (or its file name) matches any of the glob patterns
+def matches_any(relative_path, patterns):
+    name = relative_path.rsplit("/", 1)[-1]
+    return any(fnmatch(relative_path, pattern) or fnmatch(name, pattern) for pattern in patterns)
+
+# Function to find the images of a directory lazily, as they are found
+def iter_images(input_dir, recursive=False, include=None, exclude=None, skip_dirs=()):
+    """
+    Yield image paths relative to input_dir ("sub/dir/photo.jpg") using os.scandir, so nothing
+    waits for the whole listing and no extra stat call is made per entry on most filesystems.
+
+    include/exclude are glob patterns matched against the relative path and the file name;
+    excluded directories are not entered. Directories in skip_dirs (e.g. the output directory
+    when it lives inside the input) are never entered either.
+    """
+    include = include or []
+    exclude = exclude or []
+    skip_dirs = {os.path.abspath(path) for path in skip_dirs}
+    pending_dirs = [""]
+
+    while pending_dirs:
+        relative_dir = pending_dirs.pop()
+        with os.scandir(os.path.join(input_dir, relative_dir)) as entries:
+            for entry in entries:
+                relative_path = relative_dir + entry.name
+
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive and not matches_any(relative_path, exclude) and os.path.abspath(entry.path) not in skip_dirs:
+                        pending_dirs.append(relative_path + "/")
+                    continue
+
+                if not entry.is_file() or os.path.splitext(entry.name)[1].lower() not in valid_extensions:
+                    continue
+                if include and not matches_any(relative_path, include):
+                    continue
+                if exclude and matches_any(relative_path, exclude):
+                    continue
+
+                yield relative_path
@@ -0,0 +1,139 @@
+from concurrent.futures import wait, FIRST_COMPLETED
+from collections import deque
+from functools import partial
+import argparse
+import warnings
+import os
+from PIL import Image
+from .utils import display_msg
+from .variables import msg_allowed
+from . import profiler, staging, outputs
+
+# Number of tasks kept in flight per worker so the pool never runs dry
+queue_depth_per_job = 2
+
+# Function to turn a --jobs value ("auto" or a positive number) into a worker count
+def resolve_jobs(value):
+    """Return the number of worker processes for a --jobs value."""
+    if value is None:
+        return 1
+    if str(value).lower() == "auto":
+        return os.cpu_count() or 1
+
+    jobs = int(value)
+    if jobs < 1:
+        raise ValueError("The number of jobs must be 1 or greater")
+    return jobs
+
+# argparse type for --jobs
+def jobs_argument(value):
+    try:
+        return resolve_jobs(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid value '{value}': use a positive number or 'auto'")
+
+# Per-worker Pillow state, set once when a worker process starts
+def init_worker(profile_settings=None, cache_settings=None, output_settings=None):
+    warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+    Image.init()  # Load every format plugin up front instead of on the first image
+    if output_settings is not None:
+        outputs.settings.update(output_settings)
+    if profile_settings is not None:
+        profiler.enable(**profile_settings)
+    if cache_settings is not None:
+        from . import result_cache
+        result_cache.settings = cache_settings
+
+# Run one item, isolating any error so the rest of the batch keeps going
+def run_item(func, item):
+    try:
+        return func(item)
+    except Exception as e:
+        display_msg(f"Error processing image {', '.join(map(str, staging.images_of(item)))}: {e}", msg_allowed["ERROR"], False)
+        return None
+
+# Run one item with its stages timed, returns (result, profile record)
+def run_profiled_item(func, item):
+    worker = func.args[0] if isinstance(func, partial) and func.func.__name__ == "run_cached" else func  # Behind the result cache
+    operation = getattr(worker, "func", worker).__name__  # The worker function behind the partial
+    return profiler.profile_item(partial(run_item, func), item, operation)
+
+# Function to run func(item) over every item, serially or in a process pool
+def run_batch(func, items, jobs=1, ordered=True, input_dir=None, output_dir=None, on_result=None):
+    """
+    Apply func to every item and return the list of results.
+
+    With jobs > 1 the items are spread over a process pool; func must then be
+    picklable (a module-level function or a functools.partial of one).
+    Items are submitted lazily, so at most a few tasks per worker are queued.
+    With ordered=False results are collected as soon as they finish.
+    A failing item is reported and yields None instead of stopping the batch.
+
+    Serial batches given their input_dir use staging when it is on: the next inputs
+    are read ahead and the outputs written behind while the current image is processed.
+
+    Batches given their input_dir and output_dir go through the result cache when it is on.
+
+    on_result, if given, is called in this process with each result as soon as it is collected.
+
+    With fsync on, the directories of the outputs are flushed once, when the batch is done.
+    """
+    jobs = resolve_jobs(jobs)
+    from . import result_cache  # Imported here, as multiprocessing below, to keep it out of the CLI startup
+    if result_cache.is_enabled() and input_dir is not None and output_dir is not None:
+        func = partial(result_cache.run_cached, func, input_dir, output_dir)
+    profiling = profiler.is_enabled()
+
+    # With profiling on, every task returns (result, record) and the records are kept in this process
+    task = run_profiled_item if profiling else run_item
+
+    def collect(value):
+        if profiling:
+            value, record = value
+            profiler.records.append(record)
+        if on_result is not None:
+            on_result(value)
+        return value
+
+    if jobs == 1:
+        if staging.is_enabled() and input_dir is not None:
+            with staging.staged(items, input_dir) as staged_items:
+                results = [collect(task(func, item)) for item in staged_items]
+            result_cache.store_pending(staging.failed_paths)  # Outputs written behind are on disk now
+            results = staging.drop_failed(results)
+        else:
+            results = [collect(task(func, item)) for item in items]
+        outputs.sync_dirs()
+        return results
+
+    # Imported here: loading multiprocessing costs every --jobs 1 run a few milliseconds
+    from concurrent.futures import ProcessPoolExecutor
+
+    results = []
+    max_pending = jobs * queue_depth_per_job
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(profiler.settings, result_cache.settings, outputs.settings)) as pool:
+        pending = deque() if ordered else set()
+
+        for item in items:
+            future = pool.submit(task, func, item)
+
+            if ordered:
+                pending.append(future)
+                if len(pending) >= max_pending:
+                    results.append(collect(pending.popleft().result()))
+            else:
+                pending.add(future)
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    results.extend(collect(f.result()) for f in done)
+
+        if ordered:
+            results.extend(collect(f.result()) for f in pending)
+        else:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                results.extend(collect(f.result()) for f in done)
+
+    outputs.sync_dirs(results)  # The workers renamed the outputs, their directories are flushed here
+    return results
@@ -1,11 +1,16 @@
-from PIL import Image
 from .variables import msg_allowed
-from .utils import display_msg
+from .utils import display_msg, ensure_parent_dir
+from .executor import run_batch
+from .tiled import use_strips, tiled_map
+from .fileio import open_image, load_image, save_image
+from .profiler import stage
+from .formats import encoder_params, prepare_for
+from functools import partial
 from pathlib import Path
+import os
 import re
 
-def new_format(input_path, selected_output_path, images, new_format, change_name, base_name="none", default_start=1):
-  i = 0
+def new_format(input_path, selected_output_path, images, new_format, change_name, base_name="none", default_start=1, jobs=1, memory_limit=None, quality=None, effort=None):
   # Extract starting index if provided in the base_name
   start_match = re.search(r"--START\s+(\d+)", base_name)
   start_index = int(start_match.group(1)) if start_match else default_start
@@ -16,22 +21,36 @@ def new_format(input_path, selected_output_path, images, new_format, change_name
   input_path = Path(input_path)  # Convert to Path object
   selected_output_path = Path(selected_output_path)  # Convert to Path object
 
-  for image in images:
-    if new_format not in image:
-      try:
-        # Open the image
-        image_path = input_path / image  # Correct way to join paths
-        with Image.open(image_path) as img:
-          # Generate the new file name
-          index = start_index + i
-          new_file_name = f"{base_name_cleaned}{index}.{new_format.lower()}" if change_name else f"{image.split('.')[0]}.{new_format.lower()}"
-
-          # Save the image in the new format
-          img.convert("RGB").save(selected_output_path/new_file_name, format=new_format.upper())
-          display_msg(f"Image {image}: Converted to {new_format} and saved to {selected_output_path}", msg_allowed["SUCCESS"], False)
-      except Exception as e:
-          display_msg(f"Error processing image {image}: {e}", msg_allowed["ERROR"], False)
-    else:
-      display_msg(f"Image {image} already has format {new_format}", msg_allowed["INFO"], False)
+  # The index is fixed per image up front so renamed files keep their order in parallel runs
+  worker = partial(convert_image, input_path, selected_output_path, new_format, change_name, base_name_cleaned, memory_limit, encoder_params(new_format, quality, effort))
+  return run_batch(worker, enumerate(images, start_index), jobs, input_dir=input_path, output_dir=selected_output_path)
+
+# Function to convert a single (index, image) pair, returns the output path if one was written
+def convert_image(input_path, selected_output_path, new_format, change_name, base_name_cleaned, memory_limit, save_params, indexed_image):
+  """save_params are the encoder settings of the new format (quality, effort), see formats.encoder_params."""
+  index, image = indexed_image
+
+  if new_format in image:
+    display_msg(f"Image {image} already has format {new_format}", msg_allowed["INFO"], False)
+    return None
 
-    i += 1
+  # Open the image
+  image_path = input_path / image  # Correct way to join paths
+  with open_image(image_path) as img:
+    # Generate the new file name
+    image_dir, image_name = os.path.split(image)
+    new_file_name = os.path.join(image_dir, f"{base_name_cleaned}{index}.{new_format.lower()}" if change_name else f"{image_name.split('.')[0]}.{new_format.lower()}")
+
+    # Save the image in the new format
+    if use_strips(img, image, memory_limit):
+      # Converted strip by strip, without decoding the whole image
+      ensure_parent_dir(selected_output_path/new_file_name)
+      with stage("transform"):
+        tiled_map(image_path, selected_output_path/new_file_name, new_format.upper(), 0, lambda strip: prepare_for(strip, new_format), memory_limit, save_params)
+    else:
+      load_image(img)
+      with stage("transform"):
+        converted_img = prepare_for(img, new_format)
+      save_image(converted_img, selected_output_path/new_file_name, new_format.upper(), **save_params)
+  display_msg(f"Image {image}: Converted to {new_format} and saved to {selected_output_path}", msg_allowed["SUCCESS"], False)
+  return str(selected_output_path/new_file_name)
@@ -0,0 +1,42 @@
+from PIL import Image
+from io import BytesIO
+import os
+from .outputs import write_file
+from .profiler import stage
+from .staging import take_prefetched, queue_write
+
+# Function to open an image (reads the header only, pixels are decoded by load_image)
+def open_image(image_path):
+    with stage("decode"):
+        data = take_prefetched(image_path)  # Bytes already read by a staging reader thread
+        return Image.open(BytesIO(data) if data is not None else image_path)
+
+# Function to decode the pixels of an opened image
+def load_image(img):
+    with stage("decode"):
+        img.load()
+    return img
+
+# Function to get the Pillow format of an output path ("photo.jpg" -> "JPEG")
+def format_for(output_path):
+    return Image.registered_extensions().get(os.path.splitext(str(output_path))[1].lower())
+
+# Function to encode an image in memory, returns the file bytes
+def encode_image_bytes(img, format, **params):
+    with stage("encode"):
+        buffer = BytesIO()
+        img.save(buffer, format=format, **params)
+        return buffer.getvalue()
+
+# Function to write the bytes of an output file (atomically, see outputs), creating its directory if needed
+def write_bytes(output_path, data):
+    with stage("write"):
+        if queue_write(output_path, data):
+            return  # Written behind by the staging writer thread
+        write_file(output_path, data)
+
+# Function to save an image: encode in memory, then write the file in one go
+def save_image(img, output_path, format=None, **params):
+    """Like img.save(output_path, format, **params), with the encode and the write timed apart."""
+    data = encode_image_bytes(img, format or format_for(output_path), **params)
+    write_bytes(output_path, data)
@@ -0,0 +1,50 @@
+from PIL import Image
+
+# Output formats offered by convert, reduce and the pipeline. AVIF needs a Pillow build with
+# libavif (Pillow 11.2+) or the pillow-avif-plugin package, see can_save().
+output_formats = ("JPEG", "PNG", "BMP", "WEBP", "AVIF")
+
+# Formats whose file size follows a quality setting (0-100)
+lossy_formats = ("JPEG", "WEBP", "AVIF")
+
+# Encoder effort goes from 0 (fastest) to max_effort (smallest files), as WebP's "method".
+# AVIF's "speed" goes the other way, from 10 (fastest) to 0.
+max_effort = 6
+
+# Function to tell if the local Pillow build can write a format
+def can_save(format):
+    format = format.upper()
+    Image.init()
+    if format == "AVIF" and "AVIF" not in Image.SAVE:
+        try:
+            import pillow_avif  # noqa: F401 (optional, registers the AVIF plugin)
+        except ImportError:
+            return False
+    return format in Image.SAVE
+
+# Function to list the output formats the local Pillow build can write
+def available_output_formats():
+    return [format for format in output_formats if can_save(format)]
+
+# Function to get the save() parameters of a format for a quality (0-100) and an effort (0-max_effort)
+def encoder_params(format, quality=None, effort=None):
+    """Settings left to None keep the encoder defaults (WebP method 4, AVIF speed 6)."""
+    format = format.upper()
+    params = {}
+    if quality is not None:
+        params["quality"] = quality
+    if effort is not None:
+        if format == "WEBP":
+            params["method"] = effort
+        elif format == "AVIF":
+            params["speed"] = round(10 - effort * 10 / max_effort)
+    return params
+
+# Function to convert an image to a mode the output format can store
+def prepare_for(image, format):
+    """WebP and AVIF keep the alpha channel, other formats get RGB as convert always did."""
+    target = "RGB"
+    if format.upper() in ("WEBP", "AVIF") and (image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info):
+        target = "RGBA"
+    return image if image.mode == target else image.convert(target)
+
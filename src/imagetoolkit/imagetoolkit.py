@@ -85,28 +85,31 @@ imagetoolkit/
 
 '''
 
-import questionary
-import warnings
-from PIL import Image
-from time import sleep
-import os, sys
-
-# Internal imports for image manipulation, options, and utility functions
-from .utils import welcome, select_option, ask_for_path, ask_for_images, qselect, display_msg
-from .compress import compress
-from .extension import new_format
-from .variables import style, options_main_menu, allowed_limits_kb, msg_allowed, available_filters
-from .color import apply_filter_to_images
-from .rescale import thumbnails, process_images_resize
-from .addtext import get_available_fonts, add_text_to_image
-from .cli import cli
+import sys
 
 # Main function to run the interactive application
 def run_interactive_app():
+  # The interactive stack (questionary, prompt_toolkit) and the operations are only imported here,
+  # so `imagetoolkit <command> ...` starts without them
+  import questionary
+  import warnings
+  from PIL import Image
+  from time import sleep
+
+  # Internal imports for image manipulation, options, and utility functions
+  from .utils import welcome, select_option, ask_for_path, ask_for_images, qselect, display_msg
+  from .compress import compress
+  from .extension import new_format
+  from .formats import available_output_formats
+  from .variables import style, options_main_menu, allowed_limits_kb, msg_allowed, available_filters
+  from .color import apply_filter_to_images
+  from .rescale import thumbnails, thumbnail_pyramid, process_images_resize
+  from .addtext import get_available_fonts, add_text_to_image
+
   # Variables to store user selections
   images_selected = []  # List of selected images
   option_menu = ""  # Menu option selected by user
-  format_selected = ""  # Selected image format (JPEG, PNG, BMP)
+  format_selected = ""  # Selected image format (JPEG, PNG, BMP, WEBP...)
   selected_path = ""  # Path to the images
   selected_output_path = "" # Output images
   base_name = ""  # Base name for renaming images (if applicable)
@@ -207,7 +210,7 @@ def run_interactive_app():
         # If the user chose the "Convert file format" option
         elif option_menu == options_main_menu["FORMATS"]:
           # Ask the user to select the format they want to convert the images to
-          format_selected = qselect("Select the format to convert to:", ["JPEG", "PNG", "BMP"])
+          format_selected = qselect("Select the format to convert to:", available_output_formats())
 
           # Ask if the user wants to rename the files during conversion
           change_name = qselect("Do you want to rename the files?", ["Yes", "No"])
@@ -293,7 +296,8 @@ def run_interactive_app():
         # If the user chose to create thumbnails
         elif option_menu == options_main_menu["THUMBNAILS"]:
           # Ask for the desired thumbnail size
-          thumbnail_size = qselect("Choose the desired size for your favicon or thumbnail:", ["16px", "24px", "32px", "48px", "64px", "92px", "128px"])
+          thumbnail_choices = ["16px", "24px", "32px", "48px", "64px", "92px", "128px"]
+          thumbnail_size = qselect("Choose the desired size for your favicon or thumbnail:", thumbnail_choices + ["All sizes (one multi-resolution favicon)"])
 
           # Ask if the user wants to convert the images to .ICO format for favicons
           want_favicon = qselect(
@@ -301,8 +305,11 @@ def run_interactive_app():
             ["Yes", "No"]
           ).lower()
 
-          # Call the function to create the thumbnails
-          thumbnails(selected_path, selected_output_path, images_selected, want_favicon, thumbnail_size)
+          # Call the function to create the thumbnails, every size from a single decode if all were chosen
+          if thumbnail_size in thumbnail_choices:
+            thumbnails(selected_path, selected_output_path, images_selected, want_favicon, thumbnail_size)
+          else:
+            thumbnail_pyramid(selected_path, selected_output_path, images_selected, want_favicon, thumbnail_choices)
 
       sleep(1)  # Give the user a moment to see the results before the app loops again
 
@@ -317,6 +324,7 @@ def main():
 
     # Verify args
     if len(sys.argv) > 1:
+      from .cli import cli
       cli()  # Script executing cli args mode
     else:
       # Script executing interactuve cli mode
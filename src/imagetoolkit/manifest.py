@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+from .outputs import write_file, sync_dirs
+
+# File kept in the output directory by --incremental runs
+manifest_name = ".imagetoolkit-manifest.json"
+manifest_version = 1
+
+# Arguments that change the outputs of each command. The others (--jobs, --prefetch, --cache, --dedup,
+# --memory-limit, --engine...) only change how the images are processed, not the files written
+operation_arguments = {
+    "reduce": ("max_size", "resize", "quality", "format", "effort"),
+    "resize": ("mode", "dimensions", "percentage"),
+    "convert": ("format", "quality", "effort", "rename", "basename"),
+    "filter": ("filter", "fuse"),
+    "add-text": ("text", "font", "size", "color", "position"),
+    "thumbnails": ("size", "sizes", "favicon"),
+    "pipeline": ("step",),
+    "watch": ("step",),
+}
+
+# Function to load the manifest of an output directory (empty if missing or unreadable)
+def load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, manifest_name), encoding="utf-8") as file:
+            manifest = json.load(file)
+        if manifest.get("version") == manifest_version:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {"version": manifest_version, "entries": {}}
+
+# Function to save the manifest, replacing the previous one atomically
+def save_manifest(output_dir, manifest):
+    write_file(os.path.join(output_dir, manifest_name), json.dumps(manifest, indent=1, sort_keys=True).encode("utf-8"))
+    sync_dirs()  # With fsync on, the manifest is on disk once saved, after the outputs it lists
+
+# Function to hash the content of a file
+def content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Function to describe an input file cheaply (size and mtime, plus its content hash if asked)
+def fingerprint(path, with_hash=False):
+    stat = os.stat(path)
+    result = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if with_hash:
+        result["sha256"] = content_hash(path)
+    return result
+
+# Function to build the canonical description of the operation from the parsed CLI arguments
+def operation_from_args(args):
+    operation = {"command": args.command}
+    operation.update((key, getattr(args, key)) for key in operation_arguments[args.command])
+    return json.loads(json.dumps(operation, sort_keys=True))  # tuples become lists, as they are stored
+
+# Function to tell if an input was already processed with the same operation and its outputs still exist
+def is_up_to_date(entry, input_file, current, operation, with_hash):
+    if not entry or entry.get("operation") != operation:
+        return False
+    if not all(os.path.exists(output) for output in entry.get("outputs", [])):
+        return False
+
+    stored = entry.get("fingerprint", {})
+    if current["size"] != stored.get("size"):
+        return False
+    if current["mtime_ns"] == stored.get("mtime_ns"):
+        return True
+
+    # Same size but touched: with --hash the content decides
+    if with_hash and "sha256" in stored and content_hash(input_file) == stored["sha256"]:
+        stored["mtime_ns"] = current["mtime_ns"]  # Remember the new mtime so the next run skips the hash
+        return True
+    return False
+
+# Function to yield only the images that need processing, counting the skipped ones in plan
+def pending_images(manifest, input_dir, images, operation, with_hash, plan):
+    """
+    Lazily filter images against the manifest, without decoding any of them.
+    plan is a dict updated in place: plan["skipped"] counts the up-to-date images and
+    plan["processed"] lists (image, fingerprint) for the others, in the order they are yielded.
+    The fingerprint is taken before processing, so a file changed mid-run is processed again next time.
+    """
+    entries = manifest["entries"]
+    for image in images:
+        input_file = os.path.join(input_dir, image)
+        current = fingerprint(input_file)
+
+        if is_up_to_date(entries.get(image), input_file, current, operation, with_hash):
+            plan["skipped"] += 1
+            continue
+
+        if with_hash:
+            current["sha256"] = content_hash(input_file)
+        plan["processed"].append((image, current))
+        yield image
+
+# Function to store the results of a run in the manifest
+def record_results(manifest, plan, results, operation):
+    """Results are aligned with plan["processed"]; images whose result is None (error or nothing written) are not recorded."""
+    for (image, current), result in zip(plan["processed"], results):
+        if result is None:
+            manifest["entries"].pop(image, None)
+            continue
+
+        outputs = result if isinstance(result, list) else [result]
+        manifest["entries"][image] = {
+            "fingerprint": current,
+            "operation": operation,
+            "outputs": [os.path.abspath(output) for output in outputs],
+        }
@@ -0,0 +1,92 @@
+from PIL import Image, ImageOps
+from functools import lru_cache
+
+try:
+    import numpy  # Optional: without it every filter runs on the Pillow engine
+except ImportError:
+    numpy = None
+
+# NumPy engine for the colour filters: each filter is one vectorized operation on the pixel array,
+# with no intermediate Pillow images or mode conversions in between. Images of the same size and
+# mode can be stacked and filtered as one array (see filter_images).
+#
+# The operations reproduce Pillow's integer arithmetic (the RGB -> L weights, the colorize table,
+# the float32 blend of ImageEnhance.Color), so the results match the Pillow engine bit for bit.
+# Only L and RGB images whose filters are all in vector_filters run here, anything else is left
+# to the Pillow engine.
+
+engines = ("pillow", "numpy")
+
+# Filters the NumPy engine runs
+vector_filters = ("SEPIA", "INVERT", "GRAYSCALE", "POSTERIZE", "SOLARIZE", "SATURATION_INC", "SATURATION_DEC")
+
+saturation_factors = {"SATURATION_INC": 1.5, "SATURATION_DEC": 0.7}
+
+# Function to tell if NumPy is installed
+def is_available():
+    return numpy is not None
+
+# Function to tell if the NumPy engine can run these filters on an image of this mode
+def can_run(filter_names, mode):
+    return numpy is not None and mode in ("L", "RGB") and all(name in vector_filters for name in filter_names)
+
+# Function to convert RGB pixels to grey levels as Pillow's convert("L") does (ITU-R 601-2 luma, rounded)
+def to_gray(pixels):
+    red, green, blue = (pixels[..., band].astype(numpy.uint32) for band in range(3))
+    red *= 19595
+    red += green * 38470
+    red += blue * 7471
+    red += 0x8000
+    red >>= 16
+    return red.astype(numpy.uint8)
+
+def to_rgb(gray):
+    return numpy.repeat(gray[..., None], 3, axis=-1)
+
+# Table of the sepia colours, measured on Pillow's own colorize so the rounding is the same
+@lru_cache(maxsize=1)
+def sepia_table():
+    ramp = Image.frombytes("L", (256, 1), bytes(range(256)))
+    colorized = ImageOps.colorize(ramp, black="#704214", white="#C0A080")
+    return numpy.asarray(colorized).reshape(256, 3)
+
+# Function to blend towards the grey level as ImageEnhance.Color does (float32, truncated)
+def saturate(pixels, factor):
+    gray = to_gray(pixels).astype(numpy.float32)[..., None]
+    blended = pixels.astype(numpy.float32)
+    blended -= gray
+    blended *= numpy.float32(factor)
+    blended += gray
+    numpy.clip(blended, 0, 255, out=blended)
+    return blended.astype(numpy.uint8)
+
+# Function to run the filters on an array of pixels: (..., height, width) for L, (..., height, width, 3) for RGB
+def filter_array(pixels, filter_names, is_gray):
+    """The leading dimensions are free, so a stack of images is filtered in the same operations."""
+    for name in filter_names:
+        if name == "GRAYSCALE":
+            pixels = pixels if is_gray else to_gray(pixels)
+            is_gray = True
+        elif name == "SEPIA":
+            pixels = numpy.take(sepia_table(), pixels if is_gray else to_gray(pixels), axis=0)
+            is_gray = False
+        elif name == "INVERT":
+            # Pillow inverts in RGB, grey images come out as RGB
+            pixels = 255 - (to_rgb(pixels) if is_gray else pixels)
+            is_gray = False
+        elif name == "POSTERIZE":
+            pixels = pixels & 0xF0
+        elif name == "SOLARIZE":
+            # 255 - x from 128 up, as an xor with 255 on the pixels whose top bit is set
+            pixels = pixels ^ ((pixels >> 7) * numpy.uint8(255))
+        elif not is_gray:
+            # Saturation keeps grey images as they are
+            pixels = saturate(pixels, saturation_factors[name])
+    return pixels
+
+# Function to filter images of the same size and mode as one stacked array, returns the filtered images
+def filter_images(images, filter_names):
+    # One copy in (the stack) and one copy out per image, the filters themselves work in place of Pillow passes
+    stack = numpy.stack([numpy.asarray(image) for image in images])
+    filtered = filter_array(stack, filter_names, images[0].mode == "L")
+    return [Image.fromarray(pixels) for pixels in filtered]
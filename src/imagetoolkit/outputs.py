@@ -0,0 +1,85 @@
+import itertools
+import os
+from .utils import ensure_parent_dir
+
+# Atomic output files: every output is written to a temporary file next to it and renamed over the
+# final path once complete, so a run interrupted mid-write leaves the previous file (or none) and a
+# stray .tmp file, never a truncated image that a later --incremental run would trust. The rename
+# also gives the output a new inode, so the hard-linked copies of --dedup are never rewritten through.
+#
+# With fsync on, each file is flushed to disk before its rename, and the directories holding the
+# new names are flushed once per batch (sync_dirs) instead of once per file.
+
+# Output settings of this process (pool workers get a copy through init_worker)
+settings = {"fsync": False}
+
+# Directories that got new names since the last sync_dirs, with fsync on
+unsynced_dirs = set()
+
+temp_numbers = itertools.count()
+
+# Function to turn fsync on or off for the outputs written by this process
+def enable(fsync=False):
+    settings["fsync"] = fsync
+
+# Function to get the temporary path an output is written to before its rename
+def temp_path_for(output_path):
+    directory, name = os.path.split(os.fspath(output_path))
+    return os.path.join(directory, f".{name}.{os.getpid()}-{next(temp_numbers)}.tmp")
+
+# Function to remove a temporary file left by a failed write
+def discard(temp_path):
+    try:
+        os.remove(temp_path)
+    except OSError:
+        pass
+
+def fsync_path(path, flags=os.O_RDONLY):
+    fd = os.open(path, flags)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+# Function to move a complete temporary file over its output path
+def commit_file(temp_path, output_path, synced=False):
+    """synced tells the data was already flushed (write_file does it on the open file)."""
+    try:
+        if settings["fsync"] and not synced:
+            fsync_path(temp_path)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        discard(temp_path)
+        raise
+    if settings["fsync"]:
+        unsynced_dirs.add(os.path.dirname(os.path.abspath(output_path)))
+
+# Function to write the bytes of an output file atomically, creating its directory if needed
+def write_file(output_path, data):
+    ensure_parent_dir(output_path)
+    temp_path = temp_path_for(output_path)
+    try:
+        with open(temp_path, "wb") as file:
+            file.write(data)
+            if settings["fsync"]:
+                file.flush()
+                os.fsync(file.fileno())
+    except BaseException:
+        discard(temp_path)
+        raise
+    commit_file(temp_path, output_path, synced=True)
+
+# Function to flush the directories of the outputs renamed so far, and those of the given results (paths written by other processes)
+def sync_dirs(results=()):
+    if not settings["fsync"]:
+        return
+    for result in results:
+        for path in result if isinstance(result, list) else [result]:
+            if isinstance(path, str):
+                unsynced_dirs.add(os.path.dirname(os.path.abspath(path)))
+    for directory in unsynced_dirs:
+        try:
+            fsync_path(directory)
+        except OSError:
+            pass  # Directories can't be opened for fsync on some systems (Windows)
+    unsynced_dirs.clear()
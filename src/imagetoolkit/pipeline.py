@@ -0,0 +1,203 @@
+from PIL import Image
+from functools import partial
+from pathlib import Path
+import os
+from .utils import display_msg
+from .fileio import open_image, load_image, encode_image_bytes, write_bytes
+from .profiler import stage
+from .variables import msg_allowed
+from .executor import run_batch
+from .rescale import resize_fixed, rescale_percent
+from .color import apply_filters, parse_filters
+from .addtext import draw_text, get_available_fonts
+from .compress import encode_to_size
+from .formats import output_formats, encoder_params, prepare_for, max_effort
+
+# Each step receives the image and the pipeline context and returns the (new) image.
+# The context holds the output format and, after "reduce", the final encoded bytes.
+
+def resize_step(image, context, mode, dimensions=None, percentage=None, quality="normal"):
+    if mode == "fixed":
+        new_width, new_height = dimensions
+        resample = Image.Resampling.LANCZOS if quality == "high" else Image.Resampling.BICUBIC
+        return resize_fixed(image, new_width, new_height, resample)
+    return rescale_percent(image, percentage)
+
+def filter_step(image, context, filter_choice, fuse=False):
+    return apply_filters(image, filter_choice, fuse=fuse)
+
+def text_step(image, context, text, color, position, font, size=5.0):
+    return draw_text(image, text, position, font, size, color)
+
+def convert_step(image, context, format, quality=None, effort=None):
+    context["format"] = format.lower()
+    context["extension"] = format.lower()
+    context["params"] = encoder_params(format, quality, effort)
+    context["effort"] = effort
+    return prepare_for(image, format)
+
+def reduce_step(image, context, max_size, resize=False, quality=False):
+    with stage("encode"):
+        context["data"], context["attempts"] = encode_to_size(image, context["format"], int(max_size[:-2]), resize, quality, effort=context.get("effort"))
+    return image
+
+pipeline_steps = {
+    "resize": resize_step,
+    "filter": filter_step,
+    "add-text": text_step,
+    "convert": convert_step,
+    "reduce": reduce_step,
+}
+
+# Function to read a "yes"/"no" style flag from a step parameter
+def parse_flag(value):
+    return str(value).lower() in ("1", "yes", "true", "on")
+
+# Function to turn a step spec such as "resize:mode=scale,percentage=50" into (name, params)
+def parse_step(spec):
+    """
+    Parse a pipeline step written as NAME[:key=value,key=value...].
+
+    resize:   mode=fixed,dimensions=800x600[,quality=high] | mode=scale,percentage=50
+    filter:   filter=SEPIA | filter=BRIGHTNESS_INC+CONTRAST_INC+SHARPEN[,fuse=yes]
+    add-text: text=...,color=white,position=Bottom Right[,font=Anton.ttf][,size=5]
+    convert:  format=JPEG|PNG|BMP|WEBP|AVIF[,quality=80][,effort=4]
+    reduce:   max-size=512KB[,resize=yes][,quality=yes]
+    """
+    name, _, raw_params = spec.partition(":")
+
+    params = {}
+    for pair in filter(None, raw_params.split(",")):
+        key, separator, value = pair.partition("=")
+        if not separator:
+            raise ValueError(f"Invalid parameter '{pair}' in step '{name.strip()}', use key=value")
+        params[key.strip()] = value.strip()
+
+    return validate_step(name, params)
+
+# Function to check and convert the parameters of a step given as strings (from a spec or a query string)
+def validate_step(name, params):
+    """Keys may use "-" or "_" (max-size or max_size), returns (name, params) ready for build_steps."""
+    name = name.strip().lower()
+    if name not in pipeline_steps:
+        raise ValueError(f"Unknown pipeline step '{name}'. Use one of: {', '.join(pipeline_steps)}")
+    params = {key.replace("-", "_"): value for key, value in params.items()}
+
+    if name == "resize":
+        if params.get("mode") not in ("fixed", "scale"):
+            raise ValueError("The resize step needs mode=fixed or mode=scale")
+        if params["mode"] == "fixed":
+            params["dimensions"] = tuple(int(v) for v in params.get("dimensions", "").lower().split("x"))
+        else:
+            params["percentage"] = int(params.get("percentage", ""))
+
+    elif name == "filter":
+        # Several filters in one step are separated with "+", e.g. filter=BRIGHTNESS_INC+SHARPEN
+        params["filter_choice"] = parse_filters(params.pop("filter", "").split("+"))
+        if "fuse" in params:
+            params["fuse"] = parse_flag(params["fuse"])
+
+    elif name == "add-text":
+        if "text" not in params or "color" not in params or "position" not in params:
+            raise ValueError("The add-text step needs text, color and position")
+        if "size" in params:
+            params["size"] = float(params["size"])
+        if "font" not in params:
+            fonts = get_available_fonts()
+            if not fonts:
+                raise ValueError("No fonts available for the add-text step")
+            params["font"] = fonts[0]
+
+    elif name == "convert":
+        params["format"] = params.get("format", "").upper()
+        if params["format"] not in output_formats:
+            raise ValueError(f"The convert step needs format={'|'.join(output_formats)}")
+        if "quality" in params:
+            params["quality"] = int(params["quality"])
+        if "effort" in params:
+            params["effort"] = int(params["effort"])
+            if not 0 <= params["effort"] <= max_effort:
+                raise ValueError(f"The convert step needs effort between 0 and {max_effort}")
+
+    elif name == "reduce":
+        if not params.get("max_size", "").upper().endswith("KB"):
+            raise ValueError("The reduce step needs max-size in KB, e.g. max-size=512KB")
+        params["max_size"] = params["max_size"].upper()
+        for flag in ("resize", "quality"):
+            if flag in params:
+                params[flag] = parse_flag(params[flag])
+
+    return name, params
+
+# Function to validate a list of steps (specs or (name, params) pairs)
+def build_steps(steps):
+    parsed = [parse_step(step) if isinstance(step, str) else (step[0], dict(step[1])) for step in steps]
+
+    if not parsed:
+        raise ValueError("The pipeline needs at least one step")
+
+    # Consecutive filter steps become one step so their passes can be fused (if they agree on fusing kernels)
+    merged = []
+    for name, params in parsed:
+        if name == "filter" and merged and merged[-1][0] == "filter" and merged[-1][1].get("fuse", False) == params.get("fuse", False):
+            merged[-1][1]["filter_choice"] = parse_filters(merged[-1][1]["filter_choice"]) + parse_filters(params["filter_choice"])
+        else:
+            merged.append((name, params))
+    parsed = merged
+
+    if any(name == "reduce" for name, _ in parsed[:-1]):
+        raise ValueError("The reduce step encodes the image, so it must be the last step")
+
+    return parsed
+
+# Function to run the same chain of steps on every image, one decode and one encode per image
+def run_pipeline(input_path, selected_output_path, images, steps, jobs=1):
+    input_path = Path(input_path)  # Convert to Path object
+    selected_output_path = Path(selected_output_path)  # Convert to Path object
+
+    worker = partial(pipeline_image, input_path, selected_output_path, build_steps(steps))
+    return run_batch(worker, images, jobs, input_dir=input_path, output_dir=selected_output_path)
+
+# Function to run the steps on a single image kept in memory, returns the output path
+def pipeline_image(input_path, selected_output_path, steps, image):
+    image_path = input_path / image  # Correct way to join paths
+    extension = os.path.splitext(image)[1][1:].lower()
+
+    with open_image(image_path) as img:
+        data, extension = process_image(img, steps, extension)
+
+    output_filepath = selected_output_path / Path(image).with_suffix(f".{extension}")
+    write_bytes(output_filepath, data)
+
+    display_msg(
+        f"Image {image}: {' -> '.join(name for name, _ in steps)} applied and saved to {selected_output_path} ({round(len(data) / 1024, 2)} KB)",
+        msg_allowed["SUCCESS"], False
+    )
+    return str(output_filepath)
+
+# Function to run the steps on an opened image, returns the encoded bytes and the output extension
+def process_image(img, steps, extension):
+    context = {"format": "jpeg" if extension == "jpg" else extension, "extension": extension}
+
+    # A leading resize decodes the pixels itself, so JPEG draft mode can still apply
+    if steps[0][0] != "resize":
+        load_image(img)
+
+    with stage("transform"):
+        for name, params in steps:
+            img = pipeline_steps[name](img, context, **params)
+
+    # Only one encode, unless the reduce step already produced the final bytes
+    data = context.get("data")
+    if data is None:
+        data = encode_image_bytes(img, context["format"], optimize=True, **context.get("params", {}))
+    return data, context["extension"]
+
+# Function to run the steps once on a small blank image, so a long-lived worker has its plugins, fonts and tables loaded
+def warm_up(steps):
+    img = Image.new("RGB", (64, 64), "gray")
+    context = {"format": "jpeg", "extension": "jpeg"}
+    for name, params in steps:
+        img = pipeline_steps[name](img, context, **params)
+    if context.get("data") is None:
+        encode_image_bytes(img, context["format"], optimize=True, **context.get("params", {}))
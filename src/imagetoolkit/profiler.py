@@ -0,0 +1,141 @@
+from contextlib import contextmanager, nullcontext
+import csv
+import json
+import math
+import sys
+import time
+
+try:
+    import resource  # Not available on Windows, peak memory is then left out
+except ImportError:
+    resource = None
+
+# Stages every operation reports, in the order they usually happen
+stages = ("decode", "transform", "encode", "write")
+
+# Profiling state of this process: None when profiling is off
+settings = None
+records = []
+current = None
+
+# Returned by stage() when profiling is off, so timers cost one check
+no_stage = nullcontext()
+
+# Function to turn profiling on in this process
+def enable(track_memory=False):
+    global settings
+    settings = {"track_memory": track_memory}
+
+# Function to tell if profiling is on in this process
+def is_enabled():
+    return settings is not None
+
+# Function to time a stage of the image being processed
+def stage(name):
+    """
+    Time the enclosed block as stage name of the current image. Stages can nest:
+    the time of an inner stage (e.g. decode inside transform) is only counted once, in the inner one.
+    """
+    if current is None:
+        return no_stage
+    return timed_stage(name)
+
+@contextmanager
+def timed_stage(name):
+    record, stack = current, current["stack"]
+    now = time.perf_counter()
+    if stack:
+        parent, started = stack[-1]
+        record[parent] += now - started
+    stack.append((name, now))
+    try:
+        yield
+    finally:
+        now = time.perf_counter()
+        _, started = stack.pop()
+        record[name] += now - started
+        if stack:
+            stack[-1] = (stack[-1][0], now)
+
+# Function to get the peak resident memory of this process in MB
+def peak_memory_mb():
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+# Function to run func(item) while recording the time of each stage, returns (result, record)
+def profile_item(func, item, operation):
+    global current
+    current = dict.fromkeys(stages, 0.0)
+    image = ", ".join(map(str, item)) if isinstance(item, list) else str(item[1] if isinstance(item, tuple) else item)
+    current.update({"image": image, "operation": operation, "stack": []})
+
+    start = time.perf_counter()
+    try:
+        result = func(item)
+    finally:
+        record, current = current, None
+        record["total"] = time.perf_counter() - start
+        del record["stack"]
+        if settings["track_memory"] and resource is not None:
+            record["peak_memory_mb"] = peak_memory_mb()
+
+    return result, record
+
+# Function to compute a percentile (0-100) of a sorted list
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    position = (len(values) - 1) * percent / 100
+    low, high = math.floor(position), math.ceil(position)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+# Function to summarize the records: totals, mean and percentiles per stage
+def summarize(records):
+    summary = {}
+    for name in stages + ("total",):
+        values = sorted(record[name] for record in records)
+        summary[name] = {
+            "total": round(sum(values), 6),
+            "mean": round(sum(values) / len(values), 6) if values else 0.0,
+            "p50": round(percentile(values, 50), 6),
+            "p90": round(percentile(values, 90), 6),
+            "p99": round(percentile(values, 99), 6),
+            "max": round(values[-1], 6) if values else 0.0,
+        }
+    return summary
+
+# Function to write the profile report, as JSON or CSV depending on the file extension
+def write_report(report_path, records, slowest=10):
+    """
+    JSON: {"images", "stages": per-stage totals/mean/p50/p90/p99/max, "slowest": the slowest images, "records"}.
+    CSV: one row per image, slowest first, followed by total/mean/p50/p90/p99/max rows.
+    """
+    ordered = sorted(records, key=lambda record: record["total"], reverse=True)
+    summary = summarize(records)
+    columns = ["image", "operation"] + list(stages) + ["total"] + (["peak_memory_mb"] if any("peak_memory_mb" in record for record in records) else [])
+
+    if str(report_path).lower().endswith(".csv"):
+        with open(report_path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(columns)
+            for record in ordered:
+                writer.writerow([round(value, 6) if isinstance(value, float) else value for value in (record.get(column, "") for column in columns)])
+            for statistic in ("total", "mean", "p50", "p90", "p99", "max"):
+                writer.writerow([f"({statistic})", ""] + [summary[name][statistic] for name in stages + ("total",)])
+        return
+
+    with open(report_path, "w", encoding="utf-8") as file:
+        json.dump({
+            "images": len(records),
+            "stages": summary,
+            "slowest": ordered[:slowest],
+            "records": records,
+        }, file, indent=1)
+
+# Function to describe where the time went, in one line
+def summary_line(records):
+    summary = summarize(records)
+    total = sum(summary[name]["total"] for name in stages) or 1
+    parts = ", ".join(f"{name} {summary[name]['total']:.2f}s ({summary[name]['total'] / total:.0%})" for name in stages)
+    return f"Profiled {len(records)} images: {parts}, p90 per image {summary['total']['p90']:.3f}s"
@@ -0,0 +1,217 @@
+from contextlib import contextmanager
+import json
+import math
+import os
+from .outputs import write_file
+
+# Predicts the file size of a full encode from cheap features, so `reduce` can start close to
+# the right quality instead of bisecting blind. For each format, log(full bytes / sample estimate)
+# is fitted by ridge regression on [1, log pixels, log bits per pixel of the source file,
+# log bits per pixel of the sample]. The fit is kept as additive sums (XtX, Xty), so runs in
+# several processes can each save their own delta and be merged into one model afterwards.
+#
+# The model directory is shared by every run. Delta files are named after the run (the process that
+# started the batch) and the process that wrote them, a run merges only its own, and the merge holds
+# a lock on the directory, so two runs at once neither lose nor double-count what the other learned.
+
+model_version = 1
+model_name = "quality_model.json"
+delta_prefix = "quality_model.delta."
+lock_name = "quality_model.lock"
+
+# Side of the square crops encoded to estimate the complexity of an image
+sample_crop = 160
+
+# Centers of the crops, as fractions of the width and height
+sample_positions = ((0.25, 0.25), (0.75, 0.25), (0.5, 0.5), (0.25, 0.75), (0.75, 0.75))
+
+# Regularization towards "the full image encodes like the sample" while there is little data
+ridge = 0.5
+feature_count = 4
+
+# Model of this process: the stored model plus what this process learned (delta), loaded by use()
+state = {"dir": None, "model": None, "delta": None, "run": None, "pid": None}
+
+# Function to get the default model directory ($XDG_CACHE_HOME/imagetoolkit or ~/.cache/imagetoolkit)
+def default_model_dir():
+    return os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "imagetoolkit")
+
+def empty_model():
+    return {"version": model_version, "formats": {}, "stats": empty_stats()}
+
+def empty_stats():
+    # images: predicted images, encodes: full encodes they needed, histogram: images per encode count,
+    # error: sum of |log(actual / predicted)| of the first full encode
+    return {"images": 0, "encodes": 0, "histogram": {}, "error": 0.0}
+
+def load_json(path):
+    try:
+        with open(path, encoding="utf-8") as file:
+            data = json.load(file)
+        if data.get("version") == model_version:
+            return data
+    except (OSError, ValueError):
+        pass
+    return None
+
+def save_json(path, data):
+    write_file(path, json.dumps(data).encode("utf-8"))  # Temporary file of its own, then renamed
+
+# Function to get the run of this process: the process that started the batch (this one, or the parent of a pool worker)
+def current_run():
+    import multiprocessing  # Already loaded in pool workers, only needed once an image is compressed
+    parent = multiprocessing.parent_process()
+    return parent.pid if parent is not None else os.getpid()
+
+# Context manager holding an exclusive lock on the model directory (no lock where fcntl is missing)
+@contextmanager
+def locked(model_dir):
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(os.path.join(model_dir, lock_name), "a") as file:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+# Function to use the model stored in model_dir in this process (loaded once per process)
+def use(model_dir):
+    # A forked worker inherits the state of its parent, but not its delta file or its run
+    if state["dir"] != model_dir or state["pid"] != os.getpid():
+        os.makedirs(model_dir, exist_ok=True)
+        state["dir"], state["pid"] = model_dir, os.getpid()
+        state["model"] = load_json(os.path.join(model_dir, model_name)) or empty_model()
+        state["delta"] = empty_model()
+        state["run"] = current_run()
+        if state["run"] != os.getpid():
+            # A pool worker saves what it learned once, when it exits after its last image
+            from multiprocessing.util import Finalize
+            Finalize(None, save_delta, exitpriority=10)
+
+# Function to tell if a prediction can be made in this process
+def is_active():
+    return state["model"] is not None
+
+# Function to add the sums of one fit into another
+def add_fit(target, source):
+    target["n"] += source["n"]
+    target["xty"] = [a + b for a, b in zip(target["xty"], source["xty"])]
+    target["xtx"] = [[a + b for a, b in zip(row_a, row_b)] for row_a, row_b in zip(target["xtx"], source["xtx"])]
+
+# Function to add one model (its sums and stats) into another
+def merge_into(target, source):
+    for extension, fit in source["formats"].items():
+        add_fit(target["formats"].setdefault(extension, empty_fit()), fit)
+
+    stats, other = target["stats"], source["stats"]
+    stats["images"] += other["images"]
+    stats["encodes"] += other["encodes"]
+    stats["error"] += other["error"]
+    for count, images in other["histogram"].items():
+        stats["histogram"][count] = stats["histogram"].get(count, 0) + images
+
+def empty_fit():
+    return {"n": 0, "xtx": [[0.0] * feature_count for _ in range(feature_count)], "xty": [0.0] * feature_count}
+
+# Function to save what this process learned, as its own delta file of the run next to the model
+def save_delta():
+    """Called once per process and batch: when a pool worker exits, or by compress() after a serial batch."""
+    if state["delta"] is not None and state["delta"]["stats"]["images"]:
+        save_json(os.path.join(state["dir"], f"{delta_prefix}{state['run']}.{os.getpid()}.json"), state["delta"])
+
+# Function to merge the deltas saved by the processes of a run into the stored model, returns the stats of the run
+def merge_deltas(model_dir, run_id=None):
+    """run_id is the pid of the process that started the batch, this one by default."""
+    if not os.path.isdir(model_dir):
+        return empty_stats()  # Created by use(), so no image of the run needed the model
+    prefix = f"{delta_prefix}{run_id or os.getpid()}."
+    run = empty_model()
+
+    with locked(model_dir):
+        paths = [os.path.join(model_dir, name) for name in sorted(os.listdir(model_dir)) if name.startswith(prefix) and name.endswith(".json")]
+        if not paths:
+            return empty_stats()
+        for path in paths:
+            delta = load_json(path)
+            if delta is not None:
+                merge_into(run, delta)
+
+        # Read, merged and written under the lock, so a run merging at the same time doesn't overwrite it
+        model = load_json(os.path.join(model_dir, model_name)) or empty_model()
+        merge_into(model, run)
+        save_json(os.path.join(model_dir, model_name), model)
+        for path in paths:
+            os.remove(path)
+
+    # The next batch in this process starts from the merged model
+    if state["dir"] == model_dir:
+        state["model"], state["delta"] = model, empty_model()
+    return run["stats"]
+
+# Function to pick the crops that stand for the whole image
+def sample_crops(image):
+    width, height = image.size
+    if width < 2 * sample_crop or height < 2 * sample_crop:
+        return [image]
+    return [image.crop((int(x * width) - sample_crop // 2, int(y * height) - sample_crop // 2,
+                        int(x * width) + sample_crop // 2, int(y * height) + sample_crop // 2))
+            for x, y in sample_positions]
+
+# Function to build the features of an image from its source file size and the sample bits per pixel
+def features(pixels, file_bytes, sample_bpp):
+    return [1.0, math.log(pixels), math.log(max(file_bytes, 1) * 8 / pixels), math.log(max(sample_bpp, 1e-6))]
+
+# Function to solve (XtX + ridge) w = Xty by Gaussian elimination
+def solve(xtx, xty):
+    size = len(xty)
+    matrix = [[xtx[i][j] + (ridge if i == j else 0.0) for j in range(size)] + [xty[i]] for i in range(size)]
+    for column in range(size):
+        pivot = max(range(column, size), key=lambda row: abs(matrix[row][column]))
+        matrix[column], matrix[pivot] = matrix[pivot], matrix[column]
+        if abs(matrix[column][column]) < 1e-12:
+            return [0.0] * size
+        for row in range(size):
+            if row != column:
+                factor = matrix[row][column] / matrix[column][column]
+                matrix[row] = [a - factor * b for a, b in zip(matrix[row], matrix[column])]
+    return [matrix[i][size] / matrix[i][i] for i in range(size)]
+
+# Function to get the correction log(full / sample estimate) predicted for these features
+def correction(extension, feature_values):
+    fit = empty_fit()
+    for model in (state["model"], state["delta"]):
+        if extension in model["formats"]:
+            add_fit(fit, model["formats"][extension])
+    if not fit["n"]:
+        return 0.0
+    weights = solve(fit["xtx"], fit["xty"])
+    return sum(w * x for w, x in zip(weights, feature_values))
+
+# Function to learn from a full encode: the correction that would have predicted it exactly
+def learn(extension, feature_values, observed_correction):
+    fit = state["delta"]["formats"].setdefault(extension, empty_fit())
+    fit["n"] += 1
+    for i in range(feature_count):
+        fit["xty"][i] += feature_values[i] * observed_correction
+        for j in range(feature_count):
+            fit["xtx"][i][j] += feature_values[i] * feature_values[j]
+
+# Function to record how many full encodes an image needed and how far the first prediction was
+def record_outcome(encodes, first_error):
+    stats = state["delta"]["stats"]
+    stats["images"] += 1
+    stats["encodes"] += encodes
+    stats["error"] += abs(first_error)
+    stats["histogram"][str(encodes)] = stats["histogram"].get(str(encodes), 0) + 1
+
+# Function to describe the prediction stats of a run in one line
+def stats_line(stats):
+    if not stats["images"]:
+        return "Quality model: no image needed a prediction"
+    within_two = sum(images for count, images in stats["histogram"].items() if int(count) <= 2)
+    return (f"Quality model: {within_two / stats['images']:.0%} of {stats['images']} images reached the size in 1-2 full encodes "
+            f"(mean {stats['encodes'] / stats['images']:.2f}, first prediction off by {math.exp(stats['error'] / stats['images']) - 1:.0%} on average)")
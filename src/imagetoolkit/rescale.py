@@ -1,13 +1,34 @@
-from .utils import display_msg
+from .utils import display_msg, ensure_parent_dir
 from .variables import msg_allowed
+from .executor import run_batch
+from .tiled import use_strips, tiled_resize
+from .fileio import open_image, load_image, save_image
+from .profiler import stage
 from PIL import Image
+from functools import partial
 from pathlib import Path
 import os
 
+# Never shrink below this multiple of the target size before the final resampling filter
+reducing_gap = 2.0
+
+# Function to resize an image, shrinking it cheaply first when the target is much smaller
+def downscale(image, size, resample):
+  """
+  Resize the image to size. When downscaling, JPEG images not yet loaded are decoded
+  at a reduced DCT scale (draft) and every image is pre-shrunk with reduce(), both
+  stopping at reducing_gap times the target so the final filter keeps its accuracy.
+  """
+  new_width, new_height = size
+  if new_width < image.width and new_height < image.height:
+    image.draft(image.mode, (int(new_width * reducing_gap), int(new_height * reducing_gap)))
+  load_image(image)
+  return image.resize(size, resample, reducing_gap=reducing_gap)
+
 # Function to resize an image to a fixed width and height
 def resize_fixed(image, new_width, new_height, quality_type):
   """Resize the image to fixed width and height."""
-  return image.resize((new_width, new_height), quality_type)
+  return downscale(image, (new_width, new_height), quality_type)
 
 # Function to rescale an image proportionally by a percentage
 def rescale_percent(image, resize_size_percent):
@@ -15,80 +36,190 @@ def rescale_percent(image, resize_size_percent):
   width, height = image.size
   new_width = int((resize_size_percent * width) / 100)
   new_height = int((resize_size_percent * height) / 100)
-  return image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+  return downscale(image, (new_width, new_height), Image.Resampling.LANCZOS)
 
 # Function to process images for resizing based on mode (fixed or percentage)
-def process_images_resize(input_path, selected_output_path, images, resize_mode, resize_value, quality_type):
+def process_images_resize(input_path, selected_output_path, images, resize_mode, resize_value, quality_type, jobs=1, memory_limit=None):
   input_path = Path(input_path)  # Convert to Path object
   selected_output_path = Path(selected_output_path)  # Convert to Path object
 
-  for image in images:
-    try:
-      image_path = input_path / image  # Correct way to join paths
-      with Image.open(image_path) as img:
-        width, height = img.size
-        extension = os.path.splitext(image)[1][1:]
-        extension = "jpeg" if extension.lower() == "jpg" else extension.lower()
-
-        # Handle resize modes
-        if resize_mode == "fixed":
-          new_width, new_height = resize_value
-          if new_width > width or new_height > height:
-            display_msg(
-              f"Warning: Resizing {image} to larger dimensions may result in quality loss",
-              msg_allowed["INFO"], False
-            )
-          resized_img = resize_fixed(img, new_width, new_height, quality_type)
-        elif resize_mode == "percent":
-          resized_img = rescale_percent(img, resize_value)
-        else:
-          raise ValueError("Invalid resize mode. Use 'fixed' or 'percent'")
-
-        # Save the resized image
-        resized_img.save(selected_output_path / image, optimize=True, format=extension)
+  worker = partial(resize_image, input_path, selected_output_path, resize_mode, resize_value, quality_type, memory_limit)
+  return run_batch(worker, images, jobs, input_dir=input_path, output_dir=selected_output_path)
+
+# Function to resize an image already in memory: "fixed" to resize_value (width, height), "percent" to resize_value %
+def resize_by_mode(img, resize_mode, resize_value, quality_type=Image.Resampling.LANCZOS):
+  if resize_mode == "fixed":
+    return resize_fixed(img, resize_value[0], resize_value[1], quality_type)
+  if resize_mode == "percent":
+    return rescale_percent(img, resize_value)
+  raise ValueError("Invalid resize mode. Use 'fixed' or 'percent'")
+
+# Function to resize a single image, returns the output path
+def resize_image(input_path, selected_output_path, resize_mode, resize_value, quality_type, memory_limit, image):
+  image_path = input_path / image  # Correct way to join paths
+  with open_image(image_path) as img:
+    width, height = img.size
+    extension = os.path.splitext(image)[1][1:]
+    extension = "jpeg" if extension.lower() == "jpg" else extension.lower()
+
+    # Handle resize modes
+    if resize_mode == "fixed":
+      new_width, new_height = resize_value
+      if new_width > width or new_height > height:
         display_msg(
-          f"Image {image} resized and saved to {selected_output_path}",
-          msg_allowed["SUCCESS"], False
+          f"Warning: Resizing {image} to larger dimensions may result in quality loss",
+          msg_allowed["INFO"], False
         )
-    except Exception as e:
-      display_msg(f"Error processing image {image}: {e}", msg_allowed["ERROR"], False)
+      resample = quality_type
+    elif resize_mode == "percent":
+      new_width = int((resize_value * width) / 100)
+      new_height = int((resize_value * height) / 100)
+      resample = Image.Resampling.LANCZOS
+    else:
+      raise ValueError("Invalid resize mode. Use 'fixed' or 'percent'")
+
+    output_filepath = selected_output_path / image
+
+    # Images over the memory limit are resized strip by strip, without decoding them whole
+    if use_strips(img, image, memory_limit):
+      ensure_parent_dir(output_filepath)
+      with stage("transform"):  # Strips are read, resized and written together
+        tiled_resize(image_path, output_filepath, extension, (new_width, new_height), resample, memory_limit)
+    else:
+      with stage("transform"):
+        resized_img = resize_by_mode(img, resize_mode, resize_value, quality_type)
+
+      # Save the resized image
+      save_image(resized_img, output_filepath, extension, optimize=True)
+    display_msg(
+      f"Image {image} resized and saved to {selected_output_path}",
+      msg_allowed["SUCCESS"], False
+    )
+    return str(output_filepath)
 
 # Function to create thumbnails of images
-def thumbnails(input_path, selected_output_path, images, want_favicon, thumbnail_size):
+def thumbnails(input_path, selected_output_path, images, want_favicon, thumbnail_size, jobs=1):
   thumbnail_size = int(thumbnail_size[:-2])  # Convert "100px" to 100
 
   input_path = Path(input_path)  # Convert to Path object
   selected_output_path = Path(selected_output_path)  # Convert to Path object
 
-  for image in images:
-    try:
-      image_path = input_path / image  # Correct way to join paths
-
-      with Image.open(image_path) as img:
-        width, height = img.size
-
-        # Set the extension for favicon (ICO) or other image formats
-        extension = "ico" if want_favicon.lower() == "yes" else os.path.splitext(image)[1][1:].lower().replace("jpg", "jpeg")
-        output_filename = f"{Path(image).stem}.{extension}"  # Get filename without extension
-        output_filepath = selected_output_path / output_filename  # Correct output path
-
-        # Resize the image if necessary
-        if width > thumbnail_size and height > thumbnail_size:
-          img_resized = img.resize((thumbnail_size, thumbnail_size))
-
-          # Save the resized image with the correct format
-          img_resized.save(output_filepath, optimize=True, format=extension.upper())  # Ensure format is uppercase
-          display_msg(
-              f"Image {image} successfully resized to {thumbnail_size}px and saved as {output_filename} in {selected_output_path}",
-              msg_allowed["SUCCESS"],
-              False
-          )
-        else:
-          display_msg(
-              f"Image {image} is already {thumbnail_size}px or smaller. No resizing needed",
-              msg_allowed["INFO"],
-              False
-          )
-
-    except Exception as e:
-      display_msg(f"Error processing image {image}: {e}", msg_allowed["ERROR"], False)
+  worker = partial(thumbnail_image, input_path, selected_output_path, want_favicon, thumbnail_size)
+  return run_batch(worker, images, jobs, input_dir=input_path, output_dir=selected_output_path)
+
+# Function to shrink an image already in memory to a size x size thumbnail (only called on images larger than that)
+def square_thumbnail(img, thumbnail_size):
+  return downscale(img, (thumbnail_size, thumbnail_size), Image.Resampling.BICUBIC)
+
+# Function to create the thumbnail of a single image, returns the output path if one was written
+def thumbnail_image(input_path, selected_output_path, want_favicon, thumbnail_size, image):
+  image_path = input_path / image  # Correct way to join paths
+
+  with open_image(image_path) as img:
+    width, height = img.size
+
+    # Set the extension for favicon (ICO) or other image formats
+    extension = "ico" if want_favicon.lower() == "yes" else os.path.splitext(image)[1][1:].lower().replace("jpg", "jpeg")
+    output_filename = Path(image).with_suffix(f".{extension}")  # Same relative path, new extension
+    output_filepath = selected_output_path / output_filename  # Correct output path
+
+    # Resize the image if necessary
+    if width > thumbnail_size and height > thumbnail_size:
+      with stage("transform"):
+        img_resized = square_thumbnail(img, thumbnail_size)
+
+      # Save the resized image with the correct format
+      save_image(img_resized, output_filepath, extension.upper(), optimize=True)  # Ensure format is uppercase
+      display_msg(
+          f"Image {image} successfully resized to {thumbnail_size}px and saved as {output_filename} in {selected_output_path}",
+          msg_allowed["SUCCESS"],
+          False
+      )
+      return str(output_filepath)
+
+    display_msg(
+        f"Image {image} is already {thumbnail_size}px or smaller. No resizing needed",
+        msg_allowed["INFO"],
+        False
+    )
+    return None
+
+# Function to fit an image within a size x size box, keeping its aspect ratio
+def fit_within(image, size):
+  """Downscale the image so its longest side is size px (never upscales)."""
+  width, height = image.size
+  ratio = size / max(width, height)
+  if ratio >= 1:
+    return image.copy()
+  new_size = (max(1, round(width * ratio)), max(1, round(height * ratio)))
+  return downscale(image, new_size, Image.Resampling.LANCZOS)
+
+# Function to keep the pyramid sizes an image can be downscaled to (a level is never larger than the source)
+def pyramid_sizes(img, sizes):
+  return [size for size in sizes if size <= max(img.size)]
+
+# Largest side of an ICO entry
+max_ico_size = 256
+
+# Function to build the levels of a thumbnail pyramid from an image in memory, sizes largest first
+def pyramid_levels(img, sizes):
+  # Cascade: every level is resampled from the previous (larger) level, not from the source
+  levels = []
+  level = img
+  for size in sizes:
+    level = fit_within(level, size)
+    levels.append(level)
+  return levels
+
+# Function to create a pyramid of thumbnails (and one multi-resolution favicon) of images
+def thumbnail_pyramid(input_path, selected_output_path, images, want_favicon, thumbnail_sizes, jobs=1):
+  # Accept "16px" or 16, largest size first so each level is resampled from the previous one
+  sizes = sorted({int(str(size).lower().replace("px", "")) for size in thumbnail_sizes}, reverse=True)
+
+  input_path = Path(input_path)  # Convert to Path object
+  selected_output_path = Path(selected_output_path)  # Convert to Path object
+
+  worker = partial(pyramid_image, input_path, selected_output_path, want_favicon, sizes)
+  return run_batch(worker, images, jobs, input_dir=input_path, output_dir=selected_output_path)
+
+# Function to build the thumbnail pyramid of a single image from one decode, returns the output paths
+def pyramid_image(input_path, selected_output_path, want_favicon, sizes, image):
+  image_path = input_path / image  # Correct way to join paths
+  extension = os.path.splitext(image)[1][1:].lower().replace("jpg", "jpeg")
+  output_paths = []
+
+  with open_image(image_path) as img:
+    # Sizes over the source would be unresized copies named after a size they don't have
+    skipped = [size for size in sizes if size not in pyramid_sizes(img, sizes)]
+    sizes = pyramid_sizes(img, sizes)
+    if skipped:
+      display_msg(f"Image {image} is smaller than {', '.join(f'{size}px' for size in skipped)}, those thumbnails are skipped", msg_allowed["INFO"], False)
+    if not sizes:
+      return None
+
+    with stage("transform"):
+      levels = pyramid_levels(img, sizes)
+
+    for size, level in zip(sizes, levels):
+      output_filepath = selected_output_path / Path(image).parent / f"{Path(image).stem}_{size}px.{extension}"
+      save_image(level, output_filepath, extension.upper(), optimize=True)
+      output_paths.append(str(output_filepath))
+
+    # One .ico holding every level, ICO entries are limited to 256px
+    favicon = False
+    if want_favicon.lower() == "yes":
+      ico_levels = [level for level in levels if max(level.size) <= max_ico_size]
+      if ico_levels:
+        output_filepath = selected_output_path / Path(image).with_suffix(".ico")
+        save_image(ico_levels[0], output_filepath, "ICO", sizes=[level.size for level in ico_levels], append_images=ico_levels[1:])
+        output_paths.append(str(output_filepath))
+        favicon = True
+      else:
+        display_msg(f"Image {image}: no thumbnail size is {max_ico_size}px or smaller, no favicon written", msg_allowed["WARNING"], False)
+
+  display_msg(
+      f"Image {image} saved as thumbnails of {', '.join(f'{size}px' for size in sizes)}{' and a favicon' if favicon else ''} in {selected_output_path}",
+      msg_allowed["SUCCESS"],
+      False
+  )
+  return output_paths
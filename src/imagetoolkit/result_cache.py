@@ -0,0 +1,215 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from enum import Enum
+from pathlib import Path
+import PIL
+from .manifest import content_hash
+from .dedup import duplicate_output
+from .outputs import temp_path_for, commit_file, discard
+from .utils import ensure_parent_dir, display_msg
+from .variables import msg_allowed
+from . import staging
+
+# Content-addressed cache of operation results. An entry is keyed by the SHA-256 of the input file and
+# a canonical form of the operation: the worker function, its arguments (with the input and output
+# directories left out) and what the item adds (extension of the input, index of a renamed image).
+# It holds copies of the output files, so a hit copies (or reflinks) them into place without
+# decoding or encoding anything. Entries are evicted least recently used first beyond the size cap.
+#
+# cache_dir/<key[:2]>/<key>/entry.json  {"image", "outputs" (relative to the output directory), "list", "bytes", "created"}
+# cache_dir/<key[:2]>/<key>/<n>         the output files; entry.json's mtime is the last use
+
+cache_version = 1
+entry_name = "entry.json"
+
+# Cache settings of this process: None when the cache is off
+settings = None
+
+# Entries whose outputs are still being written behind, stored once staging has flushed them
+pending = []
+
+# Function to turn the cache on: cache_dir holds the entries, max_bytes caps their total size
+def enable(cache_dir, max_bytes):
+    global settings
+    settings = {"dir": os.path.abspath(cache_dir), "max_bytes": max_bytes, "started": time.time()}
+
+# Function to tell if the cache is on in this process
+def is_enabled():
+    return settings is not None
+
+# Function to turn an argument into a JSON value that is stable across runs
+def canonical(value, input_dir, output_dir):
+    if isinstance(value, (str, Path)) and str(value) in (str(input_dir), str(output_dir)):
+        return "<input>" if str(value) == str(input_dir) else "<output>"
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (list, tuple)):
+        return [canonical(item, input_dir, output_dir) for item in value]
+    if isinstance(value, dict):
+        return {str(key): canonical(item, input_dir, output_dir) for key, item in value.items()}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+# Function to compute the cache key of an item, None if it can't be cached
+def cache_key(func, input_dir, output_dir, item):
+    if isinstance(item, list):
+        return None  # Grouped items (filter --batch) have one result per image
+    index, image = item if isinstance(item, tuple) else (None, item)
+    operation = {
+        "version": cache_version,
+        "pillow": PIL.__version__,
+        "function": func.func.__name__,
+        "args": canonical(list(func.args), input_dir, output_dir),
+        "keywords": canonical(func.keywords, input_dir, output_dir),
+        "extension": os.path.splitext(str(image))[1].lower(),
+        "index": index,
+    }
+    digest = hashlib.sha256(content_hash(os.path.join(input_dir, image)).encode())
+    digest.update(json.dumps(operation, sort_keys=True).encode())
+    return digest.hexdigest()
+
+def entry_dir(key):
+    return os.path.join(settings["dir"], key[:2], key)
+
+# Function to copy a file, as a reflink (shared blocks, copy on write) where the filesystem allows it
+def clone_file(source, target):
+    ensure_parent_dir(target)
+    temp_path = temp_path_for(target)  # Outputs served from the cache are replaced atomically too
+    try:
+        import fcntl
+        with open(source, "rb") as src, open(temp_path, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), 0x40049409, src.fileno())  # FICLONE (Linux: btrfs, XFS, ...)
+    except (ImportError, OSError):
+        try:
+            shutil.copyfile(source, temp_path)
+        except BaseException:
+            discard(temp_path)
+            raise
+    commit_file(temp_path, target)
+
+# Function to serve an item from the cache, returns its result or None on a miss
+def serve(key, output_dir, image):
+    path = entry_dir(key)
+    try:
+        with open(os.path.join(path, entry_name), encoding="utf-8") as file:
+            entry = json.load(file)
+        outputs = []
+        for number, output in enumerate(entry["outputs"]):
+            target = duplicate_output(os.path.join(output_dir, output), entry["image"], image)
+            clone_file(os.path.join(path, str(number)), target)
+            outputs.append(target)
+        os.utime(os.path.join(path, entry_name))  # Most recently used
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return outputs if entry["list"] else outputs[0]
+
+# Function to store the outputs of an item in the cache
+def store(key, output_dir, image, result):
+    outputs = result if isinstance(result, list) else [result]
+    final_path = entry_dir(key)
+    if os.path.exists(final_path):
+        return
+
+    # Written aside then renamed, so other processes never see half an entry
+    temp_path = f"{final_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(temp_path, exist_ok=True)
+        total = 0
+        for number, output in enumerate(outputs):
+            clone_file(output, os.path.join(temp_path, str(number)))
+            total += os.path.getsize(output)
+        entry = {
+            "image": str(image),
+            "outputs": [os.path.relpath(output, output_dir) for output in outputs],
+            "list": isinstance(result, list),
+            "bytes": total,
+            "created": time.time(),
+        }
+        with open(os.path.join(temp_path, entry_name), "w", encoding="utf-8") as file:
+            json.dump(entry, file)
+        os.rename(temp_path, final_path)
+    except OSError as e:
+        shutil.rmtree(temp_path, ignore_errors=True)
+        if not os.path.exists(final_path):
+            display_msg(f"Could not cache the result of {image}: {e}", msg_allowed["WARNING"], False)
+
+# Function to store the entries whose outputs were written behind (called once staging has flushed), but those that failed
+def store_pending(failed_paths=()):
+    while pending:
+        key, output_dir, image, result = pending.pop(0)
+        if not any(str(output) in failed_paths for output in (result if isinstance(result, list) else [result])):
+            store(key, output_dir, image, result)
+
+# Function to run func(item) through the cache
+def run_cached(func, input_dir, output_dir, item):
+    """Used by run_batch when the cache is on. Errors of the cache itself never fail the image."""
+    image = item[1] if isinstance(item, tuple) else item
+    try:
+        key = cache_key(func, input_dir, output_dir, item)
+    except OSError:
+        key = None
+    if key is None:
+        return func(item)
+
+    result = serve(key, output_dir, image)
+    if result is not None:
+        display_msg(f"Image {image}: served from the result cache", msg_allowed["SUCCESS"], False)
+        return result
+
+    result = func(item)
+    if result is not None:
+        if staging.writes is not None:
+            pending.append((key, output_dir, image, result))  # Still in the write-behind queue
+        else:
+            store(key, output_dir, image, result)
+    return result
+
+# Function to list the entries of the cache as (last use, bytes, created, path)
+def list_entries(cache_dir):
+    entries = []
+    for shard in os.listdir(cache_dir) if os.path.isdir(cache_dir) else []:
+        shard_path = os.path.join(cache_dir, shard)
+        for name in os.listdir(shard_path) if os.path.isdir(shard_path) else []:
+            path = os.path.join(shard_path, name)
+            try:
+                with open(os.path.join(path, entry_name), encoding="utf-8") as file:
+                    entry = json.load(file)
+                entries.append((os.path.getmtime(os.path.join(path, entry_name)), entry["bytes"], entry["created"], path))
+            except (OSError, ValueError, KeyError):
+                continue  # Being written, or left over by a crash: not counted
+    return entries
+
+# Function to evict the least recently used entries beyond the size cap, returns the stats of this run
+# (entries stored, and entries from earlier runs reused, told apart by their creation and last use times)
+def evict():
+    entries = sorted(list_entries(settings["dir"]))
+    total = sum(size for _, size, _, _ in entries)
+    evicted = 0
+    for _, size, _, path in entries:
+        if total <= settings["max_bytes"]:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        try:
+            os.rmdir(os.path.dirname(path))  # The shard, once empty
+        except OSError:
+            pass
+        total -= size
+        evicted += 1
+
+    started = settings["started"]
+    return {
+        "stored": sum(1 for _, _, created, _ in entries if created >= started),
+        "reused": sum(1 for used, _, created, _ in entries if used >= started and created < started),
+        "evicted": evicted,
+        "entries": len(entries) - evicted,
+        "bytes": total,
+    }
+
+# Function to describe the cache activity of a run in one line
+def summary_line(stats):
+    return (f"Result cache: {stats['reused']} earlier results reused, {stats['stored']} new, {stats['evicted']} evicted, "
+            f"{stats['entries']} results using {stats['bytes'] / 1024 ** 2:.1f} MB of {settings['max_bytes'] / 1024 ** 2:.1f} MB")
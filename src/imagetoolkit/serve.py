@@ -0,0 +1,243 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+import hashlib
+import json
+import signal
+import threading
+from PIL import Image, UnidentifiedImageError
+from .executor import init_worker
+from .pipeline import pipeline_steps, validate_step, build_steps
+from .api import transform
+
+# Local HTTP service: the pipeline steps on images sent in request bodies, no files involved.
+#
+#   POST /resize?mode=scale&percentage=50          one step, its parameters in the query string
+#   POST /pipeline?step=resize:mode=scale,percentage=50&step=reduce:max-size=256KB
+#   GET  /health                                   "ok" once the workers are up
+#   GET  /                                         the operations, as JSON
+#
+# The body is the image file, the response the encoded result with its Content-Type. Connections are
+# kept alive (HTTP/1.1), each one served by its own thread, and the image work runs in a pool of
+# worker processes (or threads). Recent results are kept in an in-memory LRU cache keyed by the
+# SHA-256 of the body and the steps, capped in bytes.
+
+pools = ("process", "thread")
+
+# Bytes read from the socket or written to it at a time
+chunk_size = 64 * 1024
+
+# Seconds an idle kept-alive connection stays open
+idle_timeout = 30
+
+# Bytes Pillow looks at to recognize the format of a file
+signature_bytes = 16
+
+# Function to set up a worker process of the server
+def init_serve_worker():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C stops the server, which shuts the pool down, not each worker with a traceback
+    init_worker()
+
+# Function to start the worker pool of a server
+def start_pool(jobs, pool="process"):
+    if pool == "thread":
+        return ThreadPoolExecutor(max_workers=jobs)
+    executor = ProcessPoolExecutor(max_workers=jobs, initializer=init_serve_worker)
+    wait([executor.submit(Image.init) for _ in range(jobs)])  # Start the workers now, not on the first requests
+    return executor
+
+# Function to create the state of a server: worker pool, result cache and counters
+def new_state(jobs, pool="process", cache_bytes=64 * 1024 ** 2, max_body=64 * 1024 ** 2):
+    return {
+        "pool": start_pool(jobs, pool), "jobs": jobs, "pool_kind": pool, "pool_lock": threading.Lock(),
+        "max_body": max_body, "lock": threading.Lock(),
+        "cache": OrderedDict(), "cache_bytes": 0, "max_cache_bytes": cache_bytes,
+        "stats": {"requests": 0, "cache_hits": 0, "errors": 0},
+    }
+
+# Function to get a cached result, marking it as the most recently used
+def cache_get(state, key):
+    with state["lock"]:
+        entry = state["cache"].get(key)
+        if entry is not None:
+            state["cache"].move_to_end(key)
+        return entry
+
+# Function to cache a result, evicting the least recently used ones beyond the size cap
+def cache_put(state, key, entry):
+    size = len(entry[0])
+    if size > state["max_cache_bytes"]:
+        return
+    with state["lock"]:
+        if key in state["cache"]:
+            return
+        state["cache"][key] = entry
+        state["cache_bytes"] += size
+        while state["cache_bytes"] > state["max_cache_bytes"]:
+            _, (data, _) = state["cache"].popitem(last=False)
+            state["cache_bytes"] -= len(data)
+
+def count(state, name):
+    with state["lock"]:
+        state["stats"][name] += 1
+
+# Function to replace a pool broken by a worker that died (killed for its memory, crashed in a decoder...)
+def replace_pool(state, broken):
+    with state["pool_lock"]:
+        if state["pool"] is broken:  # Not already replaced by another request
+            state["pool"] = start_pool(state["jobs"], state["pool_kind"])
+            broken.shutdown(wait=False)
+
+# Function to run the steps on a body in the worker pool
+def run_in_pool(state, body, steps):
+    """A request that finds the pool broken gets a fresh pool and one retry, it only fails if that breaks it too."""
+    for attempt in range(2):
+        pool = state["pool"]
+        try:
+            return pool.submit(transform, body, steps).result()
+        except BrokenProcessPool:
+            replace_pool(state, pool)
+            if attempt:
+                raise
+
+# Function to tell if the first bytes of a body are those of a format Pillow reads
+def is_image_signature(prefix):
+    Image.init()
+    return any(accept(prefix) for _, accept in Image.OPEN.values() if accept is not None)
+
+# Function to get the steps of a request from its path and query string
+def request_steps(path, query):
+    operation = path.strip("/").lower()
+    pairs = parse_qsl(query, keep_blank_values=True)
+    if operation == "pipeline":
+        return build_steps([value for key, value in pairs if key == "step"])
+    if operation not in pipeline_steps:
+        raise LookupError(operation)
+    return build_steps([validate_step(operation, dict(pairs))])
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, every response has a Content-Length
+    timeout = idle_timeout
+    disable_nagle_algorithm = True  # Headers and body are separate writes, don't let the body wait for an ACK
+    server_version = "imagetoolkit"
+
+    def log_message(self, format, *args):
+        pass  # One line per request would cost more than a cached response
+
+    def send_bytes(self, status, data, content_type, headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        view = memoryview(data)
+        for start in range(0, len(view), chunk_size):
+            self.wfile.write(view[start:start + chunk_size])
+
+    def send_error_text(self, status, message):
+        count(self.server.state, "errors")
+        self.send_bytes(status, f"{message}\n".encode(), "text/plain; charset=utf-8")
+
+    def read_body(self):
+        """Return the request body, None after answering with an error."""
+        length = self.headers.get("Content-Length")
+        if length is None or not length.isdigit():
+            self.close_connection = True
+            self.send_error_text(411, "A Content-Length header is required")
+            return None
+        length = int(length)
+        if length > self.server.state["max_body"]:
+            self.close_connection = True  # The body is not read, so the connection can't be reused
+            self.send_error_text(413, f"The image is over the {self.server.state['max_body']} bytes limit")
+            return None
+
+        # The buffer grows with the bytes received, not with the length announced, and a body that
+        # doesn't start as an image is refused on its first bytes
+        body = bytearray()
+        while len(body) < length:
+            sniffed = len(body) >= signature_bytes
+            read = self.rfile.read1(min(chunk_size, length - len(body)))
+            if not read:
+                self.close_connection = True
+                return None  # Client gone
+            body += read
+            if not sniffed and len(body) >= min(signature_bytes, length) and not is_image_signature(bytes(body[:signature_bytes])):
+                self.close_connection = True  # The rest of the body is not read
+                self.send_error_text(415, "The body is not an image Pillow can read")
+                return None
+        return bytes(body)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/health":
+            self.send_bytes(200, b"ok\n", "text/plain; charset=utf-8")
+        elif path == "/":
+            operations = {"operations": list(pipeline_steps) + ["pipeline"], "usage": "POST the image to /<operation>?key=value&..."}
+            self.send_bytes(200, json.dumps(operations).encode(), "application/json")
+        else:
+            self.send_error_text(404, f"No such page: {path}")
+
+    def do_POST(self):
+        state = self.server.state
+        count(state, "requests")
+        url = urlsplit(self.path)
+        body = self.read_body()
+        if body is None:
+            return
+
+        try:
+            steps = request_steps(url.path, url.query)
+        except LookupError as e:
+            self.send_error_text(404, f"Unknown operation '{e}', use one of: {', '.join(pipeline_steps)}, pipeline")
+            return
+        except ValueError as e:
+            self.send_error_text(400, str(e))
+            return
+
+        key = hashlib.sha256(body)
+        key.update(json.dumps(steps, sort_keys=True, default=str).encode())
+        key = key.hexdigest()
+        entry = cache_get(state, key)
+        cache_status = "hit"
+        if entry is None:
+            cache_status = "miss"
+            try:
+                entry = run_in_pool(state, body, steps)
+            except UnidentifiedImageError:
+                self.send_error_text(415, "The body is not an image Pillow can read")
+                return
+            except BrokenProcessPool:
+                self.send_error_text(500, "The worker processing the image stopped")
+                return
+            except Image.DecompressionBombError as e:
+                self.send_error_text(413, str(e))
+                return
+            except (ValueError, OSError) as e:
+                self.send_error_text(400, f"Could not process the image: {e}")
+                return
+            except Exception as e:
+                self.send_error_text(500, f"Error processing the image: {e}")
+                return
+            cache_put(state, key, entry)
+        else:
+            count(state, "cache_hits")
+
+        data, extension = entry
+        content_type = Image.MIME.get(Image.registered_extensions().get(f".{extension}", ""), "application/octet-stream")
+        self.send_bytes(200, data, content_type, [("X-Cache", cache_status)])
+
+# Function to create the HTTP server (not started, see serve_forever)
+def create_server(host, port, state):
+    server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.daemon_threads = True
+    server.state = state
+    return server
+
+# Function to describe what a server did, in one line
+def summary_line(state):
+    stats = state["stats"]
+    return (f"Served {stats['requests']} requests, {stats['cache_hits']} from the cache, {stats['errors']} errors. "
+            f"Cache: {len(state['cache'])} results, {state['cache_bytes'] / 1024 ** 2:.1f} MB")
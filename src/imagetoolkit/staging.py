@@ -0,0 +1,149 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from contextlib import contextmanager
+import os
+import queue
+import threading
+from .outputs import write_file
+from .utils import display_msg
+from .variables import msg_allowed
+
+# Overlapped I/O for serial batches: reader threads fetch the bytes of the next images while the
+# current one is decoded, transformed and encoded, and a writer thread saves finished files behind.
+# Both sides are bounded, so at most `prefetch` inputs and `write_queue` outputs wait in memory.
+# With a memory limit, the inputs read ahead also stay under that many bytes in total: the files
+# that don't fit are not read ahead, the operation opens them itself (e.g. to process them in strips).
+
+# Staging settings of this process: None when staging is off
+settings = None
+
+# Bytes being read ahead, by absolute input path
+prefetched = {}
+
+# Pending writes of the current batch, None when write-behind is off
+writes = None
+write_errors = []
+
+# Outputs of the last batch that could not be written
+failed_paths = set()
+
+# Threads reading ahead per batch, reads mostly wait on the disk or the network
+reader_threads = 2
+
+# Function to turn staging on: prefetch inputs read ahead, write_queue outputs written behind (0 turns a side off)
+def enable(prefetch=4, write_queue=8, max_prefetch_bytes=None):
+    global settings
+    settings = {"prefetch": prefetch, "write_queue": write_queue, "max_prefetch_bytes": max_prefetch_bytes}
+
+# Function to tell if staging is on in this process
+def is_enabled():
+    return settings is not None and (settings["prefetch"] > 0 or settings["write_queue"] > 0)
+
+# Function to get the images of a batch item (convert passes (index, image) pairs, grouped filters lists of images)
+def images_of(item):
+    if isinstance(item, list):
+        return item
+    return [item[1] if isinstance(item, tuple) else item]
+
+def read_file(path):
+    with open(path, "rb") as file:
+        return file.read()
+
+# Function to get the bytes of an input read ahead, None if it wasn't prefetched
+def take_prefetched(path):
+    future = prefetched.pop(os.path.abspath(path), None)
+    return future.result() if future is not None else None
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0  # The operation reports the error when it opens the file
+
+# Function to yield the items while the next ones are read ahead, at most max_bytes of them if given
+def prefetch_items(items, input_dir, readers, depth, max_bytes=None):
+    ahead = deque()
+    items = iter(items)
+    ahead_bytes = 0
+
+    def fetch_next():
+        nonlocal ahead_bytes
+        item = next(items, None)
+        if item is None:
+            return False
+        paths = [os.path.abspath(os.path.join(input_dir, image)) for image in images_of(item)]
+        size = sum(file_size(path) for path in paths) if max_bytes is not None else 0
+        if max_bytes is not None and ahead_bytes + size > max_bytes:
+            ahead.append((item, [], 0))  # Over the budget: left for the operation to read
+            return True
+        for path in paths:
+            prefetched[path] = readers.submit(read_file, path)
+        ahead_bytes += size
+        ahead.append((item, paths, size))
+        return True
+
+    while len(ahead) < depth and fetch_next():
+        pass
+    while ahead:
+        item, paths, size = ahead.popleft()
+        fetch_next()  # The bytes of the current item still count until it is processed
+        yield item
+        ahead_bytes -= size
+        for path in paths:
+            prefetched.pop(path, None)  # Not opened (e.g. skipped by the operation), don't keep its bytes
+
+def write_loop(jobs):
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        path, data = job
+        try:
+            write_file(path, data)
+        except Exception as e:  # Any error fails this output only: a dead writer would block the batch on a full queue
+            write_errors.append((path, e))
+
+# Function to hand an output to the writer thread, returns False when write-behind is off
+def queue_write(path, data):
+    if writes is None:
+        return False
+    writes.put((path, data))  # Blocks while the queue is full, which caps the memory held by outputs
+    return True
+
+# Context manager running a serial batch with read-ahead and write-behind, yields the items to process
+@contextmanager
+def staged(items, input_dir):
+    global writes
+    readers = writer = None
+
+    if settings["prefetch"] > 0:
+        readers = ThreadPoolExecutor(max_workers=reader_threads)
+        items = prefetch_items(items, input_dir, readers, settings["prefetch"], settings.get("max_prefetch_bytes"))
+    if settings["write_queue"] > 0:
+        writes = queue.Queue(maxsize=settings["write_queue"])
+        writer = threading.Thread(target=write_loop, args=(writes,), daemon=True)
+        writer.start()
+
+    try:
+        yield items
+    finally:
+        # Every output is on disk before the batch returns
+        if writer is not None:
+            writes.put(None)
+            writer.join()
+            writes = None
+        if readers is not None:
+            readers.shutdown(wait=True)
+            prefetched.clear()
+
+        failed_paths.clear()
+        for path, error in write_errors:
+            display_msg(f"Error writing {path}: {error}", msg_allowed["ERROR"], False)
+            failed_paths.add(str(path))
+        write_errors.clear()
+
+# Function to turn the results whose output could not be written behind into None, as for any failed image
+def drop_failed(results):
+    if not failed_paths:
+        return results
+    return [None if any(path in failed_paths for path in (result if isinstance(result, list) else [result])) else result for result in results]
@@ -0,0 +1,322 @@
+# Tiled, memory-bounded processing for images too large to decode at once.
+# Uncompressed rasters (BMP, PPM, raw TIFF strips or tiles) are read a strip of rows at a
+# time; each strip is processed with the extra rows a kernel needs and written as it comes.
+from PIL import Image
+import argparse
+import math
+import os
+import re
+import struct
+import zlib
+from .outputs import temp_path_for, commit_file, discard
+from .utils import display_msg
+from .variables import msg_allowed
+
+# Bytes per pixel of the raw modes that can be sliced row by row
+raw_mode_bytes = {
+    "L": 1, "P": 1, "LA": 2, "I;16": 2, "I;16B": 2, "I;16N": 2,
+    "RGB": 3, "BGR": 3, "RGBA": 4, "RGBX": 4, "BGRA": 4, "BGRX": 4, "CMYK": 4,
+}
+
+# Rough number of strip-sized buffers alive at once (input strip, converted copy, filtered copy, output)
+buffers_per_strip = 4
+
+# Function to turn "512MB", "2GB" or a number of bytes into bytes
+def parse_memory_limit(value):
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?)B?\s*", str(value).upper())
+    if not match:
+        raise ValueError(f"Invalid memory limit '{value}', use e.g. 512MB or 2GB")
+    number, unit = match.groups()
+    return int(float(number) * {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}[unit])
+
+# argparse type for --memory-limit
+def memory_limit_argument(value):
+    try:
+        return parse_memory_limit(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+# Function to estimate the memory Pillow needs for one decoded row of an image
+def row_size(img):
+    # Pillow keeps multi-band images in 4 bytes per pixel
+    return img.width * (1 if img.mode in ("1", "L", "P") else 4)
+
+# Function to estimate the memory Pillow needs to hold a decoded image
+def decoded_size(img):
+    return row_size(img) * img.height
+
+# Function to tell if an image should be processed in strips under the memory limit
+def needs_tiling(img, memory_limit):
+    return bool(memory_limit) and decoded_size(img) > memory_limit
+
+# Function to compute the tiles that decode rows [y0, y1) of an opened (not loaded) image
+def row_tiles(img, y0, y1):
+    """Return (tiles, first_row, last_row) for a strip covering at least [y0, y1), or None if the file can't be sliced."""
+    tiles = img.tile
+    if len(tiles) == 1:
+        decoder, extents, offset, args = tiles[0]
+        if decoder != "raw" or extents != (0, 0) + img.size:
+            return None
+        rawmode, stride, orientation = (args, 0, 1) if isinstance(args, str) else (tuple(args) + (0, 1))[:3]
+        if rawmode not in raw_mode_bytes:
+            return None
+        stride = stride or img.width * raw_mode_bytes[rawmode]
+        # Bottom-up files (BMP) store the last row first
+        first_row = y0 if orientation >= 0 else img.height - y1
+        return [("raw", (0, 0, img.width, y1 - y0), offset + first_row * stride, (rawmode, stride, orientation))], y0, y1
+
+    if any(tile[0] not in ("raw", "packbits") for tile in tiles):
+        return None
+
+    selected = [tile for tile in tiles if tile[1][1] < y1 and tile[1][3] > y0]
+    first_row = min(tile[1][1] for tile in selected)
+    last_row = max(tile[1][3] for tile in selected)
+    shifted = [(decoder, (x0, ty0 - first_row, x1, ty1 - first_row), offset, args) for decoder, (x0, ty0, x1, ty1), offset, args in selected]
+    return shifted, first_row, last_row
+
+# Function to decode only rows [y0, y1) of an image file
+def open_rows(image_path, y0, y1):
+    """Return an image holding exactly rows [y0, y1), or None if the file can't be read in strips."""
+    img = Image.open(image_path)
+    plan = row_tiles(img, y0, y1)
+    if plan is None:
+        img.close()
+        return None
+
+    tiles, first_row, last_row = plan
+    img.tile = tiles
+    img._size = (img.width, last_row - first_row)
+    if hasattr(img, "_tile_size"):
+        img._tile_size = img._size  # TIFF allocates the decoded image from this size
+    img.load()
+
+    if (first_row, last_row) != (y0, y1):
+        return img.crop((0, y0 - first_row, img.width, y1 - first_row))
+    return img
+
+# Function to tell if a file can be read in strips without decoding it whole
+def can_read_strips(img):
+    return row_tiles(img, 0, 1) is not None
+
+# Function to decide if an opened image is processed in strips, telling the user when it can't be
+def use_strips(img, image, memory_limit):
+    if not needs_tiling(img, memory_limit):
+        return False
+    if not can_read_strips(img):
+        display_msg(f"Image {image} is larger than the memory limit but its format can't be read in strips, decoding it whole", msg_allowed["INFO"], False)
+        return False
+    return True
+
+# Function to choose how many output rows to produce per strip
+def rows_per_strip(source_row_bytes, source_rows_per_output_row, margin, memory_limit):
+    budget = memory_limit // (buffers_per_strip * max(1, source_row_bytes))
+    rows = int((budget - 2 * margin) / max(source_rows_per_output_row, 1e-9))
+    return max(1, rows)
+
+# --- Progressive writers: each returns (write_strip, close) or None if the format/mode isn't supported ---
+
+def png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+def open_png_writer(output_path, size, mode):
+    color_types = {"L": 0, "RGB": 2, "LA": 4, "RGBA": 6}
+    if mode not in color_types:
+        return None
+
+    file = open(output_path, "wb")
+    file.write(b"\x89PNG\r\n\x1a\n")
+    file.write(png_chunk(b"IHDR", struct.pack(">IIBBBBB", size[0], size[1], 8, color_types[mode], 0, 0, 0)))
+    compressor = zlib.compressobj(6)
+    row_bytes = size[0] * len(mode)
+
+    def write_strip(strip):
+        data = strip.tobytes()
+        # Filter type 0 (None) in front of every row
+        rows = b"".join(b"\x00" + data[i:i + row_bytes] for i in range(0, len(data), row_bytes))
+        compressed = compressor.compress(rows)
+        if compressed:
+            file.write(png_chunk(b"IDAT", compressed))
+
+    def close():
+        file.write(png_chunk(b"IDAT", compressor.flush()))
+        file.write(png_chunk(b"IEND", b""))
+        file.close()
+
+    return write_strip, close
+
+def open_tiff_writer(output_path, size, mode):
+    photometric = {"L": 1, "RGB": 2, "RGBA": 2}
+    if mode not in photometric:
+        return None
+
+    file = open(output_path, "wb")
+    file.write(b"II*\x00\x00\x00\x00\x00")  # Header, the IFD offset is patched on close
+    offsets, byte_counts, rows_per = [], [], []
+
+    def write_strip(strip):
+        offsets.append(file.tell())
+        data = strip.tobytes()
+        file.write(data)
+        byte_counts.append(len(data))
+        rows_per.append(strip.height)
+
+    def close():
+        bands = len(mode)
+        extra = []
+
+        # Arrays that don't fit in the 4 bytes of an entry go after the IFD
+        def entry(tag, kind, values):
+            extra.append((tag, kind, values))
+
+        entry(256, 4, [size[0]])
+        entry(257, 4, [size[1]])
+        entry(258, 3, [8] * bands)
+        entry(259, 3, [1])
+        entry(262, 3, [photometric[mode]])
+        entry(273, 4, offsets)
+        entry(277, 3, [bands])
+        entry(278, 4, [max(rows_per)])
+        entry(279, 4, byte_counts)
+        if mode == "RGBA":
+            entry(338, 3, [2])  # Unassociated alpha
+
+        if file.tell() % 2:
+            file.write(b"\x00")
+        ifd_offset = file.tell()
+        data_offset = ifd_offset + 2 + 12 * len(extra) + 4
+        entries, payload = b"", b""
+        for tag, kind, values in extra:
+            packed = struct.pack("<" + ("H" if kind == 3 else "I") * len(values), *values)
+            if len(packed) <= 4:
+                entries += struct.pack("<HHI", tag, kind, len(values)) + packed.ljust(4, b"\x00")
+            else:
+                entries += struct.pack("<HHII", tag, kind, len(values), data_offset + len(payload))
+                payload += packed
+        file.write(struct.pack("<H", len(extra)) + entries + b"\x00\x00\x00\x00" + payload)
+        file.seek(4)
+        file.write(struct.pack("<I", ifd_offset))
+        file.close()
+
+    return write_strip, close
+
+def open_bmp_writer(output_path, size, mode):
+    if mode not in ("L", "RGB"):
+        return None
+
+    bits = 8 if mode == "L" else 24
+    row_bytes = (size[0] * bits // 8 + 3) & ~3
+    palette = b"".join(bytes((i, i, i, 0)) for i in range(256)) if mode == "L" else b""
+    header_size = 14 + 40 + len(palette)
+
+    file = open(output_path, "wb")
+    file.write(b"BM" + struct.pack("<IHHI", header_size + row_bytes * size[1], 0, 0, header_size))
+    # Negative height: rows are stored top-down, so they can be written as they come
+    file.write(struct.pack("<IiiHHIIiiII", 40, size[0], -size[1], 1, bits, 0, row_bytes * size[1], 2835, 2835, 256 if palette else 0, 0))
+    file.write(palette)
+
+    def write_strip(strip):
+        data = strip.tobytes("raw", "BGR" if mode == "RGB" else "L")
+        line = size[0] * bits // 8
+        padding = b"\x00" * (row_bytes - line)
+        file.write(b"".join(data[i:i + line] + padding for i in range(0, len(data), line)))
+
+    return write_strip, file.close
+
+def open_ppm_writer(output_path, size, mode):
+    if mode not in ("L", "RGB"):
+        return None
+
+    file = open(output_path, "wb")
+    file.write(b"%s\n%d %d\n255\n" % (b"P5" if mode == "L" else b"P6", size[0], size[1]))
+
+    def write_strip(strip):
+        file.write(strip.tobytes())
+
+    return write_strip, file.close
+
+strip_writers = {
+    "PNG": open_png_writer,
+    "TIFF": open_tiff_writer,
+    "TIF": open_tiff_writer,
+    "BMP": open_bmp_writer,
+    "PPM": open_ppm_writer,
+}
+
+# Function to write strips to a file, progressively when the format allows it
+def open_strip_writer(output_path, output_format, size, mode, save_params=None, name=None):
+    opener = strip_writers.get(output_format.upper())
+    writer = opener(output_path, size, mode) if opener else None
+    if writer is not None:
+        return writer
+
+    # Fallback: assemble the strips in one canvas and let Pillow encode it at the end.
+    # The source is still read in strips, but the whole output is held in memory.
+    display_msg(f"Image {name or output_path}: {output_format.upper()} ({mode}) can't be written in strips, the output is assembled whole in memory and can go over the memory limit", msg_allowed["WARNING"], False)
+    canvas = Image.new(mode, size)
+    position = [0]
+
+    def write_strip(strip):
+        canvas.paste(strip, (0, position[0]))
+        position[0] += strip.height
+
+    def close():
+        canvas.save(output_path, format=output_format.upper(), **(save_params or {}))
+
+    return write_strip, close
+
+# Function to drive a strip-by-strip operation
+def run_strips(output_path, output_format, output_size, rows, produce, save_params=None):
+    """Call produce(y0, y1) for every strip of output rows and write each result as it comes."""
+    temp_path = temp_path_for(output_path)  # Renamed over output_path once every strip is written
+    writer = None
+    try:
+        for y0 in range(0, output_size[1], rows):
+            strip = produce(y0, min(output_size[1], y0 + rows))
+            if writer is None:
+                writer = open_strip_writer(temp_path, output_format, output_size, strip.mode, save_params, os.path.basename(output_path))
+            writer[0](strip)
+        writer[1]()
+    except BaseException:
+        discard(temp_path)
+        raise
+    commit_file(temp_path, output_path)
+    return str(output_path)
+
+# Function to resize a large image in strips
+def tiled_resize(image_path, output_path, output_format, new_size, resample, memory_limit):
+    with Image.open(image_path) as img:
+        width, height = img.size
+        row_bytes = row_size(img)
+
+    new_width, new_height = new_size
+    scale_y = height / new_height
+    # Rows of support the resampling filter reads around each output row
+    support = {Image.Resampling.NEAREST: 0, Image.Resampling.BILINEAR: 1, Image.Resampling.BICUBIC: 2}.get(resample, 3)
+    margin = math.ceil(support * max(scale_y, 1)) + 1
+
+    def produce(y0, y1):
+        top, bottom = y0 * scale_y, y1 * scale_y
+        read_top, read_bottom = max(0, int(top) - margin), min(height, math.ceil(bottom) + margin)
+        strip = open_rows(image_path, read_top, read_bottom)
+        return strip.resize((new_width, y1 - y0), resample, box=(0, top - read_top, width, bottom - read_top))
+
+    rows = rows_per_strip(row_bytes, scale_y, margin, memory_limit)
+    return run_strips(output_path, output_format, new_size, rows, produce)
+
+# Function to run a row-local operation on a large image in strips
+def tiled_map(image_path, output_path, output_format, margin, process, memory_limit, save_params=None):
+    """
+    process(strip) must give the same rows as on the whole image as long as it sees margin
+    extra rows above and below (per-pixel filters need 0, a 3x3 kernel 1, a 5x5 kernel 2).
+    """
+    with Image.open(image_path) as img:
+        size = img.size
+        row_bytes = row_size(img)
+
+    def produce(y0, y1):
+        read_top, read_bottom = max(0, y0 - margin), min(size[1], y1 + margin)
+        strip = process(open_rows(image_path, read_top, read_bottom))
+        return strip.crop((0, y0 - read_top, size[0], y1 - read_top))
+
+    rows = rows_per_strip(row_bytes, 1, margin, memory_limit)
+    return run_strips(output_path, output_format, size, rows, produce, save_params)
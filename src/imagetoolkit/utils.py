@@ -1,8 +1,10 @@
-import questionary
 import os
 from pathlib import Path
 from sys import exit
-from .variables import valid_extensions, style, options_main_menu, msg_allowed
+from .variables import valid_extensions, options_main_menu, msg_allowed
+
+# The prompt helpers import questionary (and the prompt_toolkit style) when first called,
+# so the CLI batch path, which only needs display_msg, never loads the interactive stack
 
 # Welcome function that displays an introductory ASCII art and text
 def welcome():
@@ -30,6 +32,9 @@ def welcome():
 
 # Function to select an option from the main menu
 def select_option():
+  import questionary
+  from .variables import style
+
   option = questionary.select(
     "What do you want ImageToolkit to do for you?",
     choices=list(options_main_menu.values()),
@@ -40,6 +45,8 @@ def select_option():
 
 # Function to ask the user for a directory path
 def ask_for_path(output=False):
+  import questionary
+  from .variables import style
 
   if not output:
     display_msg("Note: Type '..' to back menu list", msg_allowed["INFO"])
@@ -66,6 +73,9 @@ def ask_for_path(output=False):
 
 # Function to ask the user to select image files from a specified directory
 def ask_for_images(path):
+  import questionary
+  from .variables import style
+
   images_dir = []
   selected_images_dir = []
 
@@ -95,6 +105,9 @@ def ask_for_images(path):
 
 # Function to select a single option from a list of choices
 def qselect(message, options):
+  import questionary
+  from .variables import style
+
   return questionary.select(
     message,
     choices=options,
@@ -117,7 +130,18 @@ def display_msg(msg, type_msg, spaces=True):
       color = "\033[1;37m\033[102m"  # White text (37m), green background (42m)
 
   # Print the message with the specified color styles
-  print(f"{color} {msg} \033[0m")  # \033[0m resets the color styles
+  # \033[0m resets the color styles, the line is written and flushed in one go so parallel workers don't mix lines
+  print(f"{color} {msg} \033[0m\n", end="", flush=True)
 
   if spaces:
     print()
+
+# Directories already created by ensure_parent_dir in this process
+created_dirs = set()
+
+# Function to create the parent directory of an output file (once per directory and process)
+def ensure_parent_dir(file_path):
+  parent = os.path.dirname(os.path.abspath(file_path))
+  if parent not in created_dirs:
+    os.makedirs(parent, exist_ok=True)
+    created_dirs.add(parent)
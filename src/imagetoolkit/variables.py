@@ -1,10 +1,9 @@
-from prompt_toolkit.styles import Style
-
 # Define valid image file extensions
 valid_extensions = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp')
 
 # Define the style for customizing margins and spacing in the user interface
-style = Style([
+# (turned into a prompt_toolkit Style on first use, see __getattr__ below)
+style_rules = [
   ('qmark', 'fg:#32cf4c bold'),       # Token in front of the question
   ('question', 'bold'),               # Style for the question text
   ('answer', 'fg:#32cf4c bold'),      # Submitted answer text behind the question
@@ -15,7 +14,7 @@ style = Style([
   ('instruction', ''),                # User instructions for select, rawselect, checkbox
   ('text', ''),                       # Plain text style
   ('disabled', 'fg:#858585 italic')   # Disabled choices for select and checkbox prompts
-])
+]
 
 # Main menu options with their corresponding descriptions
 options_main_menu = {
@@ -51,3 +50,11 @@ fonts_dir = 'fonts/'
 
 # Allowed file size limits (in kilobytes)
 allowed_limits_kb = ["2048 KB", "1500 KB", "1024 KB", "512 KB", "256 KB"]
+
+# Build the interactive style lazily, so the CLI batch path never imports prompt_toolkit
+def __getattr__(name):
+  if name == "style":
+    from prompt_toolkit.styles import Style
+    globals()["style"] = Style(style_rules)
+    return globals()["style"]
+  raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
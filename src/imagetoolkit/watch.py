@@ -0,0 +1,340 @@
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+from functools import partial
+from pathlib import Path
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import signal
+import struct
+import threading
+import time
+from .discovery import iter_images, matches_any
+from .executor import init_worker, run_item, queue_depth_per_job
+from .manifest import load_manifest, save_manifest, pending_images, record_results, fingerprint
+from .pipeline import pipeline_image, warm_up
+from .profiler import percentile
+from .utils import display_msg
+from .variables import msg_allowed, valid_extensions
+
+# Watch mode: a long-lived process keeps a pool of workers that have already imported everything and
+# run the pipeline steps once, and hands them each image of the input directory as soon as it has
+# finished landing there. New files are seen through inotify on Linux, by polling the directory elsewhere.
+#
+# A file is processed once it is complete: closed after writing or moved in (inotify), or unchanged
+# in size and mtime for `settle` seconds (polling, or a file still open). At most queue_depth_per_job
+# files per worker are in flight, the others wait their turn as paths, so a burst of files never
+# piles up images in memory. What was processed is kept in the manifest of the output directory,
+# so a restarted watcher only processes the files that changed while it was down.
+
+backends = ("auto", "inotify", "poll")
+
+# inotify events (see inotify(7))
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+IN_ISDIR = 0x40000000
+watched_events = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+event_header = struct.Struct("iIII")  # wd, mask, cookie, length of the name
+
+# Seconds the loop waits for events before checking the files still settling and the workers
+tick = 0.05
+
+# Seconds between two saves of the manifest while files keep coming
+manifest_interval = 10.0
+
+# Function to load the C library if it has inotify (Linux), None otherwise
+def load_inotify():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1, libc.inotify_add_watch  # AttributeError elsewhere (macOS, BSD)
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+# Function to tell if a path relative to the input directory is an image the watcher processes
+def is_watched_image(watcher, relative_path):
+    if os.path.splitext(relative_path)[1].lower() not in valid_extensions:
+        return False
+    if watcher["include"] and not matches_any(relative_path, watcher["include"]):
+        return False
+    return not (watcher["exclude"] and matches_any(relative_path, watcher["exclude"]))
+
+# Function to list the images of the input directory
+def list_images(watcher):
+    return iter_images(watcher["input_dir"], watcher["recursive"], watcher["include"], watcher["exclude"], skip_dirs=watcher["skip_dirs"])
+
+# Function to start watching the input directory with inotify or polling
+def open_watcher(input_dir, recursive=False, include=None, exclude=None, skip_dirs=(), backend="auto", poll_interval=1.0):
+    watcher = {
+        "input_dir": str(input_dir), "recursive": recursive, "include": include or [], "exclude": exclude or [],
+        "skip_dirs": [os.path.abspath(path) for path in skip_dirs], "poll_interval": poll_interval,
+        "backend": "poll", "fd": None, "dirs": {}, "seen": {}, "next_poll": 0.0,
+    }
+    libc = load_inotify() if backend != "poll" else None
+    if backend == "inotify" and libc is None:
+        raise OSError("inotify is not available on this system, use --backend poll")
+
+    if libc is not None:
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd >= 0:
+            watcher.update(backend="inotify", fd=fd, libc=libc)
+            add_directory(watcher, "")
+            return watcher
+        if backend == "inotify":
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    # Polling compares the size and mtime of every image with the last scan: prime it with the current files
+    watcher["seen"] = scan_signatures(watcher)
+    watcher["next_poll"] = time.monotonic() + poll_interval
+    return watcher
+
+# Function to watch a directory (and, recursively, its subdirectories), returns the images already in it
+def add_directory(watcher, relative_dir):
+    path = os.path.join(watcher["input_dir"], relative_dir)
+    wd = watcher["libc"].inotify_add_watch(watcher["fd"], os.fsencode(path), watched_events)
+    if wd < 0:
+        display_msg(f"Could not watch {path}: {os.strerror(ctypes.get_errno())}", msg_allowed["WARNING"], False)
+        return []
+    watcher["dirs"][wd] = relative_dir
+
+    found = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            relative_path = relative_dir + entry.name
+            if entry.is_dir(follow_symlinks=False):
+                if watcher["recursive"] and not matches_any(relative_path, watcher["exclude"]) and os.path.abspath(entry.path) not in watcher["skip_dirs"]:
+                    found.extend(add_directory(watcher, relative_path + "/"))
+            elif is_watched_image(watcher, relative_path):
+                found.append(relative_path)
+    return found
+
+# Function to get the (size, mtime) of every image of the input directory
+def scan_signatures(watcher):
+    signatures = {}
+    for image in list_images(watcher):
+        try:
+            current = fingerprint(os.path.join(watcher["input_dir"], image))
+        except OSError:
+            continue  # Gone since the listing
+        signatures[image] = (current["size"], current["mtime_ns"])
+    return signatures
+
+# Function to wait up to timeout seconds for changes, returns (image, complete) pairs
+def read_events(watcher, timeout):
+    """complete is True when the event says the writer is done with the file (closed or moved in)."""
+    if watcher["backend"] == "poll":
+        wait_time = watcher["next_poll"] - time.monotonic()
+        if wait_time > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(0.0, wait_time))
+        watcher["next_poll"] = time.monotonic() + watcher["poll_interval"]
+        signatures = scan_signatures(watcher)
+        changed = [(image, False) for image, signature in signatures.items() if watcher["seen"].get(image) != signature]
+        watcher["seen"] = signatures
+        return changed
+
+    readable, _, _ = select.select([watcher["fd"]], [], [], timeout)
+    if not readable:
+        return []
+    try:
+        data = os.read(watcher["fd"], 64 * 1024)
+    except BlockingIOError:
+        return []
+
+    changes = []
+    offset = 0
+    while offset < len(data):
+        wd, mask, _, length = event_header.unpack_from(data, offset)
+        name = os.fsdecode(data[offset + event_header.size:offset + event_header.size + length].rstrip(b"\0"))
+        offset += event_header.size + length
+
+        if mask & IN_Q_OVERFLOW:
+            # The kernel dropped events: look at every file again
+            changes.extend((image, False) for image in list_images(watcher))
+            continue
+        relative_dir = watcher["dirs"].get(wd)
+        if relative_dir is None or not name:
+            continue
+        relative_path = relative_dir + name
+
+        if mask & IN_ISDIR:
+            if watcher["recursive"] and mask & (IN_CREATE | IN_MOVED_TO) and not matches_any(relative_path, watcher["exclude"]) \
+                    and os.path.abspath(os.path.join(watcher["input_dir"], relative_path)) not in watcher["skip_dirs"]:
+                # Files may have landed before the watch was in place
+                changes.extend((image, False) for image in add_directory(watcher, relative_path + "/"))
+        elif is_watched_image(watcher, relative_path):
+            changes.append((relative_path, bool(mask & (IN_CLOSE_WRITE | IN_MOVED_TO))))
+    return changes
+
+def close_watcher(watcher):
+    if watcher["fd"] is not None:
+        os.close(watcher["fd"])
+        watcher["fd"] = None
+
+# Function to keep track of a file that changed, until it is complete
+def note_change(watcher, settling, image, complete, now):
+    entry = settling.setdefault(image, {"signature": None, "changed_at": now, "complete": False})
+    entry["complete"] = complete
+    if complete:
+        # Complete as it is now: ready as soon as a check finds it unchanged
+        try:
+            current = fingerprint(os.path.join(watcher["input_dir"], image))
+            entry["signature"] = (current["size"], current["mtime_ns"])
+        except OSError:
+            entry["signature"] = None
+
+# Function to take the files that finished landing out of settling, returns (image, fingerprint) pairs
+def settled_images(watcher, settling, settle, now):
+    ready = []
+    for image, entry in list(settling.items()):
+        try:
+            current = fingerprint(os.path.join(watcher["input_dir"], image))
+        except OSError:
+            del settling[image]  # Removed, or moved away, before it was complete
+            continue
+
+        signature = (current["size"], current["mtime_ns"])
+        if signature != entry["signature"]:
+            entry.update(signature=signature, changed_at=now, complete=False)
+            continue
+        if current["size"] > 0 and (entry["complete"] or now - entry["changed_at"] >= settle):
+            del settling[image]
+            ready.append((image, current))
+    return ready
+
+# Function run once in every worker process: the usual setup, then the steps on a blank image
+def init_watch_worker(steps):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C stops the watcher, which lets the workers finish their image
+    init_worker()
+    try:
+        warm_up(steps)
+    except Exception as e:
+        display_msg(f"Could not warm up the worker: {e}", msg_allowed["WARNING"], False)
+
+def worker_ready():
+    return os.getpid()
+
+# Function to start the pool and wait until every worker is warm
+def start_pool(jobs, steps):
+    pool = ProcessPoolExecutor(max_workers=jobs, initializer=init_watch_worker, initargs=(steps,))
+    wait([pool.submit(worker_ready) for _ in range(jobs)])
+    return pool
+
+# Function to describe a watch session in one line
+def summary_line(stats):
+    line = f"Watch: {stats['processed']} images processed, {stats['failed']} failed"
+    latencies = sorted(stats["latencies"])
+    if latencies:
+        line += (f", latency from landing to output {percentile(latencies, 50) * 1000:.0f} ms median, "
+                 f"{percentile(latencies, 95) * 1000:.0f} ms p95, {latencies[-1] * 1000:.0f} ms max")
+    return line + f", at most {stats['max_backlog']} images waiting for a worker"
+
+# Function to watch input_dir and run the pipeline steps on every image that lands in it, until stop is set
+def watch(input_dir, output_dir, steps, operation, jobs=1, recursive=False, include=None, exclude=None, settle=0.5, poll_interval=1.0, backend="auto", new_only=False, stop=None, on_result=None):
+    """
+    Return the stats of the session. steps are validated pipeline steps (see pipeline.build_steps) and
+    operation the manifest description of the run. stop is a threading.Event, set to end the session:
+    the images being processed are finished, those still landing are left to the next session.
+    on_result(image, result, latency) is called for every image processed (result None if it failed).
+
+    The latency runs from the file's last write (its mtime) to its output being written,
+    so it includes the settle time. Files already there at the start are not counted in it.
+    """
+    input_dir, output_dir = Path(input_dir), Path(output_dir)
+    stop = stop or threading.Event()
+    started = time.time()
+
+    watcher = open_watcher(input_dir, recursive, include, exclude, [output_dir], backend, poll_interval)
+    manifest = load_manifest(output_dir)
+    manifest_saved = time.monotonic()
+    manifest_dirty = False
+
+    worker = partial(pipeline_image, input_dir, output_dir, steps)
+    max_in_flight = jobs * queue_depth_per_job
+    settling, ready, in_flight = {}, deque(), {}
+    # Futures with the time their output was written, queued by their done callback: a future is
+    # collected only once its callback has run (done() is already true before the callbacks run)
+    finished = queue.SimpleQueue()
+    stats = {"processed": 0, "failed": 0, "latencies": [], "max_backlog": 0}
+
+    def collect(future, finished_at):
+        nonlocal manifest_dirty
+        image, current = in_flight.pop(future)
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            display_msg(f"Error processing image {image}: the worker process stopped", msg_allowed["ERROR"], False)
+        result = future.result() if error is None else None
+
+        landed = current["mtime_ns"] / 1e9
+        latency = finished_at - landed
+        if result is None:
+            stats["failed"] += 1
+        else:
+            stats["processed"] += 1
+            if landed >= started:
+                stats["latencies"].append(latency)
+        record_results(manifest, {"processed": [(image, current)]}, [result], operation)
+        manifest_dirty = True
+        if on_result is not None:
+            on_result(image, result, latency)
+        return error
+
+    pool = None
+    try:
+        pool = start_pool(jobs, steps)
+        display_msg(f"Watching {input_dir} ({watcher['backend']}) with {jobs} warm worker(s), outputs in {output_dir}. Press Ctrl+C to stop.", msg_allowed["INFO"], True)
+
+        # Images already there: only those new or changed since the last session
+        if not new_only:
+            plan = {"skipped": 0, "processed": []}
+            for image in pending_images(manifest, input_dir, list_images(watcher), operation, False, plan):
+                note_change(watcher, settling, image, False, time.time())
+            if plan["skipped"]:
+                display_msg(f"{plan['skipped']} images already processed are skipped.", msg_allowed["INFO"], False)
+
+        while not stop.is_set():
+            for image, complete in read_events(watcher, tick):
+                note_change(watcher, settling, image, complete, time.time())
+            ready.extend(settled_images(watcher, settling, settle, time.time()))
+            stats["max_backlog"] = max(stats["max_backlog"], len(ready))
+
+            # Backpressure: a bounded number of tasks per worker, the rest wait here as paths
+            while ready and len(in_flight) < max_in_flight:
+                image, current = ready.popleft()
+                future = pool.submit(run_item, worker, image)
+                in_flight[future] = (image, current)
+                future.add_done_callback(lambda f: finished.put((f, time.time())))
+
+            errors = []
+            while not finished.empty():
+                errors.append(collect(*finished.get()))
+            if any(isinstance(error, BrokenProcessPool) for error in errors) and not in_flight:
+                # A worker died (e.g. killed for using too much memory): carry on with a fresh pool
+                pool.shutdown(wait=False)
+                pool = start_pool(jobs, steps)
+
+            if manifest_dirty and time.monotonic() - manifest_saved >= manifest_interval:
+                save_manifest(output_dir, manifest)
+                manifest_saved, manifest_dirty = time.monotonic(), False
+
+        # Graceful stop: finish what the workers have, leave the rest to the next session
+        while in_flight:
+            collect(*finished.get())
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        close_watcher(watcher)
+        if manifest_dirty:
+            save_manifest(output_dir, manifest)
+
+    left = len(ready) + len(settling)
+    if left:
+        display_msg(f"{left} images not processed yet are left for the next session.", msg_allowed["INFO"], False)
+    return stats
@@ -0,0 +1,16 @@
+import os
+import sys
+import pytest
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The package lives in src/, run the tests against it without installing it
+sys.path.insert(0, os.path.join(repo_dir, "src"))
+
+# The benchmarks are a package at the root of the repo
+sys.path.insert(1, repo_dir)
+
+# A font of the repo, by absolute path: fonts_dir is relative to the directory the CLI runs from
+@pytest.fixture
+def font():
+    return os.path.join(repo_dir, "fonts", "Roboto.ttf")
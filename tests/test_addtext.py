@@ -0,0 +1,62 @@
+import pytest
+from PIL import Image, ImageChops, ImageDraw
+from imagetoolkit.addtext import bucket_font_size, draw_text, load_font, render_text_layer
+
+positions = ["Top Left", "Top Right", "Center", "Bottom Left", "Bottom Right"]
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    render_text_layer.cache_clear()
+    load_font.cache_clear()
+
+# Function to draw the text the way the command did before the layers were cached
+def draw_directly(img, text, position_choice, font, font_size, color):
+    draw = ImageDraw.Draw(img)
+    font = load_font(font, font_size)
+    left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+    width, height = right - left, bottom - top
+    position = {"Top Left": (10, 10), "Top Right": (img.width - width - 10, 10),
+                "Center": ((img.width - width) // 2, (img.height - height) // 2),
+                "Bottom Left": (10, img.height - height - 10),
+                "Bottom Right": (img.width - width - 10, img.height - height - 10)}[position_choice]
+    draw.text(position, text, font=font, fill=color)
+    return img
+
+# Function to get the largest difference between two images in any band
+def max_difference(image, reference):
+    extrema = ImageChops.difference(image, reference).getextrema()
+    return max(high for _, high in extrema) if image.mode != "L" else extrema[1]
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L"])
+@pytest.mark.parametrize("position", positions)
+def test_cached_layer_matches_drawing_the_text(font, mode, position):
+    background = Image.linear_gradient("L").resize((400, 300)).convert(mode)
+    drawn = draw_text(background.copy(), "Hello, world", position, font, 10.0, "orange")
+    expected = draw_directly(background.copy(), "Hello, world", position, font, bucket_font_size(40), "orange")
+    assert max_difference(drawn, expected) <= 1
+
+def test_images_of_nearly_the_same_width_share_one_layer(font):
+    for width in (1000, 1004, 1008, 1000):
+        draw_text(Image.new("RGB", (width, 500)), "hello", "Center", font, 5.0, "white")
+    info = render_text_layer.cache_info()
+    assert (info.misses, info.hits) == (1, 3)
+    assert load_font.cache_info().misses == 1
+
+def test_another_text_or_color_renders_a_new_layer(font):
+    image = Image.new("RGB", (1000, 500))
+    for text, color in (("hello", "white"), ("hello", "red"), ("bye", "red"), ("hello", "white")):
+        draw_text(image, text, "Center", font, 5.0, color)
+    info = render_text_layer.cache_info()
+    assert (info.misses, info.hits) == (3, 1)
+    assert load_font.cache_info().misses == 1
+
+def test_font_size_buckets_stay_within_two_percent():
+    assert bucket_font_size(0) == bucket_font_size(1) == 1
+    for size in range(2, 500):
+        assert abs(bucket_font_size(size) - size) <= max(1, size * 0.02)
+    assert bucket_font_size(50) == bucket_font_size(50.4)
+
+def test_text_larger_than_an_rgba_image_is_cropped(font):
+    image = Image.new("RGBA", (40, 30), (0, 0, 0, 255))
+    draw_text(image, "a very long line of text", "Center", font, 50.0, "white")
+    assert image.size == (40, 30) and image.getextrema()[0][1] > 0
@@ -0,0 +1,112 @@
+from io import BytesIO
+from pathlib import Path
+import pytest
+from PIL import Image, ImageChops
+from imagetoolkit import api
+from imagetoolkit.addtext import add_text_to_single_image
+from imagetoolkit.color import filter_image
+from imagetoolkit.compress import compress_image
+from imagetoolkit.extension import convert_image
+from imagetoolkit.formats import encoder_params
+from imagetoolkit.pipeline import build_steps, pipeline_image
+from imagetoolkit.rescale import resize_image, thumbnail_image, pyramid_image
+
+steps = ["resize:mode=scale,percentage=50", "filter:filter=SEPIA", "convert:format=WEBP"]
+
+@pytest.fixture
+def input_dir(tmp_path):
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    photo = Image.merge("RGB", [Image.linear_gradient("L").resize((400, 300)), Image.effect_noise((400, 300), 50), Image.linear_gradient("L").rotate(90).resize((400, 300))])
+    photo.save(input_dir / "photo.png")
+    photo.save(input_dir / "photo.jpg", quality=90)
+    return input_dir
+
+@pytest.fixture
+def output_dir(tmp_path):
+    return tmp_path / "out"
+
+# Function to give the API an input file as bytes, a binary buffer or a PIL image (not loaded yet)
+def source(input_dir, name, kind):
+    path = input_dir / name
+    if kind == "bytes":
+        return path.read_bytes()
+    if kind == "buffer":
+        return BytesIO(path.read_bytes())
+    return Image.open(path)
+
+def same_pixels(image, path):
+    with Image.open(path) as written:
+        return image.size == written.size and ImageChops.difference(image.convert("RGB"), written.convert("RGB")).getbbox() is None
+
+transforms = {
+    "resize": lambda image, font: api.resize(image, (100, 75)),
+    "resize_percentage": lambda image, font: api.resize(image, percentage=25),
+    "thumbnail": lambda image, font: api.thumbnail(image, 64),
+    "thumbnail_pyramid": lambda image, font: api.thumbnail_pyramid(image, [128, 32]),
+    "apply_filters": lambda image, font: api.apply_filters(image, "SEPIA,SHARPEN"),
+    "add_text": lambda image, font: api.add_text(image, "hello", "white", "Center", font),
+    "convert": lambda image, font: api.convert(image, "WEBP"),
+    "reduce": lambda image, font: api.reduce(image, 8, resize=True),
+    "transform": lambda image, font: api.transform(image, steps),
+}
+
+@pytest.mark.parametrize("name", ["photo.jpg", "photo.png"])
+@pytest.mark.parametrize("operation", transforms)
+def test_a_pil_image_given_to_the_api_is_unchanged(input_dir, font, name, operation):
+    image = Image.open(input_dir / name)  # Not loaded: a draft() on it would change its size
+    transforms[operation](image, font)
+    with Image.open(input_dir / name) as reference:
+        assert image.size == reference.size
+        assert image.tobytes() == reference.tobytes()
+
+kinds = ["bytes", "buffer", "image"]
+
+# The API and the workers of the commands give the same outputs on the same input
+
+@pytest.mark.parametrize("kind", kinds)
+def test_resize_matches_the_resize_command(input_dir, output_dir, kind):
+    output = resize_image(input_dir, output_dir, "percent", 50, Image.Resampling.LANCZOS, None, "photo.png")
+    assert same_pixels(api.resize(source(input_dir, "photo.png", kind), percentage=50), output)
+    output = resize_image(input_dir, output_dir, "fixed", (120, 80), Image.Resampling.BICUBIC, None, "photo.png")
+    assert same_pixels(api.resize(source(input_dir, "photo.png", kind), (120, 80), resample=Image.Resampling.BICUBIC), output)
+
+@pytest.mark.parametrize("kind", kinds)
+def test_thumbnails_match_the_thumbnails_command(input_dir, output_dir, kind):
+    assert same_pixels(api.thumbnail(source(input_dir, "photo.png", kind), 64), thumbnail_image(input_dir, output_dir, "no", 64, "photo.png"))
+    levels = api.thumbnail_pyramid(source(input_dir, "photo.png", kind), [128, 32, 1000])
+    outputs = pyramid_image(input_dir, output_dir, "no", [1000, 128, 32], "photo.png")
+    assert list(levels) == [128, 32]
+    assert all(same_pixels(levels[size], output) for size, output in zip(levels, outputs))
+
+@pytest.mark.parametrize("kind", kinds)
+def test_filters_match_the_filter_command(input_dir, output_dir, kind):
+    output = filter_image(input_dir, output_dir, ["SEPIA", "SHARPEN"], None, "pillow", False, "photo.png")
+    assert same_pixels(api.apply_filters(source(input_dir, "photo.png", kind), "SEPIA,SHARPEN"), output)
+
+@pytest.mark.parametrize("kind", kinds)
+def test_add_text_matches_the_add_text_command(input_dir, output_dir, font, kind):
+    output = add_text_to_single_image(input_dir, output_dir, "hello", "Center", font, 5.0, "white", "photo.png")
+    assert same_pixels(api.add_text(source(input_dir, "photo.png", kind), "hello", "white", "Center", font, 5.0), output)
+
+@pytest.mark.parametrize("kind", kinds)
+def test_convert_matches_the_convert_command(input_dir, output_dir, kind):
+    output = convert_image(input_dir, output_dir, "WEBP", False, "", None, encoder_params("WEBP", 80, None), (1, "photo.png"))
+    assert api.convert(source(input_dir, "photo.png", kind), "WEBP", quality=80) == Path(output).read_bytes()
+
+@pytest.mark.parametrize("kind", kinds)
+@pytest.mark.parametrize("name", ["photo.jpg", "photo.png"])
+def test_reduce_matches_the_reduce_command(input_dir, output_dir, kind, name):
+    output = compress_image(input_dir, output_dir, True, False, 8, None, None, None, name)
+    assert api.reduce(source(input_dir, name, kind), 8, resize=True) == Path(output).read_bytes()
+
+@pytest.mark.parametrize("kind", kinds)
+def test_transform_matches_the_pipeline_command(input_dir, output_dir, kind):
+    output = pipeline_image(input_dir, output_dir, build_steps(steps), "photo.png")
+    assert api.transform(source(input_dir, "photo.png", kind), steps) == (Path(output).read_bytes(), "webp")
+
+@pytest.mark.parametrize("kind", ["bytes", "buffer"])
+def test_jpeg_transform_matches_the_pipeline_command(input_dir, output_dir, kind):
+    # Opened by the API itself, the JPEG is decoded at a reduced scale as the command does
+    output = pipeline_image(input_dir, output_dir, build_steps(steps), "photo.jpg")
+    assert api.transform(source(input_dir, "photo.jpg", kind), steps) == (Path(output).read_bytes(), "webp")
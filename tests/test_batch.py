@@ -0,0 +1,59 @@
+from io import StringIO
+import json
+import pytest
+from PIL import Image
+from imagetoolkit.batch import read_manifest, step_specs, prepare_job, run_manifest
+
+@pytest.fixture
+def photo(tmp_path):
+    Image.effect_noise((80, 60), 40).convert("RGB").save(tmp_path / "a.jpg")
+    return tmp_path / "a.jpg"
+
+def write_manifest(path, lines):
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return path
+
+def test_jsonl_manifest_skips_comments_and_reports_bad_lines(tmp_path):
+    manifest = write_manifest(tmp_path / "jobs.jsonl", [
+        "# a comment", "", '{"input": "a.jpg", "output": "out/"}', "{not json", "[1, 2]"])
+    entries = list(read_manifest(manifest))
+    assert entries[0] == (3, {"input": "a.jpg", "output": "out/"})
+    assert [number for number, _ in entries] == [3, 4, 5]
+    assert all(isinstance(entry, ValueError) for _, entry in entries[1:])
+
+def test_csv_manifest_counts_the_header_line(tmp_path):
+    manifest = write_manifest(tmp_path / "jobs.csv", ["id,input,output,steps", ' x1 , a.jpg ,out/a.png,"resize:mode=scale,percentage=50;filter:filter=SEPIA"'])
+    assert list(read_manifest(manifest)) == [(2, {"id": "x1", "input": "a.jpg", "output": "out/a.png", "steps": "resize:mode=scale,percentage=50;filter:filter=SEPIA"})]
+
+def test_step_specs():
+    assert step_specs("resize:mode=scale,percentage=50; ;filter:filter=SEPIA") == ["resize:mode=scale,percentage=50", "filter:filter=SEPIA"]
+    assert step_specs([{"op": "resize", "mode": "fixed", "dimensions": [40, 30]}, {"op": "filter", "filter": ["SEPIA", "SHARPEN"]}]) == [
+        ("resize", {"mode": "fixed", "dimensions": "40x30"}), ("filter", {"filter": "SEPIA+SHARPEN"})]
+    with pytest.raises(ValueError):
+        step_specs([{"mode": "fixed"}])
+
+def test_output_extension_adds_a_convert_step(tmp_path, photo):
+    job = prepare_job(1, {"input": "a.jpg", "output": "out/a.webp", "steps": ["resize:mode=scale,percentage=50"]}, tmp_path)
+    assert [name for name, _ in job["steps"]] == ["resize", "convert"]
+    assert job["steps"][-1][1]["format"] == "WEBP"
+
+@pytest.mark.parametrize("output", ["out/z.xyz", "out/z"])
+def test_unknown_output_extension_is_invalid(tmp_path, photo, output):
+    with pytest.raises(ValueError, match="Unknown output extension"):
+        prepare_job(1, {"input": "a.jpg", "output": output, "steps": ["resize:mode=scale,percentage=50"]}, tmp_path)
+
+def test_run_manifest_logs_every_job(tmp_path, photo):
+    manifest = write_manifest(tmp_path / "jobs.jsonl", [
+        json.dumps({"id": "png", "input": "a.jpg", "output": "out/a.png", "steps": ["resize:mode=scale,percentage=50"]}),
+        json.dumps({"id": "dir", "input": "a.jpg", "output": "out/", "steps": [{"op": "filter", "filter": "SEPIA"}]}),
+        json.dumps({"id": "missing", "input": "nope.jpg", "output": "out/", "steps": ["filter:filter=SEPIA"]}),
+        json.dumps({"id": "xyz", "input": "a.jpg", "output": "out/z.xyz", "steps": ["filter:filter=SEPIA"]}),
+    ])
+    log = StringIO()
+    stats = run_manifest(manifest, log, jobs=2)
+    records = {record["id"]: record for record in map(json.loads, log.getvalue().splitlines())}
+    assert {name: record["status"] for name, record in records.items()} == {"png": "ok", "dir": "ok", "missing": "error", "xyz": "invalid"}
+    assert (stats["ok"], stats["failed"], stats["invalid"]) == (2, 1, 1)
+    assert Image.open(tmp_path / "out" / "a.png").size == (40, 30)
+    assert records["dir"]["output"] == str(tmp_path / "out" / "a.jpg")
+    assert not (tmp_path / "out" / "z.xyz").exists()
@@ -0,0 +1,32 @@
+import os
+import pytest
+from benchmarks import corpus
+from benchmarks.run import compare
+
+@pytest.fixture(autouse=True)
+def tiny_corpus(monkeypatch):
+    monkeypatch.setattr(corpus, "quick_sets", {
+        "photos": ("photo", 2, (120, 90), "jpg"),
+        "graphics": ("graphic", 1, (120, 90), "png"),
+        "alpha": ("alpha", 1, (90, 90), "png"),
+    })
+
+def test_the_corpus_is_the_same_on_every_machine(tmp_path):
+    first = corpus.generate_corpus(tmp_path / "a", quick=True)
+    second = corpus.generate_corpus(tmp_path / "b", quick=True)
+    assert first == second
+    assert first["files"]["photos"] == ["photos/photos_0.jpg", "photos/photos_1.jpg"]
+    assert (tmp_path / "a" / "photos" / "photos_1.jpg").read_bytes() != (tmp_path / "a" / "photos" / "photos_0.jpg").read_bytes()
+
+def test_an_existing_corpus_is_reused(tmp_path):
+    index = corpus.generate_corpus(tmp_path, quick=True)
+    mtime = os.stat(tmp_path / "graphics" / "graphics_0.png").st_mtime_ns
+    assert corpus.generate_corpus(tmp_path, quick=True) == index
+    assert os.stat(tmp_path / "graphics" / "graphics_0.png").st_mtime_ns == mtime
+
+def test_compare_flags_medians_over_the_threshold():
+    results = {"benchmarks": {"fast": {"seconds_median": 1.1}, "slow": {"seconds_median": 1.3}, "new": {"seconds_median": 2.0}}}
+    baseline = {"benchmarks": {"fast": {"seconds_median": 1.0}, "slow": {"seconds_median": 1.0}}}
+    assert [name for name, _ in compare(results, baseline, 0.15)] == ["slow"]
+    assert results["benchmarks"]["fast"]["change"] == pytest.approx(0.1)
+    assert "change" not in results["benchmarks"]["new"]
@@ -0,0 +1,43 @@
+import pytest
+from PIL import Image, ImageChops
+from imagetoolkit.color import apply_filters
+
+kernel_chains = [["SHARPEN", "SMOOTH"], ["EDGE_ENHANCE", "DETAIL"], ["SHARPEN", "SHARPEN"], ["SMOOTH", "DETAIL", "SHARPEN", "EDGE_ENHANCE"]]
+
+@pytest.fixture
+def noise():
+    return Image.effect_noise((64, 64), 80).convert("RGB")
+
+@pytest.fixture
+def gradient():
+    # Smooth and far from 0 and 255, so no kernel pass gets clipped
+    ramp = Image.linear_gradient("L").resize((64, 64)).point(lambda v: 60 + v // 2)
+    return Image.merge("RGB", [ramp, ramp.transpose(Image.Transpose.ROTATE_90), Image.new("L", (64, 64), 128)])
+
+def one_by_one(image, names):
+    for name in names:
+        image = apply_filters(image, [name])
+    return image
+
+def max_difference(first, second, border=0):
+    difference = ImageChops.difference(first, second)
+    if border:
+        difference = difference.crop((border, border, difference.width - border, difference.height - border))
+    return max(high for _, high in difference.getextrema())
+
+@pytest.mark.parametrize("names", kernel_chains)
+def test_kernel_chains_match_the_filters_one_by_one(noise, names):
+    assert max_difference(apply_filters(noise, names), one_by_one(noise, names)) == 0
+
+@pytest.mark.parametrize("names", [["INVERT", "POSTERIZE", "SOLARIZE"], ["BRIGHTNESS_INC", "CONTRAST_INC", "BRIGHTNESS_DEC"]])
+def test_lookup_table_chains_match_within_one_level(noise, names):
+    assert max_difference(apply_filters(noise, names), one_by_one(noise, names)) <= 1
+
+@pytest.mark.parametrize("names", kernel_chains)
+def test_fused_kernels_match_within_one_level_without_clipping(gradient, names):
+    assert max_difference(apply_filters(gradient, names, fuse=True), one_by_one(gradient, names), border=2) <= 1
+
+def test_fused_kernels_differ_a_lot_on_noise(noise):
+    # The real bound: without the clipping between passes a fused chain can be off by most of the 0-255 range
+    assert max_difference(apply_filters(noise, ["EDGE_ENHANCE", "DETAIL"], fuse=True),
+                          one_by_one(noise, ["EDGE_ENHANCE", "DETAIL"]), border=2) > 100
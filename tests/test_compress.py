@@ -0,0 +1,70 @@
+from io import BytesIO
+from PIL import Image
+from imagetoolkit import api
+from imagetoolkit import compress as compress_module
+from imagetoolkit.compress import compress, compress_image, encode_image, encode_to_size, search_png, search_quality
+from imagetoolkit.fileio import write_bytes
+
+def noisy_palette_png(size=600):
+    image = Image.effect_noise((size, size), 80).convert("RGB").quantize(256)
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def test_search_png_palette_input():
+    image = Image.open(BytesIO(noisy_palette_png()))
+    assert image.mode == "P"
+    source, data, colors, attempts = search_png(image, 64 * 1024, 2)
+    assert source.mode in ("RGB", "RGBA")
+    assert data and attempts > 1
+
+def test_reduce_palette_png(tmp_path):
+    input_dir, output_dir = tmp_path / "in", tmp_path / "out"
+    input_dir.mkdir()
+    (input_dir / "p.png").write_bytes(noisy_palette_png())
+
+    results = compress(input_dir, output_dir, ["p.png"], True, True, "256KB", predict=False)
+    assert results == [str(output_dir / "p.png")]
+    assert (output_dir / "p.png").stat().st_size <= 256 * 1024
+    assert Image.open(output_dir / "p.png").format == "PNG"
+
+def test_api_reduce_palette_png():
+    data = api.reduce(noisy_palette_png(), 64, resize=True)
+    assert len(data) <= 64 * 1024
+
+def noisy_jpeg(size=(400, 300)):
+    buffer = BytesIO()
+    Image.effect_noise(size, 60).convert("RGB").save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+def test_search_quality_keeps_the_highest_quality_that_fits():
+    image = Image.open(BytesIO(noisy_jpeg()))
+    max_bytes = len(encode_image(image, "jpeg", 50))
+    data, quality, attempts = search_quality(image, "jpeg", max_bytes, 5)
+    assert len(data) <= max_bytes < len(encode_image(image, "jpeg", quality + 1))
+    assert data == encode_image(image, "jpeg", quality)
+    assert attempts <= 7  # Bisection over 5..95
+
+def test_search_scale_when_no_quality_fits():
+    image = Image.open(BytesIO(noisy_jpeg()))
+    data, attempts = encode_to_size(image, "jpeg", 4, True, True)
+    assert len(data) <= 4 * 1024
+    assert Image.open(BytesIO(data)).width < image.width
+
+# The winning bytes of the in-memory search are written once, nothing is re-encoded for the file
+def test_compress_writes_the_output_once(tmp_path, monkeypatch):
+    input_dir, output_dir = tmp_path / "in", tmp_path / "out"
+    input_dir.mkdir()
+    (input_dir / "a.jpg").write_bytes(noisy_jpeg())
+    writes = []
+    monkeypatch.setattr(compress_module, "write_bytes", lambda path, data: writes.append((path, data)) or write_bytes(path, data))
+
+    output = compress_image(input_dir, output_dir, False, True, 40, None, None, None, "a.jpg")
+    assert writes == [(output_dir / "a.jpg", (output_dir / "a.jpg").read_bytes())]
+    assert output == str(output_dir / "a.jpg") and len(writes[0][1]) <= 40 * 1024
+    assert Image.open(output).size == (400, 300)
+
+def test_images_under_the_limit_are_not_written(tmp_path):
+    (tmp_path / "a.jpg").write_bytes(noisy_jpeg((40, 30)))
+    assert compress_image(tmp_path, tmp_path / "out", True, False, 100, None, None, None, "a.jpg") is None
+    assert not (tmp_path / "out").exists()
@@ -0,0 +1,52 @@
+from functools import partial
+import os
+import shutil
+import pytest
+from PIL import Image
+from imagetoolkit.dedup import new_plan, dedup_images, fan_out, duplicate_output
+from imagetoolkit.executor import run_batch
+from imagetoolkit.pipeline import build_steps, pipeline_image
+
+@pytest.fixture
+def input_dir(tmp_path):
+    input_dir = tmp_path / "in"
+    (input_dir / "sub").mkdir(parents=True)
+    Image.effect_noise((60, 40), 40).convert("RGB").save(input_dir / "a.png")
+    shutil.copyfile(input_dir / "a.png", input_dir / "sub" / "copy.png")
+    Image.open(input_dir / "a.png").save(input_dir / "same_pixels.bmp")
+    Image.effect_noise((60, 40), 40).convert("RGB").save(input_dir / "other.png")
+    return input_dir
+
+images = ["a.png", os.path.join("sub", "copy.png"), "same_pixels.bmp", "other.png"]
+
+# Function to run a resize batch with dedup, returns the plan and the results of every input
+def dedup_run(input_dir, output_dir, mode, link="hardlink", jobs=1):
+    plan = new_plan(input_dir, mode, link=link)
+    worker = partial(pipeline_image, input_dir, output_dir, build_steps(["resize:mode=scale,percentage=50"]))
+    return plan, fan_out(plan, run_batch(worker, dedup_images(images, plan), jobs))
+
+def test_content_duplicates_get_linked_outputs(input_dir, tmp_path):
+    output_dir = tmp_path / "out"
+    plan, results = dedup_run(input_dir, output_dir, "content", jobs=2)
+    assert [original for _, original in plan["entries"]] == [None, "a.png", None, None]
+    assert results[1] == str(output_dir / "sub" / "copy.png")
+    assert os.path.samefile(results[0], results[1])
+    assert (plan["stats"]["duplicates"], plan["stats"]["linked"], plan["stats"]["groups"]) == (1, 1, 1)
+
+def test_pixel_duplicates_keep_the_processed_format(input_dir, tmp_path):
+    output_dir = tmp_path / "out"
+    plan, results = dedup_run(input_dir, output_dir, "pixels", link="copy")
+    assert [original for _, original in plan["entries"]] == [None, "a.png", "a.png", None]
+    assert results[2] == str(output_dir / "same_pixels.png")  # The output of a.png, under the duplicate's name
+    assert not os.path.samefile(results[0], results[2])
+    assert Image.open(results[2]).size == (30, 20)
+
+def test_duplicates_of_a_failed_image_fail(input_dir, tmp_path):
+    plan = new_plan(input_dir, "content")
+    unique = list(dedup_images(images, plan))
+    assert fan_out(plan, [None] * len(unique)) == [None] * len(images)
+
+def test_duplicate_output_names():
+    assert duplicate_output(os.path.join("out", "dir", "photo_128px.jpeg"), os.path.join("dir", "photo.jpg"), os.path.join("other", "copy.png")) == os.path.join("out", "other", "copy_128px.jpeg")
+    assert duplicate_output(os.path.join("out", "photo.jpg"), "photo.jpg", "copy.jpeg") == os.path.join("out", "copy.jpeg")
+    assert duplicate_output(os.path.join("out", "unrelated.png"), "photo.png", "copy.png") is None
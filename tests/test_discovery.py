@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+import pytest
+from PIL import Image
+from conftest import repo_dir
+from imagetoolkit.discovery import iter_images, matches_any
+
+@pytest.fixture
+def input_dir(tmp_path):
+    input_dir = tmp_path / "in"
+    for name in ("a.png", "b.jpg", "sub/c.png", "sub/deep/d.JPG", "raw/e.png", "sub/raw/f.png"):
+        path = input_dir / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        Image.new("RGB", (40, 30), "red").save(path, format="JPEG" if name.lower().endswith(".jpg") else "PNG")
+    (input_dir / "notes.txt").write_text("not an image")
+    (input_dir / "sub" / "fake.png").mkdir()  # A directory named like an image
+    return input_dir
+
+def test_only_the_top_directory_without_recursive(input_dir):
+    assert sorted(iter_images(input_dir)) == ["a.png", "b.jpg"]
+
+def test_recursive_paths_are_relative(input_dir):
+    assert sorted(iter_images(input_dir, recursive=True)) == ["a.png", "b.jpg", "raw/e.png", "sub/c.png", "sub/deep/d.JPG", "sub/raw/f.png"]
+
+def test_include_and_exclude_patterns(input_dir):
+    assert sorted(iter_images(input_dir, True, include=["*.png"])) == ["a.png", "raw/e.png", "sub/c.png", "sub/raw/f.png"]
+    assert sorted(iter_images(input_dir, True, include=["sub/*"])) == ["sub/c.png", "sub/deep/d.JPG", "sub/raw/f.png"]
+    # An excluded directory name is not entered, wherever it is
+    assert sorted(iter_images(input_dir, True, exclude=["raw", "*.jpg"])) == ["a.png", "sub/c.png", "sub/deep/d.JPG"]
+
+def test_skipped_directories_are_not_entered(input_dir):
+    assert sorted(iter_images(input_dir, True, skip_dirs=[input_dir / "sub"])) == ["a.png", "b.jpg", "raw/e.png"]
+
+def test_matches_any():
+    assert matches_any("sub/deep/d.jpg", ["*.jpg"]) and matches_any("sub/deep/d.jpg", ["sub/*"])
+    assert not matches_any("sub/deep/d.jpg", ["deep"]) and not matches_any("a.png", [])
+
+# Outputs mirror the subdirectories of the input, and an output directory inside the input is not read back
+def test_recursive_command_mirrors_the_input_tree(input_dir):
+    output_dir = input_dir / "out"
+    command = [sys.executable, "-m", "imagetoolkit.imagetoolkit", "resize", "--input", str(input_dir), "--output", str(output_dir),
+               "--mode", "scale", "--percentage", "50", "--recursive", "--exclude", "raw", "--jobs", "2"]
+    env = dict(os.environ, PYTHONPATH=os.path.join(repo_dir, "src"))
+    subprocess.run(command, cwd=repo_dir, env=env, capture_output=True, text=True, check=True)
+    written = sorted(os.path.relpath(os.path.join(root, name), output_dir) for root, _, names in os.walk(output_dir) for name in names)
+    assert written == ["a.png", "b.jpg", "sub/c.png", "sub/deep/d.JPG"]
+    assert Image.open(output_dir / "sub" / "deep" / "d.JPG").size == (20, 15)
+
+    subprocess.run(command, cwd=repo_dir, env=env, capture_output=True, text=True, check=True)
+    assert not (output_dir / "out").exists()
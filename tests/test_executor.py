@@ -0,0 +1,54 @@
+import time
+import pytest
+from PIL import Image
+from imagetoolkit.addtext import add_text_to_image
+from imagetoolkit.executor import resolve_jobs, run_batch
+from imagetoolkit.extension import new_format
+
+# Workers are module-level functions, so the pool can pickle them
+def slow_square(number):
+    time.sleep(0.01 * (5 - number % 5))  # The first items finish last
+    return number * number
+
+def fail_on_three(item):
+    if item[0] == 3:
+        raise ValueError("broken image")
+    return item[1]
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_ordered_results_follow_the_items(jobs):
+    assert run_batch(slow_square, range(10), jobs) == [number * number for number in range(10)]
+
+def test_unordered_results_are_all_collected():
+    collected = []
+    results = run_batch(slow_square, range(10), 3, ordered=False, on_result=collected.append)
+    assert sorted(results) == [number * number for number in range(10)]
+    assert collected == results
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_a_failing_item_yields_none_and_the_batch_goes_on(jobs, capsys):
+    items = [(number, f"{number}.png") for number in range(5)]
+    assert run_batch(fail_on_three, items, jobs) == ["0.png", "1.png", "2.png", None, "4.png"]
+    if jobs == 1:
+        assert "Error processing image 3.png: broken image" in capsys.readouterr().out
+
+def test_add_text_failures_are_counted_by_the_batch(tmp_path, font):
+    Image.new("RGB", (60, 40), "black").save(tmp_path / "good.png")
+    (tmp_path / "bad.png").write_bytes(b"not an image")
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    results = add_text_to_image(tmp_path, output_dir, ["bad.png", "good.png"], "hi", "Center", font, 10.0, "white")
+    assert results == [None, str(output_dir / "good.png")]
+
+def test_resolve_jobs():
+    assert resolve_jobs(None) == 1 and resolve_jobs("4") == 4 and resolve_jobs("auto") >= 1
+    with pytest.raises(ValueError):
+        resolve_jobs(0)
+
+def test_convert_failures_name_the_image(tmp_path, capsys):
+    Image.new("RGB", (60, 40), "black").save(tmp_path / "good.png")
+    (tmp_path / "bad.png").write_bytes(b"not an image")
+    results = new_format(tmp_path, tmp_path / "out", ["bad.png", "good.png"], "WEBP", False)
+    assert results == [None, str(tmp_path / "out" / "good.webp")]
+    output = capsys.readouterr().out
+    assert "Error processing image bad.png:" in output and "(1, " not in output
@@ -0,0 +1,70 @@
+from io import BytesIO
+import pytest
+from PIL import Image
+from imagetoolkit.compress import compress_image
+from imagetoolkit.extension import new_format
+from imagetoolkit.formats import available_output_formats, can_save, encoder_params, prepare_for
+
+@pytest.fixture
+def input_dir(tmp_path):
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    photo = Image.effect_noise((200, 150), 40).convert("RGB")
+    photo.save(input_dir / "photo.png")
+    photo.save(input_dir / "photo.jpg", quality=95)
+    faded = photo.convert("RGBA")
+    faded.putalpha(Image.linear_gradient("L").resize((200, 150)))
+    faded.save(input_dir / "faded.png")
+    return input_dir
+
+@pytest.mark.parametrize("format, quality, effort, params", [
+    ("JPEG", None, None, {}),
+    ("jpeg", 80, 6, {"quality": 80}),  # JPEG has no effort
+    ("WEBP", 75, 0, {"quality": 75, "method": 0}),
+    ("webp", None, 6, {"method": 6}),
+    ("AVIF", 60, 0, {"quality": 60, "speed": 10}),
+    ("AVIF", None, 3, {"speed": 5}),
+    ("AVIF", None, 6, {"speed": 0}),
+    ("PNG", 90, 4, {"quality": 90}),
+])
+def test_encoder_params(format, quality, effort, params):
+    assert encoder_params(format, quality, effort) == params
+
+@pytest.mark.parametrize("mode, format, target", [
+    ("RGBA", "WEBP", "RGBA"), ("LA", "avif", "RGBA"), ("RGBA", "JPEG", "RGB"), ("RGBA", "BMP", "RGB"),
+    ("L", "WEBP", "RGB"), ("P", "PNG", "RGB"), ("RGB", "WEBP", "RGB"),
+])
+def test_prepare_for(mode, format, target):
+    assert prepare_for(Image.new(mode, (4, 4)), format).mode == target
+
+def test_palette_transparency_is_kept_for_webp():
+    image = Image.new("P", (4, 4))
+    image.info["transparency"] = 0
+    assert prepare_for(image, "WEBP").mode == "RGBA"
+
+def test_the_usual_formats_can_be_saved():
+    assert {"JPEG", "PNG", "BMP", "WEBP"} <= set(available_output_formats())
+    assert can_save("webp") and not can_save("XYZ")
+
+def test_convert_keeps_the_alpha_channel_in_webp(input_dir, tmp_path):
+    assert new_format(input_dir, tmp_path / "out", ["faded.png"], "WEBP", False, quality=90) == [str(tmp_path / "out" / "faded.webp")]
+    with Image.open(tmp_path / "out" / "faded.webp") as image:
+        assert image.mode == "RGBA" and image.getextrema()[3][0] < 10
+
+def test_convert_passes_the_effort_to_the_encoder(input_dir, tmp_path):
+    fast = new_format(input_dir, tmp_path / "fast", ["photo.png"], "WEBP", False, quality=80, effort=0)[0]
+    small = new_format(input_dir, tmp_path / "small", ["photo.png"], "WEBP", False, quality=80, effort=6)[0]
+    assert Image.open(fast).size == Image.open(small).size == (200, 150)
+    assert (tmp_path / "fast" / "photo.webp").read_bytes() != (tmp_path / "small" / "photo.webp").read_bytes()
+
+def test_reduce_can_write_another_format(input_dir, tmp_path):
+    output = compress_image(input_dir, tmp_path / "out", True, True, 10, None, "WEBP", 4, "photo.jpg")
+    assert output == str(tmp_path / "out" / "photo.webp")
+    data = (tmp_path / "out" / "photo.webp").read_bytes()
+    assert len(data) <= 10 * 1024 and Image.open(BytesIO(data)).format == "WEBP"
+
+@pytest.mark.skipif(not can_save("AVIF"), reason="Pillow is built without AVIF support")
+def test_convert_to_avif(input_dir, tmp_path):
+    output = new_format(input_dir, tmp_path / "out", ["faded.png"], "AVIF", False, quality=60, effort=6)[0]
+    with Image.open(output) as image:
+        assert image.format == "AVIF" and image.mode == "RGBA"
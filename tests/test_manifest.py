@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+import pytest
+from PIL import Image
+from conftest import repo_dir
+from imagetoolkit.manifest import load_manifest, save_manifest, pending_images, record_results
+
+operation = {"mode": "scale", "percentage": 50}
+
+@pytest.fixture
+def dirs(tmp_path):
+    input_dir, output_dir = tmp_path / "in", tmp_path / "out"
+    input_dir.mkdir()
+    output_dir.mkdir()
+    for name in ("a.png", "b.png"):
+        Image.effect_noise((40, 30), 40).convert("RGB").save(input_dir / name)
+    return input_dir, output_dir
+
+# Function to run an incremental pass: returns the images it would process, and records them as done
+def incremental_run(input_dir, output_dir, operation=operation, with_hash=False, failed=()):
+    manifest = load_manifest(output_dir)
+    plan = {"skipped": 0, "processed": []}
+    images = list(pending_images(manifest, input_dir, ["a.png", "b.png"], operation, with_hash, plan))
+    results = []
+    for image in images:
+        output = output_dir / image
+        if image in failed:
+            results.append(None)
+            continue
+        output.write_bytes(b"output")
+        results.append(str(output))
+    record_results(manifest, plan, results, operation)
+    save_manifest(output_dir, manifest)
+    return images
+
+def touch(path):
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 10 ** 9))
+
+def test_second_run_skips_everything(dirs):
+    assert incremental_run(*dirs) == ["a.png", "b.png"]
+    assert incremental_run(*dirs) == []
+
+def test_changed_operation_reprocesses(dirs):
+    incremental_run(*dirs)
+    assert incremental_run(*dirs, operation={"mode": "scale", "percentage": 25}) == ["a.png", "b.png"]
+
+def test_changed_or_missing_files_are_reprocessed(dirs):
+    input_dir, output_dir = dirs
+    incremental_run(*dirs)
+    Image.new("RGB", (10, 10)).save(input_dir / "a.png")
+    (output_dir / "b.png").unlink()
+    assert incremental_run(*dirs) == ["a.png", "b.png"]
+
+def test_touched_files_are_skipped_with_hash(dirs):
+    input_dir, _ = dirs
+    incremental_run(*dirs, with_hash=True)
+    touch(input_dir / "a.png")
+    assert incremental_run(*dirs, with_hash=True) == []
+    touch(input_dir / "a.png")
+    assert incremental_run(*dirs) == ["a.png"]  # Without --hash a new mtime is a change
+
+def test_failed_images_are_not_recorded(dirs):
+    assert incremental_run(*dirs, failed=["b.png"]) == ["a.png", "b.png"]
+    assert incremental_run(*dirs) == ["b.png"]
+
+# Function to run an incremental resize through the CLI, returns its output
+def run_incremental_resize(input_dir, output_dir, *options):
+    command = [sys.executable, "-m", "imagetoolkit.imagetoolkit", "resize", "--input", str(input_dir), "--output", str(output_dir),
+               "--mode", "scale", "--incremental", *options]
+    env = dict(os.environ, PYTHONPATH=os.path.join(repo_dir, "src"))
+    return subprocess.run(command, cwd=repo_dir, env=env, capture_output=True, text=True, check=True).stdout
+
+def test_execution_options_keep_the_manifest_valid(dirs):
+    assert "0 images skipped (up to date), 2 processed" in run_incremental_resize(*dirs, "--percentage", "50")
+    for options in (["--jobs", "2"], ["--prefetch", "0", "--write-queue", "0"], ["--memory-limit", "1MB", "--fsync"]):
+        assert "2 images skipped (up to date), 0 processed" in run_incremental_resize(*dirs, "--percentage", "50", *options)
+    assert "0 images skipped (up to date), 2 processed" in run_incremental_resize(*dirs, "--percentage", "25", "--jobs", "2")
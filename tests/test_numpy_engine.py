@@ -0,0 +1,50 @@
+import pytest
+from PIL import Image
+from imagetoolkit import numpy_engine
+from imagetoolkit.color import apply_filters, apply_filter_to_images
+
+pytest.importorskip("numpy")  # The engine is optional
+
+@pytest.fixture(params=["RGB", "L"])
+def noise(request):
+    return Image.effect_noise((64, 48), 80).convert(request.param)
+
+# Function to tell if the two engines give the same image, pixel for pixel
+def same_image(image, reference):
+    return image.mode == reference.mode and image.size == reference.size and image.tobytes() == reference.tobytes()
+
+@pytest.mark.parametrize("name", numpy_engine.vector_filters)
+def test_every_filter_matches_the_pillow_engine(noise, name):
+    assert same_image(apply_filters(noise, [name], engine="numpy"), apply_filters(noise, [name]))
+
+@pytest.mark.parametrize("names", [["GRAYSCALE", "SEPIA"], ["INVERT", "POSTERIZE", "SOLARIZE"], ["SATURATION_INC", "INVERT", "SATURATION_DEC"], ["SEPIA", "SATURATION_INC", "GRAYSCALE"]])
+def test_filter_chains_match_the_pillow_engine(noise, names):
+    assert same_image(apply_filters(noise, names, engine="numpy"), apply_filters(noise, names))
+
+def test_a_stack_is_filtered_as_each_image_alone():
+    images = [Image.effect_noise((32, 24), sigma).convert("RGB") for sigma in (20, 60, 100)]
+    stacked = numpy_engine.filter_images(images, ["SEPIA", "SOLARIZE"])
+    assert all(same_image(image, apply_filters(source, ["SEPIA", "SOLARIZE"])) for image, source in zip(stacked, images))
+
+def test_other_filters_and_modes_are_left_to_pillow():
+    assert numpy_engine.can_run(["SEPIA"], "RGB") and not numpy_engine.can_run(["SEPIA", "BLUR"], "RGB")
+    assert not numpy_engine.can_run(["SEPIA"], "RGBA")
+    image = Image.effect_noise((32, 24), 60).convert("RGBA")
+    assert same_image(apply_filters(image, ["INVERT"], engine="numpy"), apply_filters(image, ["INVERT"]))
+
+# Batches of stacked images write the same files as the Pillow engine, whatever their sizes and modes
+def test_grouped_batch_matches_the_pillow_engine(tmp_path):
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    images = {"a.png": ((40, 30), "RGB"), "b.png": ((40, 30), "RGB"), "c.png": ((40, 30), "L"), "d.png": ((20, 10), "RGBA"), "e.png": ((40, 30), "RGB")}
+    for name, (size, mode) in images.items():
+        Image.effect_noise(size, 60).convert(mode).save(input_dir / name)
+    (input_dir / "f.png").write_bytes(b"not an image")
+
+    names = list(images) + ["f.png"]
+    numpy_results = apply_filter_to_images(input_dir, tmp_path / "numpy", names, "SEPIA,POSTERIZE", engine="numpy", batch_size=4)
+    pillow_results = apply_filter_to_images(input_dir, tmp_path / "pillow", names, "SEPIA,POSTERIZE")
+    assert numpy_results == [str(tmp_path / "numpy" / name) for name in images] + [None]
+    assert pillow_results[-1] is None
+    for name in images:
+        assert same_image(Image.open(tmp_path / "numpy" / name), Image.open(tmp_path / "pillow" / name))
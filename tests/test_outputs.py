@@ -0,0 +1,72 @@
+import os
+import pytest
+from PIL import Image
+from imagetoolkit import outputs
+from imagetoolkit.fileio import save_image
+from imagetoolkit.outputs import write_file, sync_dirs
+from imagetoolkit.tiled import run_strips
+
+@pytest.fixture(autouse=True)
+def no_fsync():
+    yield
+    outputs.enable(fsync=False)
+    outputs.unsynced_dirs.clear()
+
+# Function to list the files of a directory, temporary ones included
+def files_in(directory):
+    return sorted(os.listdir(directory))
+
+def test_write_file_creates_the_directory_and_leaves_no_temporary_file(tmp_path):
+    write_file(tmp_path / "sub" / "a.png", b"first")
+    write_file(tmp_path / "sub" / "a.png", b"second")
+    assert (tmp_path / "sub" / "a.png").read_bytes() == b"second"
+    assert files_in(tmp_path / "sub") == ["a.png"]
+
+def test_hard_linked_copies_are_not_rewritten(tmp_path):
+    write_file(tmp_path / "a.png", b"shared")
+    os.link(tmp_path / "a.png", tmp_path / "b.png")
+    write_file(tmp_path / "a.png", b"new")
+    assert (tmp_path / "b.png").read_bytes() == b"shared"
+
+def test_a_failed_write_keeps_the_previous_file(tmp_path):
+    write_file(tmp_path / "a.png", b"previous")
+    with pytest.raises(TypeError):
+        write_file(tmp_path / "a.png", "not bytes")
+    assert (tmp_path / "a.png").read_bytes() == b"previous"
+    assert files_in(tmp_path) == ["a.png"]
+
+def test_a_failed_rename_leaves_no_temporary_file(tmp_path, monkeypatch):
+    def fail_replace(source, target):
+        raise OSError("disk full")
+    monkeypatch.setattr(os, "replace", fail_replace)
+    with pytest.raises(OSError):
+        write_file(tmp_path / "a.png", b"data")
+    assert files_in(tmp_path) == []
+
+def test_an_interrupted_strip_write_keeps_the_previous_file(tmp_path):
+    save_image(Image.new("RGB", (40, 30), "red"), tmp_path / "a.png")
+    previous = (tmp_path / "a.png").read_bytes()
+
+    def produce(y0, y1):
+        if y0 >= 10:
+            raise KeyboardInterrupt
+        return Image.new("RGB", (40, y1 - y0), "blue")
+    with pytest.raises(KeyboardInterrupt):
+        run_strips(tmp_path / "a.png", "PNG", (40, 30), 5, produce)
+    assert (tmp_path / "a.png").read_bytes() == previous
+    assert files_in(tmp_path) == ["a.png"]
+
+def test_fsync_flushes_each_file_and_each_directory_once(tmp_path, monkeypatch):
+    synced = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: synced.append(fd) or real_fsync(fd))
+    outputs.enable(fsync=True)
+
+    for name in ("a.png", "b.png", "sub/c.png", "sub/d.png"):
+        write_file(tmp_path / name, b"data")
+    assert len(synced) == 4  # One per file, before its rename
+    assert outputs.unsynced_dirs == {str(tmp_path), str(tmp_path / "sub")}
+
+    # Paths written by pool workers are added, a directory that can't be opened is skipped
+    sync_dirs([str(tmp_path / "sub" / "e.png"), [str(tmp_path / "gone" / "f.png"), None]])
+    assert len(synced) == 6 and outputs.unsynced_dirs == set()
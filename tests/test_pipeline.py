@@ -0,0 +1,66 @@
+from io import BytesIO
+import pytest
+from PIL import Image
+from imagetoolkit.color import apply_filters
+from imagetoolkit.pipeline import parse_step, build_steps, pipeline_image
+
+@pytest.fixture
+def input_dir(tmp_path):
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    Image.effect_noise((120, 80), 40).convert("RGB").save(input_dir / "a.png")
+    return input_dir
+
+def test_parse_step_converts_the_parameters():
+    assert parse_step("resize:mode=fixed,dimensions=800x600") == ("resize", {"mode": "fixed", "dimensions": (800, 600)})
+    assert parse_step(" Resize : mode=scale , percentage=50") == ("resize", {"mode": "scale", "percentage": 50})
+    assert parse_step("convert:format=webp,quality=80,effort=4") == ("convert", {"format": "WEBP", "quality": 80, "effort": 4})
+    assert parse_step("reduce:max-size=512kb,resize=yes") == ("reduce", {"max_size": "512KB", "resize": True})
+    assert parse_step("filter:filter=sepia+SHARPEN,fuse=yes") == ("filter", {"filter_choice": ["SEPIA", "SHARPEN"], "fuse": True})
+
+@pytest.mark.parametrize("spec, message", [
+    ("blur", "Unknown pipeline step"),
+    ("resize:mode", "use key=value"),
+    ("resize:mode=stretch", "mode=fixed or mode=scale"),
+    ("filter:filter=NOPE", "Unknown filter"),
+    ("add-text:text=hi", "needs text, color and position"),
+    ("convert:format=TIFF", "needs format="),
+    ("convert:format=WEBP,effort=9", "effort between 0 and"),
+    ("reduce:max-size=2MB", "max-size in KB"),
+])
+def test_invalid_steps_are_rejected(spec, message):
+    with pytest.raises(ValueError, match=message):
+        parse_step(spec)
+
+def test_consecutive_filters_are_merged():
+    steps = build_steps(["filter:filter=SEPIA", "filter:filter=SHARPEN+BLUR", "resize:mode=scale,percentage=50", "filter:filter=SEPIA"])
+    assert steps == [("filter", {"filter_choice": ["SEPIA", "SHARPEN", "BLUR"]}), ("resize", {"mode": "scale", "percentage": 50}), ("filter", {"filter_choice": ["SEPIA"]})]
+
+def test_filters_that_disagree_on_fusing_are_not_merged():
+    steps = build_steps(["filter:filter=SEPIA,fuse=yes", "filter:filter=SHARPEN", "filter:filter=BLUR,fuse=no"])
+    assert steps == [("filter", {"filter_choice": ["SEPIA"], "fuse": True}), ("filter", {"filter_choice": ["SHARPEN", "BLUR"]})]
+
+def test_reduce_must_be_the_last_step():
+    with pytest.raises(ValueError, match="must be the last step"):
+        build_steps(["reduce:max-size=64KB", "filter:filter=SEPIA"])
+    with pytest.raises(ValueError, match="at least one step"):
+        build_steps([])
+
+def test_merging_leaves_the_given_steps_alone():
+    given = [("filter", {"filter_choice": ["SEPIA"]}), ("filter", {"filter_choice": ["BLUR"]})]
+    build_steps(given)
+    assert given[0][1] == {"filter_choice": ["SEPIA"]}
+
+def test_pipeline_image_runs_every_step_and_encodes_once(input_dir, tmp_path):
+    steps = build_steps(["resize:mode=fixed,dimensions=60x40", "filter:filter=SEPIA", "convert:format=PNG"])
+    output = pipeline_image(input_dir, tmp_path / "out", steps, "a.png")
+    assert output == str(tmp_path / "out" / "a.png")
+
+    expected = apply_filters(Image.open(input_dir / "a.png").resize((60, 40), Image.Resampling.BICUBIC, reducing_gap=2.0), ["SEPIA"])
+    assert Image.open(output).tobytes() == expected.tobytes()
+
+def test_reduce_step_writes_the_reduced_bytes(input_dir, tmp_path):
+    output = pipeline_image(input_dir, tmp_path / "out", build_steps(["convert:format=JPEG", "reduce:max-size=4KB,resize=yes,quality=yes"]), "a.png")
+    assert output == str(tmp_path / "out" / "a.jpeg")
+    data = (tmp_path / "out" / "a.jpeg").read_bytes()
+    assert len(data) <= 4 * 1024 and Image.open(BytesIO(data)).format == "JPEG"
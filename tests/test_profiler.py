@@ -0,0 +1,73 @@
+import csv
+import json
+import time
+from functools import partial
+import pytest
+from PIL import Image
+from imagetoolkit import profiler
+from imagetoolkit.executor import run_batch
+from imagetoolkit.rescale import resize_image
+
+@pytest.fixture(autouse=True)
+def profiling():
+    profiler.enable()
+    yield
+    profiler.settings = None
+    profiler.records.clear()
+
+@pytest.fixture
+def input_dir(tmp_path):
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    for name in ("a.png", "b.png", "c.png"):
+        Image.effect_noise((200, 150), 40).convert("RGB").save(input_dir / name)
+    return input_dir
+
+# Function to spend some time in nested stages: 20 ms of transform around 100 ms of decode
+def nested_stages(item):
+    with profiler.stage("transform"):
+        time.sleep(0.02)
+        with profiler.stage("decode"):
+            time.sleep(0.1)
+    return item
+
+def test_nested_stages_are_counted_once():
+    result, record = profiler.profile_item(nested_stages, "a.png", "nested")
+    assert result == "a.png" and (record["image"], record["operation"]) == ("a.png", "nested")
+    assert record["decode"] >= 0.1 and 0.02 <= record["transform"] < 0.1  # The decode time is not in the transform
+    assert record["total"] >= record["decode"] + record["transform"]
+    assert profiler.stage("decode") is profiler.no_stage  # Outside an image, timers cost nothing
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_every_image_of_a_batch_is_recorded(input_dir, tmp_path, jobs):
+    worker = partial(resize_image, input_dir, tmp_path / "out", "percent", 50, Image.Resampling.LANCZOS, None)
+    run_batch(worker, ["a.png", "b.png", "c.png"], jobs, input_dir=input_dir, output_dir=tmp_path / "out")
+    assert sorted(record["image"] for record in profiler.records) == ["a.png", "b.png", "c.png"]
+    for record in profiler.records:
+        assert record["operation"] == "resize_image"
+        assert all(record[name] > 0 for name in profiler.stages)
+        assert record["total"] >= sum(record[name] for name in profiler.stages)
+
+def test_percentile():
+    assert profiler.percentile([], 90) == 0.0
+    assert profiler.percentile([1.0, 2.0, 3.0, 4.0, 5.0], 50) == 3.0
+    assert profiler.percentile([0.0, 10.0], 90) == pytest.approx(9.0)
+
+# Function to build fake records, the image number n taking n seconds in each stage
+def fake_records(count):
+    return [dict({"image": f"{number}.png", "operation": "resize_image", "total": 4.0 * number}, **dict.fromkeys(profiler.stages, float(number))) for number in range(1, count + 1)]
+
+def test_json_report(tmp_path):
+    profiler.write_report(tmp_path / "report.json", fake_records(5), slowest=2)
+    report = json.loads((tmp_path / "report.json").read_text())
+    assert report["images"] == 5 and len(report["records"]) == 5
+    assert [record["image"] for record in report["slowest"]] == ["5.png", "4.png"]
+    assert report["stages"]["decode"] == {"total": 15.0, "mean": 3.0, "p50": 3.0, "p90": 4.6, "p99": 4.96, "max": 5.0}
+
+def test_csv_report(tmp_path):
+    profiler.write_report(tmp_path / "report.CSV", fake_records(3))
+    with open(tmp_path / "report.CSV", newline="") as file:
+        rows = list(csv.reader(file))
+    assert rows[0] == ["image", "operation", "decode", "transform", "encode", "write", "total"]
+    assert [row[0] for row in rows[1:]] == ["3.png", "2.png", "1.png", "(total)", "(mean)", "(p50)", "(p90)", "(p99)", "(max)"]
+    assert rows[4][2:] == ["6.0", "6.0", "6.0", "6.0", "24.0"]
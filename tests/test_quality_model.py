@@ -0,0 +1,49 @@
+from PIL import Image
+from imagetoolkit import quality_model
+from imagetoolkit.compress import compress
+
+def test_first_run_with_every_image_under_the_limit(tmp_path):
+    input_dir, model_dir = tmp_path / "in", tmp_path / "model"
+    input_dir.mkdir()
+    Image.new("RGB", (50, 50), "red").save(input_dir / "a.jpg")
+
+    assert compress(input_dir, tmp_path / "out", ["a.jpg"], False, False, "256KB", model_dir=str(model_dir)) == [None]
+    assert not model_dir.exists()
+
+def test_merge_deltas_without_model_dir(tmp_path):
+    assert quality_model.merge_deltas(str(tmp_path / "missing"))["images"] == 0
+
+def delta_with(images):
+    delta = quality_model.empty_model()
+    delta["stats"]["images"] = delta["stats"]["encodes"] = images
+    delta["stats"]["histogram"] = {"1": images}
+    return delta
+
+def test_merge_deltas_only_merges_its_run(tmp_path):
+    model_dir = str(tmp_path)
+    quality_model.save_json(tmp_path / f"{quality_model.delta_prefix}111.5.json", delta_with(2))
+    quality_model.save_json(tmp_path / f"{quality_model.delta_prefix}111.6.json", delta_with(3))
+    quality_model.save_json(tmp_path / f"{quality_model.delta_prefix}222.7.json", delta_with(4))  # Another run, still going
+
+    assert quality_model.merge_deltas(model_dir, 111)["images"] == 5
+    assert sorted(path.name for path in tmp_path.glob(f"{quality_model.delta_prefix}*")) == [f"{quality_model.delta_prefix}222.7.json"]
+    assert quality_model.load_json(tmp_path / quality_model.model_name)["stats"]["images"] == 5
+
+    assert quality_model.merge_deltas(model_dir, 222)["images"] == 4
+    assert quality_model.load_json(tmp_path / quality_model.model_name)["stats"]["images"] == 9
+    assert not list(tmp_path.glob("*.tmp"))
+
+def test_compress_saves_one_delta_per_process_and_merges_them(tmp_path):
+    input_dir, model_dir = tmp_path / "in", tmp_path / "model"
+    input_dir.mkdir()
+    images = []
+    for number in range(3):
+        Image.effect_noise((700, 700), 40 + number * 10).convert("RGB").save(input_dir / f"{number}.jpg", quality=98)
+        images.append(f"{number}.jpg")
+
+    for jobs in (1, 2):
+        results = compress(input_dir, tmp_path / f"out{jobs}", images, False, True, "256KB", jobs=jobs, model_dir=str(model_dir))
+        assert all(results)
+
+    assert [path.name for path in model_dir.glob(f"{quality_model.delta_prefix}*")] == []
+    assert quality_model.load_json(model_dir / quality_model.model_name)["stats"]["images"] == 6
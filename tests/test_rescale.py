@@ -0,0 +1,65 @@
+from pathlib import Path
+import pytest
+from PIL import Image, ImageChops, ImageStat
+from imagetoolkit import api
+from imagetoolkit.rescale import downscale, resize_image, thumbnail_pyramid
+
+@pytest.fixture
+def photo(tmp_path):
+    photo = Image.merge("RGB", [Image.linear_gradient("L").resize((1600, 1200)), Image.radial_gradient("L").resize((1600, 1200)), Image.linear_gradient("L").rotate(90).resize((1600, 1200))])
+    photo.save(tmp_path / "photo.jpg", quality=95)
+    return tmp_path / "photo.jpg"
+
+# Function to compare two images of the same size, returns the mean absolute difference per channel
+def mean_difference(image, reference):
+    return max(ImageStat.Stat(ImageChops.difference(image.convert("RGB"), reference.convert("RGB"))).mean)
+
+def pyramid(tmp_path, sizes, source_size=(600, 400)):
+    input_dir, output_dir = tmp_path / "in", tmp_path / "out"
+    input_dir.mkdir()
+    Image.new("RGB", source_size, "blue").save(input_dir / "a.png")
+    return thumbnail_pyramid(input_dir, output_dir, ["a.png"], "yes", sizes)[0], output_dir
+
+def test_favicon_holds_the_sizes_up_to_256(tmp_path):
+    outputs, output_dir = pyramid(tmp_path, [512, 64, 16])
+    assert [Image.open(path).size for path in outputs[:-1]] == [(512, 341), (64, 43), (16, 11)]
+    with Image.open(output_dir / "a.ico") as ico:
+        assert sorted(ico.info["sizes"]) == [(16, 11), (64, 43)]
+
+def test_no_favicon_when_every_size_is_over_256(tmp_path, capsys):
+    outputs, output_dir = pyramid(tmp_path, [512, 300])
+    assert not (output_dir / "a.ico").exists()
+    assert [Path(path).name for path in outputs] == ["a_512px.png", "a_300px.png"]
+    assert "no favicon written" in capsys.readouterr().out
+
+def test_sizes_over_the_source_are_skipped(tmp_path):
+    outputs, output_dir = pyramid(tmp_path, [1024, 32], source_size=(200, 100))
+    assert [Path(path).name for path in outputs] == ["a_32px.png", "a.ico"]
+    assert not (output_dir / "a_1024px.png").exists()
+    assert api.thumbnail_pyramid(Image.new("RGB", (200, 100)), [1024, 32]).keys() == {32}
+
+def test_jpeg_downscale_decodes_at_a_reduced_scale(photo):
+    with Image.open(photo) as reference:
+        expected = reference.resize((200, 150), Image.Resampling.LANCZOS)
+    with Image.open(photo) as image:
+        resized = downscale(image, (200, 150), Image.Resampling.LANCZOS)
+        assert image.size == (400, 300)  # Drafted at 1/4 scale, no smaller than reducing_gap times the target
+    assert resized.size == (200, 150)
+    assert mean_difference(resized, expected) < 1
+
+@pytest.mark.parametrize("size", [(1600, 1200), (2000, 1500), (1000, 1400)])
+def test_no_draft_unless_both_sides_shrink(photo, size):
+    with Image.open(photo) as image:
+        assert downscale(image, size, Image.Resampling.BICUBIC).size == size
+        assert image.size == (1600, 1200)
+
+def test_loaded_images_are_pre_shrunk_close_to_a_plain_resize(photo):
+    image = Image.open(photo).convert("RGB")
+    expected = image.resize((123, 91), Image.Resampling.LANCZOS)
+    assert mean_difference(downscale(image, (123, 91), Image.Resampling.LANCZOS), expected) < 1
+
+def test_resize_command_writes_the_exact_size(photo, tmp_path):
+    output = resize_image(tmp_path, tmp_path / "out", "percent", 10, Image.Resampling.LANCZOS, None, "photo.jpg")
+    assert Image.open(output).size == (160, 120)
+    output = resize_image(tmp_path, tmp_path / "out", "fixed", (333, 250), Image.Resampling.BICUBIC, None, "photo.jpg")
+    assert Image.open(output).size == (333, 250)
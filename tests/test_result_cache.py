@@ -0,0 +1,54 @@
+from functools import partial
+import pytest
+from PIL import Image
+from imagetoolkit import result_cache
+from imagetoolkit.executor import run_batch
+from imagetoolkit.pipeline import build_steps, pipeline_image
+
+@pytest.fixture
+def input_dir(tmp_path):
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    for name in ("a.png", "b.png"):
+        Image.effect_noise((60, 40), 40).convert("RGB").save(input_dir / name)
+    return input_dir
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    yield tmp_path / "cache"
+    result_cache.settings = None
+
+# Function to run a resize batch through the cache, returns its results and the cache stats of the run
+def cached_run(input_dir, output_dir, cache_dir, percentage=50, max_bytes=1024 ** 2, jobs=1):
+    result_cache.enable(cache_dir, max_bytes)
+    worker = partial(pipeline_image, input_dir, output_dir, build_steps([f"resize:mode=scale,percentage={percentage}"]))
+    results = run_batch(worker, ["a.png", "b.png"], jobs, input_dir=input_dir, output_dir=output_dir)
+    return results, result_cache.evict()
+
+def test_same_inputs_and_arguments_are_served_from_the_cache(input_dir, cache_dir, tmp_path):
+    results, stats = cached_run(input_dir, tmp_path / "out1", cache_dir)
+    assert (stats["stored"], stats["reused"]) == (2, 0)
+
+    # Another output directory is no part of the key: the outputs are copied there, by the pool workers too
+    results, stats = cached_run(input_dir, tmp_path / "out2", cache_dir, jobs=2)
+    assert (stats["stored"], stats["reused"]) == (0, 2)
+    assert results == [str(tmp_path / "out2" / "a.png"), str(tmp_path / "out2" / "b.png")]
+    assert (tmp_path / "out2" / "a.png").read_bytes() == (tmp_path / "out1" / "a.png").read_bytes()
+
+def test_other_arguments_or_content_miss(input_dir, cache_dir, tmp_path):
+    cached_run(input_dir, tmp_path / "out", cache_dir)
+    assert cached_run(input_dir, tmp_path / "out", cache_dir, percentage=25)[1]["stored"] == 2
+
+    Image.new("RGB", (60, 40), "red").save(input_dir / "a.png")
+    results, stats = cached_run(input_dir, tmp_path / "out", cache_dir)
+    assert (stats["stored"], stats["reused"]) == (1, 1)
+    assert Image.open(tmp_path / "out" / "a.png").getpixel((0, 0)) == (255, 0, 0)
+
+def test_least_recently_used_entries_are_evicted(input_dir, cache_dir, tmp_path):
+    _, stats = cached_run(input_dir, tmp_path / "out", cache_dir)
+    cap = stats["bytes"]
+
+    # The new entries push the total over the cap: the older ones go
+    _, stats = cached_run(input_dir, tmp_path / "out", cache_dir, percentage=25, max_bytes=cap)
+    assert stats["evicted"] >= 1 and stats["bytes"] <= cap
+    assert cached_run(input_dir, tmp_path / "out", cache_dir, percentage=25, max_bytes=cap)[1]["reused"] == 2
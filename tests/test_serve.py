@@ -0,0 +1,74 @@
+from http.client import HTTPConnection
+from io import BytesIO
+import os
+import signal
+import socket
+import threading
+import pytest
+from PIL import Image
+from imagetoolkit.serve import new_state, create_server
+
+@pytest.fixture(scope="module")
+def server():
+    state = new_state(1, "process")
+    server = create_server("127.0.0.1", 0, state)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    state["pool"].shutdown()
+
+def post(server, path, body):
+    connection = HTTPConnection(*server.server_address, timeout=30)
+    connection.request("POST", path, body, {"Content-Length": str(len(body))})
+    response = connection.getresponse()
+    result = response.status, dict(response.getheaders()), response.read()
+    connection.close()
+    return result
+
+def png_bytes(size=(80, 60)):
+    buffer = BytesIO()
+    Image.effect_noise(size, 40).convert("RGB").save(buffer, "PNG")
+    return buffer.getvalue()
+
+def test_process_workers_ignore_ctrl_c(server):
+    # Ctrl+C reaches the whole process group: only the server should handle it, not each worker with a traceback
+    assert server.state["pool"].submit(signal.getsignal, signal.SIGINT).result() == signal.SIG_IGN
+
+def test_resize_is_cached_by_body_and_steps(server):
+    body = png_bytes()
+    status, headers, data = post(server, "/resize?mode=scale&percentage=50", body)
+    assert (status, headers["X-Cache"], headers["Content-Type"]) == (200, "miss", "image/png")
+    assert Image.open(BytesIO(data)).size == (40, 30)
+
+    assert post(server, "/resize?mode=scale&percentage=50", body)[1]["X-Cache"] == "hit"
+    assert post(server, "/resize?mode=scale&percentage=25", body)[1]["X-Cache"] == "miss"
+
+def test_errors(server):
+    assert post(server, "/sharpen", png_bytes())[0] == 404
+    assert post(server, "/resize?mode=scale&percentage=50", b"not an image")[0] == 415
+
+def test_a_dead_worker_fails_no_request():
+    state = new_state(1, "process")
+    server = create_server("127.0.0.1", 0, state)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        body = png_bytes()
+        assert post(server, "/resize?mode=scale&percentage=50", body)[0] == 200
+        broken = state["pool"]
+        os.kill(broken.submit(os.getpid).result(), signal.SIGKILL)
+        status, headers, _ = post(server, "/resize?mode=scale&percentage=25", body)
+        assert (status, headers["X-Cache"]) == (200, "miss")
+        assert state["pool"] is not broken
+        assert post(server, "/resize?mode=fixed&dimensions=10x10", body)[0] == 200
+    finally:
+        server.shutdown()
+        server.server_close()
+        state["pool"].shutdown()
+
+def test_a_body_that_is_not_an_image_is_refused_on_its_first_bytes(server):
+    # Only the start of the announced 50 MB is sent: the answer can't wait for the rest
+    with socket.create_connection(server.server_address, timeout=10) as connection:
+        connection.sendall(b"POST /resize?mode=scale&percentage=50 HTTP/1.1\r\nHost: test\r\nContent-Length: 50000000\r\n\r\n" + b"x" * 1000)
+        assert connection.recv(1024).startswith(b"HTTP/1.1 415")
@@ -0,0 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import os
+import threading
+from PIL import Image
+from imagetoolkit import outputs, staging
+from imagetoolkit.executor import run_batch
+from imagetoolkit.pipeline import build_steps, pipeline_image
+
+def test_prefetch_stays_under_the_byte_budget(tmp_path):
+    for number in range(6):
+        (tmp_path / f"{number}.bmp").write_bytes(bytes(10 * (number + 1)))
+    images = [f"{number}.bmp" for number in range(6)]
+
+    with ThreadPoolExecutor(max_workers=2) as readers:
+        seen = []
+        for image in staging.prefetch_items(images, str(tmp_path), readers, 4, max_bytes=35):
+            assert sum(len(future.result()) for future in staging.prefetched.values()) <= 35
+            data = staging.take_prefetched(tmp_path / image)
+            assert data is None or len(data) == (int(image[0]) + 1) * 10
+            seen.append(image)
+    assert seen == images
+    assert not staging.prefetched
+
+def test_prefetch_without_budget_reads_every_item_ahead(tmp_path):
+    for number in range(3):
+        (tmp_path / f"{number}.bmp").write_bytes(b"x" * 100)
+    with ThreadPoolExecutor(max_workers=2) as readers:
+        items = staging.prefetch_items(["0.bmp", "1.bmp", "2.bmp"], str(tmp_path), readers, 4)
+        assert next(items) == "0.bmp"
+        assert len(staging.prefetched) == 3
+        assert list(items) == ["1.bmp", "2.bmp"]
+
+def test_a_failed_write_behind_fails_only_its_image(tmp_path, monkeypatch):
+    input_dir, output_dir = tmp_path / "in", tmp_path / "out"
+    input_dir.mkdir()
+    images = [f"{number}.png" for number in range(6)]
+    for image in images:
+        Image.new("RGB", (20, 20), "white").save(input_dir / image)
+
+    def write_file(path, data):
+        if os.path.basename(path) == "1.png":
+            raise RuntimeError("encoder bug")
+        outputs.write_file(path, data)
+
+    monkeypatch.setattr(staging, "write_file", write_file)
+    monkeypatch.setattr(staging, "settings", None)
+    staging.enable(prefetch=0, write_queue=1)
+    worker = partial(pipeline_image, input_dir, output_dir, build_steps(["filter:filter=INVERT"]))
+
+    # Run in a thread: a writer thread that died would block the batch forever on the full queue
+    results = []
+    batch = threading.Thread(target=lambda: results.extend(run_batch(worker, images, input_dir=input_dir, output_dir=output_dir)), daemon=True)
+    batch.start()
+    batch.join(timeout=30)
+    assert not batch.is_alive()
+    assert [result is None for result in results] == [False, True, False, False, False, False]
+    assert sorted(os.listdir(output_dir)) == ["0.png", "2.png", "3.png", "4.png", "5.png"]
@@ -0,0 +1,24 @@
+import json
+from PIL import Image
+from benchmarks.startup import loaded_forbidden_modules, run_python
+
+# Function to run code in a fresh interpreter, returns the modules it loaded
+def modules_after(code):
+    return set(json.loads(run_python(f"{code}\nimport sys, json\nprint(json.dumps(sorted(sys.modules)))")[1].splitlines()[-1]))
+
+def test_the_cli_path_leaves_out_the_interactive_stack_and_the_operations():
+    assert loaded_forbidden_modules() == []
+
+def test_a_command_imports_only_its_own_operation(tmp_path):
+    Image.new("RGB", (40, 30)).save(tmp_path / "a.png")
+    arguments = ["imagetoolkit", "resize", "--input", str(tmp_path), "--output", str(tmp_path / "out"), "--mode", "scale", "--percentage", "50"]
+    modules = modules_after(f"import sys\nsys.argv = {arguments!r}\nfrom imagetoolkit.imagetoolkit import main\nmain()")
+    assert (tmp_path / "out" / "a.png").exists()
+    assert "imagetoolkit.rescale" in modules
+    assert not modules & {"imagetoolkit.compress", "imagetoolkit.color", "imagetoolkit.addtext", "questionary", "prompt_toolkit"}
+    assert "concurrent.futures.process" not in modules  # No process pool for a serial batch
+
+def test_the_prompt_style_is_built_on_first_use():
+    assert "prompt_toolkit" not in modules_after("import imagetoolkit.variables")
+    modules = modules_after("from imagetoolkit.variables import style\nfrom prompt_toolkit.styles import Style\nassert isinstance(style, Style)")
+    assert "prompt_toolkit" in modules
@@ -0,0 +1,40 @@
+from functools import partial
+import pytest
+from PIL import Image, ImageChops
+from imagetoolkit.color import apply_filters, strip_margin
+from imagetoolkit.tiled import tiled_map, tiled_resize
+
+# A strip budget small enough to cut the 300x240 test image in many strips
+memory_limit = 20000
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "source.bmp"
+    Image.effect_noise((300, 240), 60).convert("RGB").save(path)
+    return path
+
+@pytest.mark.parametrize("filters", [["SHARPEN"], ["SEPIA", "SMOOTH"], ["EDGE_ENHANCE", "DETAIL"], ["INVERT", "POSTERIZE"]])
+def test_filter_strips_match_the_whole_image(source, tmp_path, filters):
+    output = tmp_path / "out.png"
+    tiled_map(source, output, "PNG", strip_margin(filters), partial(apply_filters, filter_choices=filters), memory_limit)
+    whole = apply_filters(Image.open(source).convert("RGB"), filters)
+    assert ImageChops.difference(Image.open(output).convert("RGB"), whole).getbbox() is None
+
+@pytest.mark.parametrize("resample", [Image.Resampling.BICUBIC, Image.Resampling.LANCZOS])
+def test_resize_strips_match_the_whole_image_within_one_level(source, tmp_path, resample):
+    output = tmp_path / "out.png"
+    tiled_resize(source, output, "PNG", (130, 97), resample, memory_limit)
+    whole = Image.open(source).resize((130, 97), resample)
+    difference = ImageChops.difference(Image.open(output).convert("RGB"), whole)
+    assert max(high for _, high in difference.getextrema()) <= 1
+
+def test_progressive_output_writes_no_warning(source, tmp_path, capsys):
+    tiled_map(source, tmp_path / "out.bmp", "BMP", 0, lambda strip: strip, memory_limit)
+    assert "can't be written in strips" not in capsys.readouterr().out
+    assert sorted(tmp_path.iterdir()) == sorted([source, tmp_path / "out.bmp"])
+
+def test_whole_output_format_warns(source, tmp_path, capsys):
+    output = tmp_path / "out.jpg"
+    tiled_map(source, output, "JPEG", 0, lambda strip: strip, memory_limit)
+    assert "can't be written in strips" in capsys.readouterr().out
+    assert Image.open(output).size == (300, 240)
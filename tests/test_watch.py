@@ -0,0 +1,43 @@
+import threading
+from PIL import Image
+from imagetoolkit.pipeline import build_steps
+from imagetoolkit.watch import watch
+
+steps = ["resize:mode=scale,percentage=50"]
+
+# Function to run a watch session in a thread until expected images are done, returns its stats and results
+def watch_until(input_dir, output_dir, expected, drop=None, **kwargs):
+    stop, done, results = threading.Event(), threading.Event(), []
+
+    def on_result(image, result, latency):
+        results.append((image, result, latency))
+        if len(results) >= expected:
+            done.set()
+
+    stats = {}
+    session = threading.Thread(target=lambda: stats.update(watch(input_dir, output_dir, build_steps(steps), {"step": steps}, stop=stop, on_result=on_result, settle=0.2, poll_interval=0.1, **kwargs)))
+    session.start()
+    if drop is not None:
+        drop()
+    done.wait(timeout=30)
+    stop.set()
+    session.join(timeout=30)
+    return stats, results
+
+def save_image(path):
+    Image.effect_noise((40, 30), 40).convert("RGB").save(path)
+
+def test_watch_processes_new_and_existing_images_once(tmp_path):
+    input_dir, output_dir = tmp_path / "in", tmp_path / "out"
+    input_dir.mkdir()
+    save_image(input_dir / "before.png")
+
+    stats, results = watch_until(input_dir, output_dir, 3, lambda: [save_image(input_dir / f"new{n}.png") for n in range(2)], jobs=2)
+    assert (stats["processed"], stats["failed"]) == (3, 0)
+    assert all(result is not None and latency >= 0 for _, result, latency in results)
+    assert sorted(path.name for path in output_dir.glob("*.png")) == ["before.png", "new0.png", "new1.png"]
+    assert Image.open(output_dir / "new0.png").size == (20, 15)
+
+    # A new session skips what the manifest says is done
+    stats, results = watch_until(input_dir, output_dir, 1, lambda: save_image(input_dir / "later.png"))
+    assert [image for image, _, _ in results] == ["later.png"]